@@ -0,0 +1,192 @@
+"""Cluster mode benchmark: several node processes share one MongoDB job queue.
+
+Needs a real mongod; nothing else leaves the machine. Every node runs the
+real claim, lease and leader election code from helper.cluster with
+FakeClient transfers, in a scratch database that is dropped afterwards.
+--kill-after SIGKILLs the leader mid-run to exercise lease expiry and
+re-election. The run reports throughput, which node finished how many
+jobs, and any job that completed twice or never.
+
+    python -m benchmarks.bench_cluster --mongo mongodb://localhost:27017 --nodes 3 --jobs 30
+    python -m benchmarks.bench_cluster --nodes 3 --jobs 30 --kill-after 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# Plugins import config at module level; run from the repo root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from .fake_client import FakeClient, FakeMessage, FakeUser, MiB
+
+# Jobs use message ids far above FakeClient's own counter: the file is
+# FIRST_MESSAGE_ID + 2k and the rename command replying to it the id after
+FIRST_MESSAGE_ID = 1_000_000
+
+
+class NodeClient(FakeClient):
+    """FakeClient that makes up the messages of jobs queued by the parent process"""
+
+    def __init__(self, file_size, **kwargs):
+        super().__init__(**kwargs)
+        self.file_size = file_size
+
+    def recreate(self, chat_id, message_id):
+        user = FakeUser(chat_id)
+        if (message_id - FIRST_MESSAGE_ID) % 2 == 0:
+            media = self.new_media(f"Show - {message_id:07d}.mkv", self.file_size)
+            return FakeMessage(self, chat_id, message_id, from_user=user, document=media)
+        file_message = self.messages.get((chat_id, message_id - 1)) or self.recreate(chat_id, message_id - 1)
+        return FakeMessage(self, chat_id, message_id, from_user=user, text="renamed.mkv",
+                           reply_to_message=file_message)
+
+    async def get_messages(self, chat_id, message_ids):
+        for message_id in message_ids:
+            if (chat_id, message_id) not in self.messages:
+                self.recreate(chat_id, message_id)
+        return await super().get_messages(chat_id, message_ids)
+
+
+async def run_node(args):
+    """One cluster node: claim and run jobs until the parent terminates it"""
+    from helper import metrics, startup
+    from helper.cluster import cluster_node
+    import plugins.file_rename  # noqa: F401 - registers the claimed-job hook
+
+    os.chdir(tempfile.mkdtemp(prefix="renamebot-node-"))
+    startup.mark_ready()
+    client = NodeClient(
+        int(args.file_size_mb * MiB),
+        link_bandwidth=args.link_mbps * MiB / 8,
+        connection_bandwidth=args.connection_mbps * MiB / 8,
+        latency=args.latency_ms / 1000,
+    )
+    cluster_node.leader = bool(await cluster_node.campaign())
+    task = asyncio.create_task(cluster_node.run(client))
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    report = dict(cluster_node.snapshot(), completed=metrics.JOBS.labels("completed").value)
+    print(json.dumps(report), flush=True)
+
+
+async def queue_jobs(args):
+    from helper.jobstate import Job
+    from helper.journal import job_journal
+
+    client = FakeClient()
+    file_size = int(args.file_size_mb * MiB)
+    job_ids = []
+    for k in range(args.jobs):
+        user = FakeUser(10_000 + k % args.users)
+        file_id = FIRST_MESSAGE_ID + 2 * k
+        file_message = FakeMessage(client, user.id, file_id, from_user=user,
+                                   document=client.new_media("source.mkv", file_size))
+        message = FakeMessage(client, user.id, file_id + 1, from_user=user, reply_to_message=file_message)
+        job = Job(f"bench_{k}", user.id, "renamed.mkv", file_size=file_size,
+                  message=message, file_message=file_message)
+        await job_journal.accept(job, "queued")
+        job_ids.append(job.job_id)
+    return job_ids
+
+
+async def run(args):
+    from helper.database import codeflixbots
+
+    db_name = f"renamebot_cluster_bench_{os.getpid()}"
+    codeflixbots._uri = args.mongo
+    codeflixbots._database_name = db_name
+    env = dict(
+        os.environ, DB_URL=args.mongo, DB_NAME=db_name, CLUSTER_MODE="True",
+        MAX_CONCURRENT_FILES=str(args.slots), JOB_LEASE_SECONDS=str(args.lease_seconds),
+        LEADER_LEASE_SECONDS=str(args.lease_seconds), CLUSTER_HEARTBEAT_SECONDS=str(args.lease_seconds / 3),
+        CLUSTER_POLL_SECONDS="0.5",
+    )
+    node_args = [
+        "--file-size-mb", str(args.file_size_mb), "--link-mbps", str(args.link_mbps),
+        "--connection-mbps", str(args.connection_mbps), "--latency-ms", str(args.latency_ms),
+    ]
+    try:
+        job_ids = await queue_jobs(args)
+        journal = codeflixbots.get_collection("job_journal")
+        leaders = codeflixbots.get_collection("cluster")
+        started = time.perf_counter()
+        nodes = {}
+        for index in range(args.nodes):
+            nodes[f"node{index}"] = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "benchmarks.bench_cluster", "--node", *node_args,
+                env=dict(env, NODE_ID=f"node{index}"), cwd=ROOT, stdout=asyncio.subprocess.PIPE,
+            )
+
+        killed = None
+        held_by = []
+        while await journal.count_documents({}) and time.perf_counter() - started < args.timeout:
+            leader = await leaders.find_one({"_id": "leader"})
+            if leader and (not held_by or held_by[-1] != leader["node_id"]):
+                held_by.append(leader["node_id"])
+            if killed is None and args.kill_after and time.perf_counter() - started > args.kill_after and held_by:
+                killed = held_by[-1]
+                nodes[killed].kill()
+                print(f"killed leader {killed} at {time.perf_counter() - started:.1f}s")
+            await asyncio.sleep(0.2)
+        elapsed = time.perf_counter() - started
+        left = await journal.count_documents({})
+
+        reports = []
+        for node_id, process in nodes.items():
+            if process.returncode is None:
+                process.terminate()
+            out, _ = await process.communicate()
+            lines = out.decode().strip().splitlines()
+            reports.append(json.loads(lines[-1]) if node_id != killed and lines else {"node_id": node_id, "killed": True})
+
+        traces = await codeflixbots.get_collection("job_traces").find(
+            {"status": "completed"}, {"job_id": 1}
+        ).to_list(length=None)
+        completions = Counter(trace["job_id"] for trace in traces)
+        print(f"\n== cluster: {args.nodes} nodes x {args.slots} slots ==")
+        print(f"jobs                   {args.jobs} in {elapsed:.2f}s, {left} left in the queue")
+        print(f"throughput             {(args.jobs - left) / elapsed:.2f} jobs/s")
+        print(f"leader                 {' -> '.join(held_by)}")
+        for report in reports:
+            print(f"node                   {report}")
+        print(f"completed twice        {sum(1 for count in completions.values() if count > 1)}")
+        print(f"never completed        {sum(1 for job_id in job_ids if job_id not in completions)}")
+    finally:
+        await codeflixbots.client.drop_database(db_name)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo", default="mongodb://localhost:27017", help="mongod to run against")
+    parser.add_argument("--nodes", type=int, default=3)
+    parser.add_argument("--slots", type=int, default=3, help="MAX_CONCURRENT_FILES of every node")
+    parser.add_argument("--jobs", type=int, default=30)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--file-size-mb", type=float, default=50)
+    parser.add_argument("--link-mbps", type=float, default=400, help="link bandwidth of each node, megabits/s")
+    parser.add_argument("--connection-mbps", type=float, default=80, help="per-transfer cap, megabits/s")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Telegram RPC round-trip")
+    parser.add_argument("--lease-seconds", type=float, default=6, help="job and leader lease")
+    parser.add_argument("--kill-after", type=float, default=0, help="SIGKILL the leader after this many seconds")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--node", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    asyncio.run(run_node(args) if args.node else run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Transfer throughput of Pyrogram's sequential download_media and
+send_document against the parallel multi-session engines in
+helper.downloader and helper.uploader, on FakeClient.
+
+    python -m benchmarks.bench_download --file-size-mb 500 --connections 1 2 4 8
+    python -m benchmarks.bench_download --direction upload --parts-in-flight 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+# helper modules import config at module level; run from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+from helper.downloader import download_parallel
+from helper.uploader import upload_parallel
+from .fake_client import FakeClient, MiB
+from .harness import LagRecorder, Timer, format_summary, setup_environment
+
+
+def build_client(args):
+    return FakeClient(
+        link_bandwidth=args.link_mbps * MiB / 8,
+        connection_bandwidth=args.connection_mbps * MiB / 8,
+        latency=args.latency_ms / 1000,
+    )
+
+
+async def measure(args, direction, connections):
+    """Seconds to move args.files files at once, with lag samples"""
+    client = build_client(args)
+    size = int(args.file_size_mb * MiB)
+    media = [client.new_media(f"file{n}.mkv", size) for n in range(args.files)]
+
+    async def download(n, item):
+        path = f"bench-{connections}-{n}.bin"
+        if connections:
+            await download_parallel(client, item, path, connections)
+        else:
+            await client.download_media(item, file_name=path)
+        assert os.path.getsize(path) == item.file_size
+        os.remove(path)
+
+    async def upload(n, item):
+        path = f"bench-up-{n}.bin"
+        with open(path, "wb") as f:
+            f.truncate(size)
+        if connections:
+            path = await upload_parallel(client, path, connections)
+        await client.send_document(1, path)
+        os.remove(path)
+
+    transfer = download if direction == "download" else upload
+    lag = LagRecorder()
+    lag.start()
+    with Timer() as timer:
+        await asyncio.gather(*(transfer(n, item) for n, item in enumerate(media)))
+    await lag.stop()
+    return timer.elapsed, lag.samples
+
+
+async def run(args):
+    setup_environment()
+    Config.UPLOAD_PARALLEL_PARTS = args.parts_in_flight
+    total = args.files * args.file_size_mb
+    print(f"{args.files} x {args.file_size_mb:g} MiB, link {args.link_mbps:g} Mbit/s, "
+          f"{args.connection_mbps:g} Mbit/s per connection")
+
+    directions = ["download", "upload"] if args.direction == "both" else [args.direction]
+    for direction in directions:
+        baseline, _ = await measure(args, direction, 0)
+        label = "download_media" if direction == "download" else "send_document"
+        print(f"\n{label:<22} {baseline:8.2f}s {total / baseline:9.1f} MiB/s")
+        for connections in args.connections:
+            elapsed, lag = await measure(args, direction, connections)
+            print(
+                f"{f'parallel x{connections}':<22} {elapsed:8.2f}s {total / elapsed:9.1f} MiB/s "
+                f"{baseline / elapsed:6.2f}x"
+            )
+            print(format_summary("  event loop lag", lag, unit="ms", scale=1000))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--direction", choices=["download", "upload", "both"], default="download")
+    parser.add_argument("--files", type=int, default=1, help="files downloaded at the same time")
+    parser.add_argument("--file-size-mb", type=float, default=200)
+    parser.add_argument("--connections", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--parts-in-flight", type=int, default=16, help="upload: SaveBigFilePart requests at once")
+    parser.add_argument("--link-mbps", type=float, default=800, help="shared link bandwidth, megabits/s")
+    parser.add_argument("--connection-mbps", type=float, default=80, help="per-connection cap, megabits/s")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Telegram RPC round-trip")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    asyncio.run(run(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Microbenchmarks for the per-file helpers on the rename hot path: size and
+time formatting, caption/prefix handling, episode extraction, the NSFW
+filter, media type detection and filename sanitising.
+
+    python -m benchmarks.bench_hotpaths
+    python -m benchmarks.bench_hotpaths --save-baseline
+    python -m benchmarks.bench_hotpaths --only extract_episode_number --count 100000
+
+Every case runs over the same seeded corpus so numbers are comparable
+between runs. Results are compared against benchmarks/baselines/hotpaths.json
+and the exit status is 1 when any case is slower than --tolerance allows.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helper.utils import humanbytes, TimeFormatter, convert, add_prefix_suffix
+from plugins.antinsfw import check_anti_nsfw
+from plugins.file_rename import get_media_type, sanitize_filename
+from plugins.sequence import extract_episode_number
+from . import corpus
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "hotpaths.json")
+WEEK_MS = 7 * 24 * 3600 * 1000
+
+
+class _SilentMessage:
+    async def reply_text(self, text, **kwargs):
+        return None
+
+
+def run_sync(coro):
+    """Drive a coroutine that never suspends without paying for an event loop"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("coroutine suspended; it cannot be benchmarked synchronously")
+
+
+def build_cases(count, seed):
+    names = corpus.generate(count, seed)
+    sizes = corpus.file_sizes(count, seed)
+    message = _SilentMessage()
+    return {
+        "humanbytes": (humanbytes, [(size,) for size in sizes]),
+        "TimeFormatter": (TimeFormatter, [(size % WEEK_MS,) for size in sizes]),
+        "convert": (convert, [(size % 86400,) for size in sizes]),
+        "add_prefix_suffix": (add_prefix_suffix, [(name, "[AB] ", "@Channel") for name in names]),
+        "extract_episode_number": (extract_episode_number, [(name,) for name in names]),
+        "check_anti_nsfw": (lambda name, msg: run_sync(check_anti_nsfw(name, msg)), [(name, message) for name in names]),
+        "get_media_type": (get_media_type, [(name,) for name in names]),
+        "sanitize_filename": (sanitize_filename, [(name,) for name in names]),
+    }
+
+
+def time_case(func, inputs, repeat):
+    """Best-of-repeat mean time per call in nanoseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        for args in inputs:
+            func(*args)
+        best = min(best, time.perf_counter_ns() - start)
+    return best / len(inputs)
+
+
+def allocations_case(func, inputs, sample):
+    """Mean and max transient heap bytes allocated by one call"""
+    inputs = inputs[:sample]
+    peaks = []
+    tracemalloc.start()
+    try:
+        for args in inputs:
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            func(*args)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    finally:
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks), max(peaks)
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results, args):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    document = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or platform.machine(),
+        "corpus": {"count": args.count, "seed": args.seed},
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=50_000, help="corpus size")
+    parser.add_argument("--seed", type=int, default=1337)
+    parser.add_argument("--repeat", type=int, default=5, help="timing passes per case, best one wins")
+    parser.add_argument("--alloc-sample", type=int, default=5_000, help="calls traced for allocation stats")
+    parser.add_argument("--only", action="append", help="run just this case (repeatable)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="overwrite the baseline with this run")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline, 0.25 = 25%%")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cases = build_cases(args.count, args.seed)
+    if args.only:
+        unknown = set(args.only) - set(cases)
+        if unknown:
+            sys.exit(f"unknown case(s): {', '.join(sorted(unknown))}; choose from {', '.join(cases)}")
+        cases = {name: cases[name] for name in args.only}
+
+    baseline = load_baseline(args.baseline)
+    previous = (baseline or {}).get("results", {})
+    results = {}
+    regressions = []
+
+    print(f"corpus: {args.count} names, seed {args.seed}, python {platform.python_version()}")
+    print(f"{'case':<24}{'ns/op':>10}{'B/op':>10}{'max B':>10}{'baseline':>12}{'change':>9}")
+    for name, (func, inputs) in cases.items():
+        ns_per_op = time_case(func, inputs, args.repeat)
+        mean_bytes, max_bytes = allocations_case(func, inputs, args.alloc_sample)
+        results[name] = {
+            "ns_per_op": round(ns_per_op, 1),
+            "bytes_per_op": round(mean_bytes, 1),
+            "max_bytes": max_bytes,
+        }
+
+        reference = previous.get(name, {}).get("ns_per_op")
+        if reference:
+            change = ns_per_op / reference - 1
+            compared = f"{reference:>12.1f}{change:>+8.1%}"
+            if change > args.tolerance:
+                regressions.append(name)
+                compared += "  REGRESSION"
+        else:
+            compared = f"{'-':>12}{'':>9}"
+        print(f"{name:<24}{ns_per_op:>10.1f}{mean_bytes:>10.1f}{max_bytes:>10}{compared}")
+
+    if args.save_baseline:
+        if args.only and baseline:
+            results = {**previous, **results}
+        save_baseline(args.baseline, results, args)
+        print(f"\nbaseline saved to {args.baseline}")
+        return 0
+
+    if baseline and (baseline.get("python"), baseline.get("machine")) != (platform.python_version(), platform.machine()):
+        print(f"\nnote: baseline was recorded on python {baseline.get('python')} / {baseline.get('machine')}")
+    if baseline and baseline.get("corpus") != {"count": args.count, "seed": args.seed}:
+        print(f"\nnote: baseline corpus was {baseline.get('corpus')}, numbers are not directly comparable")
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,318 @@
+"""End-to-end throughput benchmark for the rename pipeline, sequence mode and
+broadcast, run entirely offline against FakeClient and the in-memory database.
+The commands scenario measures how long cheap commands wait for a handler
+worker while renames are transferring. The resume scenario recovers jobs
+from the journal after a simulated restart.
+
+    python -m benchmarks.bench_pipeline --scenario all --users 20
+    python -m benchmarks.bench_pipeline --scenario commands --handler-workers 16
+    python -m benchmarks.bench_pipeline --scenario rename --helper-bots 3 --floodwait-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# Plugins import config at module level; run from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyrogram import StopPropagation
+from config import Config
+from helper import metrics, startup
+from helper.database import codeflixbots
+from helper.executor import background
+from helper.helper_bots import helper_pool
+from helper.jobstate import job_registry
+from .fake_client import FakeClient, MiB, synthetic_users
+from .harness import Dispatcher, LagRecorder, Timer, format_summary, setup_environment, summarize
+
+
+# Helper bots upload into this chat, as with HELPER_UPLOAD_CHAT
+HELPER_UPLOAD_CHAT = -1000000000777
+
+
+def client_options(args, seed=None, sleep_threshold=15):
+    """FakeClient settings from the command line; sleep_threshold 15 as the Bot, 0 as a HelperClient"""
+    return dict(
+        link_bandwidth=args.link_mbps * MiB / 8,
+        connection_bandwidth=args.connection_mbps * MiB / 8,
+        latency=args.latency_ms / 1000,
+        floodwait_rate=args.floodwait_rate,
+        floodwait_seconds=args.floodwait_seconds,
+        sleep_threshold=sleep_threshold,
+        seed=args.seed if seed is None else seed,
+    )
+
+
+def build_client(args):
+    return FakeClient(**client_options(args))
+
+
+async def start_helper_bots(client, args):
+    """Helper bots on the same fake Telegram as client, each with its own link and FloodWait draws"""
+    await helper_pool.stop()
+    helper_pool.tokens = [f"fake-helper-{index}" for index in range(args.helper_bots)]
+    helper_pool.chat_id = HELPER_UPLOAD_CHAT
+    await helper_pool.start(
+        lambda index, token: client.linked(**client_options(args, seed=args.seed + index + 1, sleep_threshold=0))
+    )
+
+
+async def rename_scenario(client, args):
+    from plugins.file_rename import rename_start, rename_doc
+
+    users = synthetic_users(args.users)
+    file_size = int(args.file_size_mb * MiB)
+    latencies = []
+    completed_before = metrics.JOBS.labels("completed").value
+
+    async def user_session(user):
+        # Each user sends their files one after another, like a real chat
+        for n in range(args.files_per_user):
+            file_message = client.new_file_message(user, f"[SubsPlease] Show - {n + 1:02d} (1080p).mkv", file_size)
+            await rename_start(client, file_message)
+            reply = client.new_text_message(user, f"Show S01E{n + 1:02d} [1080p].mkv", reply_to_message=file_message)
+            start = time.perf_counter()
+            await rename_doc(client, reply)
+            latencies.append(time.perf_counter() - start)
+
+    with Timer() as timer:
+        await asyncio.gather(*(user_session(user) for user in users))
+        # Jobs run in the background after their handler returned
+        while job_registry.active_count or job_registry.queued_count:
+            await asyncio.sleep(0.05)
+        await background.join()
+
+    completed = metrics.JOBS.labels("completed").value - completed_before
+    return {
+        "jobs": len(latencies),
+        "completed": completed,
+        "elapsed": timer.elapsed,
+        "latencies": latencies,
+    }
+
+
+async def commands_scenario(client, args):
+    from plugins.file_rename import rename_start, rename_doc
+    from plugins.queue_commands import show_queue_status
+
+    users = synthetic_users(args.users, start_id=80_000)
+    file_size = int(args.file_size_mb * MiB)
+    dispatcher = Dispatcher(args.handler_workers)
+    completed_before = metrics.JOBS.labels("completed").value
+    latencies = []
+
+    # Every user starts renames, then keeps asking for /queue while they transfer
+    for user in users:
+        for n in range(args.files_per_user):
+            file_message = client.new_file_message(user, f"Movie.Part{n + 1}.mkv", file_size)
+            await dispatcher.feed(rename_start, client, file_message)
+            reply = client.new_text_message(user, f"Movie Part {n + 1}.mkv", reply_to_message=file_message)
+            dispatcher.feed(rename_doc, client, reply)
+
+    async def ask(user):
+        start = time.perf_counter()
+        await dispatcher.feed(show_queue_status, client, client.new_text_message(user, "/queue"))
+        latencies.append(time.perf_counter() - start)
+
+    with Timer() as timer:
+        asks = []
+        while job_registry.active_count or job_registry.queued_count or not asks:
+            asks += [asyncio.create_task(ask(user)) for user in users[:args.commands_per_tick]]
+            await asyncio.sleep(args.command_interval_ms / 1000)
+        await asyncio.gather(*asks)
+        await background.join()
+    await dispatcher.stop()
+
+    return {
+        "jobs": len(users) * args.files_per_user,
+        "completed": metrics.JOBS.labels("completed").value - completed_before,
+        "elapsed": timer.elapsed,
+        "latencies": latencies,
+        "latency_label": "/queue latency",
+    }
+
+
+async def sequence_scenario(client, args):
+    from plugins.sequence import start_sequence, sequence_file_handler, end_sequence
+
+    users = synthetic_users(args.users, start_id=50_000)
+    latencies = []
+
+    async def user_session(user):
+        await start_sequence(client, client.new_text_message(user, "/startsequence"))
+        for n in reversed(range(args.files_per_user)):
+            message = client.new_file_message(user, f"Show - {n + 1:02d} [720p].mkv", 1 * MiB)
+            try:
+                await sequence_file_handler(client, message)
+            except StopPropagation:
+                pass
+        start = time.perf_counter()
+        await end_sequence(client, client.new_text_message(user, "/endsequence"))
+        latencies.append(time.perf_counter() - start)
+
+    with Timer() as timer:
+        await asyncio.gather(*(user_session(user) for user in users))
+        await background.join()
+
+    return {
+        "jobs": len(latencies),
+        "completed": len(latencies),
+        "elapsed": timer.elapsed,
+        "latencies": latencies,
+    }
+
+
+async def broadcast_scenario(client, args):
+    from plugins.admin_panel import broadcast_handler
+
+    recipients = args.users * args.broadcast_multiplier
+    await codeflixbots.col.insert_many([codeflixbots.new_user(200_000 + i) for i in range(recipients)])
+
+    admin = synthetic_users(1, start_id=Config.ADMIN[0])[0]
+    announcement = client.new_text_message(admin, "Maintenance tonight")
+    command = client.new_text_message(admin, "/broadcast", reply_to_message=announcement)
+
+    total_users = await codeflixbots.total_users_count()
+    with Timer() as timer:
+        await broadcast_handler(client, command)
+        await background.join()
+
+    return {
+        "jobs": total_users,
+        "completed": client.stats["copies"],
+        "elapsed": timer.elapsed,
+        "latencies": [],
+    }
+
+
+async def resume_scenario(client, args):
+    """Restart recovery: every job was journaled mid-rename with its download still on disk.
+    Resumed jobs skip the download, so the ETA model's download speed must not move."""
+    from plugins.file_rename import new_job
+    from helper.eta import eta_model
+    from helper.journal import job_journal
+    from helper import fs
+
+    users = synthetic_users(args.users, start_id=60_000)
+    file_size = int(args.file_size_mb * MiB)
+    completed_before = metrics.JOBS.labels("completed").value
+    speed_before = eta_model.speed("download")
+
+    for user in users:
+        for n in range(args.files_per_user):
+            file_message = client.new_file_message(user, f"Show - {n + 1:02d} [1080p].mkv", file_size)
+            reply = client.new_text_message(user, f"Show E{n + 1:02d}.mkv", reply_to_message=file_message)
+            job = new_job(reply, file_message, f"Show E{n + 1:02d}.mkv")
+            path = f"{fs.DOWNLOADS_DIR}/{job.job_id}/temp_file"
+            os.makedirs(os.path.dirname(path))
+            with open(path, "wb") as f:
+                f.truncate(file_size)
+            await job_journal.accept(job, "active")
+            await job_journal.stage(job, "rename", file_path=path)
+
+    with Timer() as timer:
+        resumed = await job_journal.recover(client)
+        while job_registry.active_count or job_registry.queued_count:
+            await asyncio.sleep(0.05)
+        await background.join()
+
+    speed_after = eta_model.speed("download")
+    if speed_after != speed_before:
+        sys.exit(f"resumed jobs changed the download speed estimate: {speed_before:.0f} -> {speed_after:.0f} B/s")
+    return {
+        "jobs": resumed,
+        "completed": metrics.JOBS.labels("completed").value - completed_before,
+        "elapsed": timer.elapsed,
+        "latencies": [],
+    }
+
+
+SCENARIOS = {
+    "rename": rename_scenario,
+    "sequence": sequence_scenario,
+    "broadcast": broadcast_scenario,
+    "commands": commands_scenario,
+    "resume": resume_scenario,
+}
+
+
+async def run(args):
+    setup_environment(db_latency=args.db_latency_ms / 1000)
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    loop = type(asyncio.get_running_loop()).__module__.split(".")[0]
+    results = []
+
+    for name in names:
+        client = build_client(args)
+        if args.helper_bots:
+            await start_helper_bots(client, args)
+        lag = LagRecorder()
+        lag.start()
+        result = await SCENARIOS[name](client, args)
+        await lag.stop()
+
+        rate = result["jobs"] / result["elapsed"] if result["elapsed"] else 0.0
+        print(f"\n== {name} ==")
+        print(f"jobs                   {result['jobs']} ({result['completed']} completed) in {result['elapsed']:.2f}s")
+        print(f"throughput             {rate:.2f} jobs/s")
+        if result["latencies"]:
+            print(format_summary(result.get("latency_label", "handler latency"), result["latencies"]))
+        print(format_summary("event loop lag", lag.samples, unit="ms", scale=1000))
+        print(f"client                 {client.stats}")
+        for helper in helper_pool.helpers:
+            print(f"{helper.name:<22} {helper.uploads} uploads, {helper.floodwaits} FloodWaits, {helper.client.stats}")
+        moved = client.stats["bytes_down"] + client.stats["bytes_up"]
+        results.append({
+            "scenario": name,
+            "loop": loop,
+            "jobs": result["jobs"],
+            "completed": result["completed"],
+            "elapsed": result["elapsed"],
+            "jobs_per_second": rate,
+            "transfer_mib_per_second": moved / MiB / result["elapsed"] if result["elapsed"] else 0.0,
+            "latency": summarize(result["latencies"]) if result["latencies"] else None,
+            "loop_lag": summarize(lag.samples),
+        })
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=list(SCENARIOS) + ["all"], default="all")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--files-per-user", type=int, default=3)
+    parser.add_argument("--file-size-mb", type=float, default=50)
+    parser.add_argument("--link-mbps", type=float, default=800, help="shared link bandwidth, megabits/s")
+    parser.add_argument("--connection-mbps", type=float, default=80, help="per-transfer cap, megabits/s")
+    parser.add_argument("--latency-ms", type=float, default=50, help="Telegram RPC round-trip")
+    parser.add_argument("--db-latency-ms", type=float, default=2, help="MongoDB round-trip")
+    parser.add_argument("--floodwait-rate", type=float, default=0.0, help="probability of FloodWait per RPC")
+    parser.add_argument("--floodwait-seconds", type=int, default=1)
+    parser.add_argument("--handler-workers", type=int, default=Config.HANDLER_WORKERS, help="commands scenario")
+    parser.add_argument("--commands-per-tick", type=int, default=5, help="commands scenario: /queue sent per tick")
+    parser.add_argument("--command-interval-ms", type=float, default=100, help="commands scenario: time between ticks")
+    parser.add_argument("--broadcast-multiplier", type=int, default=10, help="broadcast recipients per user")
+    parser.add_argument("--helper-bots", type=int, default=0, help="helper bot accounts that take the uploads")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--uvloop", action="store_true", help="run on uvloop, as with UVLOOP=True")
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.uvloop:
+        Config.UVLOOP = True
+        if startup.install_event_loop() != "uvloop":
+            sys.exit("uvloop is not installed")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Compare the default asyncio event loop with uvloop (UVLOOP=True) on the
+offline pipeline benchmark: handler latency from the commands scenario and
+job and transfer throughput from the rename scenario. Every run is a fresh
+bench_pipeline process, alternating loops, and the median of --repeat runs
+is reported. Options this script does not know go to bench_pipeline.
+
+    python -m benchmarks.bench_uvloop
+    python -m benchmarks.bench_uvloop --repeat 5 --users 40 --latency-ms 5 --file-size-mb 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (label, how to read it from a result, whether higher is better)
+METRICS = [
+    ("jobs/s", lambda r: r["jobs_per_second"], True),
+    ("transfer MiB/s", lambda r: r["transfer_mib_per_second"], True),
+    ("latency p50 ms", lambda r: r["latency"]["p50"] * 1000 if r["latency"] else None, False),
+    ("latency p99 ms", lambda r: r["latency"]["p99"] * 1000 if r["latency"] else None, False),
+    ("loop lag p99 ms", lambda r: r["loop_lag"]["p99"] * 1000, False),
+]
+
+
+def run_pipeline(scenario, uvloop, extra):
+    """One bench_pipeline process; returns its result for the scenario"""
+    with tempfile.NamedTemporaryFile(suffix=".json") as out:
+        command = [sys.executable, "-m", "benchmarks.bench_pipeline", "--scenario", scenario, "--json", out.name]
+        if uvloop:
+            command.append("--uvloop")
+        subprocess.run(command + extra, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        return json.load(open(out.name))[0]
+
+
+def median(values):
+    values = [value for value in values if value is not None]
+    return statistics.median(values) if values else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", default=["commands", "rename"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args, extra = parser.parse_known_args(argv)
+
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        sys.exit("uvloop is not installed: pip install uvloop")
+
+    for scenario in args.scenarios:
+        runs = {False: [], True: []}
+        for _ in range(args.repeat):
+            for uvloop in (False, True):
+                runs[uvloop].append(run_pipeline(scenario, uvloop, extra))
+
+        print(f"\n== {scenario} (median of {args.repeat}) ==")
+        print(f"{'':<18} {'asyncio':>10} {'uvloop':>10} {'change':>8}")
+        for label, read, higher_is_better in METRICS:
+            base = median(read(result) for result in runs[False])
+            fast = median(read(result) for result in runs[True])
+            if base is None or fast is None:
+                continue
+            change = (fast - base) / base * 100 if base else 0.0
+            better = change > 0 if higher_is_better else change < 0
+            print(f"{label:<18} {base:>10.3f} {fast:>10.3f} {change:>+7.1f}%{' *' if better else ''}")
+    print("\n* uvloop better")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import random
+
+# Synthetic corpus of anime-release style filenames covering the naming
+# schemes the episode extractor has to handle.
+
+GROUPS = [
+    "SubsPlease", "Erai-raws", "HorribleSubs", "Judas", "ASW", "EMBER", "Anime Time",
+    "Yameii", "DKB", "Ember", "Kawaiika-Raws", "Tsundere-Raws", "VARYG", "NanDesuKa",
+]
+TITLES = [
+    "Jujutsu Kaisen", "One Piece", "Frieren - Beyond Journey's End", "Spy x Family",
+    "Chainsaw Man", "Solo Leveling", "Demon Slayer - Kimetsu no Yaiba", "Blue Lock",
+    "Attack on Titan", "Dandadan", "Oshi no Ko", "Mushoku Tensei", "Vinland Saga",
+    "Bocchi the Rock!", "Kaiju No. 8", "Dr. Stone", "Classroom of the Elite",
+    "Code Geass - Lelouch of the Rebellion", "Assassination Classroom", "Mob Psycho 100",
+]
+QUALITIES = ["480p", "720p", "1080p", "2160p", "1080p HEVC", "720p x265", "1080p WEB-DL"]
+EXTRAS = ["", " [Dual Audio]", " [Multi-Sub]", " (BD Remux)", " [10bit]", " [AAC]", " [E-AC3]"]
+EXTENSIONS = [".mkv"] * 6 + [".mp4"] * 3 + [".avi", ".ts", ".webm", ".m4a", ".mp3", ".zip", ".pdf", ".srt"]
+NSFW_WORDS = ["hentai", "ecchi", "uncensored xxx", "lewd"]
+INVALID = '<>:"/\\|?*'
+
+
+def _episode_tag(rng, season, episode):
+    style = rng.randrange(9)
+    if style == 0:
+        return f" - {episode:02d}"
+    if style == 1:
+        return f" S{season:02d}E{episode:02d}"
+    if style == 2:
+        return f" EP{episode:02d}"
+    if style == 3:
+        return f" E{episode}"
+    if style == 4:
+        return f" S{season} - {episode:02d}"
+    if style == 5:
+        return f" Ep - {episode:02d}"
+    if style == 6:
+        return f" S{season}EP{episode}"
+    if style == 7:
+        return f" ({episode:03d})"
+    return f" {episode:02d}"
+
+
+def filename(rng):
+    title = rng.choice(TITLES)
+    if rng.random() < 0.01:
+        title += " " + rng.choice(NSFW_WORDS)
+    name = (
+        f"[{rng.choice(GROUPS)}] {title}"
+        f"{_episode_tag(rng, rng.randint(1, 6), rng.randint(1, 1100 if 'One Piece' in title else 26))}"
+        f" [{rng.choice(QUALITIES)}]{rng.choice(EXTRAS)}"
+    )
+    if rng.random() < 0.3:
+        name += f" [{rng.getrandbits(32):08X}]"
+    if rng.random() < 0.05:
+        position = rng.randrange(len(name))
+        name = name[:position] + rng.choice(INVALID) + name[position:]
+    return name + rng.choice(EXTENSIONS)
+
+
+def generate(count=50_000, seed=1337):
+    """Deterministic list of release-style filenames"""
+    rng = random.Random(seed)
+    return [filename(rng) for _ in range(count)]
+
+
+def file_sizes(count=50_000, seed=1337):
+    """Deterministic byte sizes from a few KiB up to 2 GiB, log-uniform"""
+    rng = random.Random(seed)
+    return [int(2 ** rng.uniform(10, 31)) for _ in range(count)]
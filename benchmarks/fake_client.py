@@ -0,0 +1,337 @@
+import asyncio
+import io
+import itertools
+import os
+import random
+from pyrogram import StopPropagation, raw
+from pyrogram.errors import FloodWait
+from pyrogram.file_id import FileId, FileType
+from helper.downloader import MediaSessionPool
+from helper.uploader import ParallelUploadMixin
+
+MiB = 1024 * 1024
+
+# Offline stand-in for pyrogram.Client. Transfers move no real data: they
+# sleep for as long as the configured link would take and call the progress
+# callback per chunk exactly like Pyrogram does, so the bot's own progress,
+# metrics and trace code runs unchanged.
+
+
+class FakeUser:
+    def __init__(self, user_id, first_name=None):
+        self.id = user_id
+        self.first_name = first_name or f"User{user_id}"
+        self.username = f"user{user_id}"
+        self.mention = f"[{self.first_name}](tg://user?id={user_id})"
+        self.is_premium = False
+
+
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+
+def fake_file_id(media_id, dc_id=4):
+    """A decodable document file_id, so code that parses file_ids works on fake media"""
+    return FileId(
+        file_type=FileType.DOCUMENT, dc_id=dc_id, media_id=media_id, access_hash=0, file_reference=b""
+    ).encode()
+
+
+class FakeMedia:
+    def __init__(self, file_id, file_name, file_size, mime_type="application/octet-stream", dc_id=4):
+        self.file_id = file_id
+        self.file_unique_id = file_id
+        self.file_name = file_name
+        self.file_size = file_size
+        self.mime_type = mime_type
+        self.dc_id = dc_id
+
+
+class DeletedMessage:
+    empty = True
+
+
+DELETED_MESSAGE = DeletedMessage()
+
+
+class FakeMessage:
+    def __init__(self, client, chat_id, message_id, from_user=None, text=None,
+                 document=None, video=None, audio=None, reply_to_message=None):
+        self._client = client
+        self.chat = FakeChat(chat_id)
+        self.id = message_id
+        self.from_user = from_user
+        self.text = text
+        self.caption = None
+        self.document = document
+        self.video = video
+        self.audio = audio
+        self.photo = None
+        self.reply_to_message = reply_to_message
+        self.empty = False
+        client.messages[(chat_id, message_id)] = self
+
+    @property
+    def command(self):
+        if not self.text or not self.text.startswith("/"):
+            return None
+        parts = self.text.split()
+        return [parts[0][1:]] + parts[1:]
+
+    async def reply_text(self, text, **kwargs):
+        return await self._client.send_message(self.chat.id, text, **kwargs)
+
+    reply = reply_text
+
+    async def reply_photo(self, photo, **kwargs):
+        return await self._client.send_message(self.chat.id, kwargs.get("caption", ""))
+
+    async def reply_sticker(self, sticker, **kwargs):
+        return await self._client.send_message(self.chat.id, "")
+
+    async def edit_text(self, text, **kwargs):
+        return await self._client.edit_message_text(self.chat.id, self.id, text, **kwargs)
+
+    edit = edit_text
+
+    async def edit_caption(self, caption, **kwargs):
+        return await self._client.edit_message_text(self.chat.id, self.id, caption, **kwargs)
+
+    async def delete(self):
+        await self._client._rpc("delete_messages")
+        return True
+
+    async def copy(self, chat_id, **kwargs):
+        return await self._client.copy_message(chat_id, self.chat.id, self.id, **kwargs)
+
+    def stop_propagation(self):
+        raise StopPropagation
+
+
+class FakeSession:
+    """One simulated media connection: GetFile and SaveBigFilePart at the per-connection cap"""
+
+    def __init__(self, client):
+        self.client = client
+        self.free_at = 0.0
+
+    async def invoke(self, query, sleep_threshold=None):
+        if isinstance(query, raw.functions.upload.SaveBigFilePart):
+            await self.client._send_chunk(len(query.bytes), self)
+            self.client.stats["bytes_up"] += len(query.bytes)
+            return True
+        if not isinstance(query, raw.functions.upload.GetFile):
+            raise NotImplementedError(type(query).__name__)
+        size = self.client.media_sizes[query.location.id]
+        chunk = max(0, min(query.limit, size - query.offset))
+        await self.client._send_chunk(chunk, self)
+        self.client.stats["bytes_down"] += chunk
+        return raw.types.upload.File(type=raw.types.storage.FilePartial(), mtime=0, bytes=bytes(chunk))
+
+    async def stop(self):
+        pass
+
+
+class FakeSessionPool(MediaSessionPool):
+    async def create_session(self, dc_id):
+        self.client.stats["sessions"] += 1
+        return FakeSession(self.client)
+
+
+class FakeStorage:
+    async def dc_id(self):
+        return 4
+
+
+class FakeClient(ParallelUploadMixin):
+    """Pyrogram Client stand-in with a simulated link, RPC latency and FloodWait injection"""
+
+    def __init__(self, link_bandwidth=100 * MiB, connection_bandwidth=10 * MiB, latency=0.05,
+                 floodwait_rate=0.0, floodwait_seconds=1, sleep_threshold=10, chunk_size=MiB, seed=0):
+        self.link_bandwidth = link_bandwidth
+        self.connection_bandwidth = connection_bandwidth
+        self.latency = latency
+        self.floodwait_rate = floodwait_rate
+        self.floodwait_seconds = floodwait_seconds
+        self.sleep_threshold = sleep_threshold
+        self.chunk_size = chunk_size
+        self.random = random.Random(seed)
+        self.me = FakeUser(1, "FakeBot")
+        self.me.username = "fake_bot"
+        self.mention = self.me.mention
+        self.username = self.me.username
+        self.is_connected = True
+        self._ids = itertools.count(1000)
+        self._link_free_at = 0.0
+        self.stats = {"rpc": 0, "floodwaits": 0, "bytes_down": 0, "bytes_up": 0, "edits": 0, "copies": 0, "sessions": 0}
+        self.media_sizes = {}
+        self.messages = {}
+        self.storage = FakeStorage()
+        self.parallel_sessions = FakeSessionPool(self)
+
+    def linked(self, **kwargs):
+        """Another bot account on the same fake Telegram: it sees the same messages and
+        shares message ids, but has its own link, sessions and FloodWait draws"""
+        client = FakeClient(**kwargs)
+        client.messages = self.messages
+        client._ids = self._ids
+        client.media_sizes = self.media_sizes
+        return client
+
+    # -- simulation primitives
+
+    async def _rpc(self, name):
+        while True:
+            self.stats["rpc"] += 1
+            await asyncio.sleep(self.latency)
+            if not (self.floodwait_rate and self.random.random() < self.floodwait_rate):
+                return
+            self.stats["floodwaits"] += 1
+            # Like Client.invoke: waits up to sleep_threshold are slept through and retried
+            if self.floodwait_seconds > self.sleep_threshold >= 0:
+                raise FloodWait(value=self.floodwait_seconds)
+            await asyncio.sleep(self.floodwait_seconds)
+
+    async def _send_chunk(self, size, connection=None):
+        """Sleep as long as one chunk takes on a per-connection cap sharing one link.
+        Requests sent concurrently over one FakeSession share its cap."""
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        start = max(now, self._link_free_at)
+        self._link_free_at = start + size / self.link_bandwidth
+        if connection is None:
+            connection_done = now + size / self.connection_bandwidth
+        else:
+            connection_done = connection.free_at = max(now, connection.free_at) + size / self.connection_bandwidth
+        await asyncio.sleep(max(self._link_free_at, connection_done) - now)
+
+    async def _transfer(self, size, progress=None, progress_args=()):
+        current = 0
+        while current < size:
+            chunk = min(self.chunk_size, size - current)
+            await self._send_chunk(chunk)
+            current += chunk
+            if progress:
+                await progress(current, size, *progress_args)
+        return current
+
+    def next_id(self):
+        return next(self._ids)
+
+    def rnd_id(self):
+        return self.random.getrandbits(63)
+
+    # -- factories used by the benchmarks
+
+    def new_media(self, file_name, file_size):
+        media_id = self.next_id()
+        self.media_sizes[media_id] = file_size
+        return FakeMedia(fake_file_id(media_id), file_name, file_size)
+
+    def new_file_message(self, user, file_name, file_size, kind="document"):
+        media = self.new_media(file_name, file_size)
+        return FakeMessage(self, user.id, self.next_id(), from_user=user, **{kind: media})
+
+    def new_text_message(self, user, text, reply_to_message=None):
+        return FakeMessage(self, user.id, self.next_id(), from_user=user, text=text,
+                           reply_to_message=reply_to_message)
+
+    # -- Client API
+
+    async def start(self):
+        return self
+
+    async def stop(self):
+        return self
+
+    async def get_me(self):
+        return self.me
+
+    async def get_messages(self, chat_id, message_ids):
+        await self._rpc("get_messages")
+        return [self.messages.get((chat_id, message_id), DELETED_MESSAGE) for message_id in message_ids]
+
+    async def get_users(self, user_ids):
+        await self._rpc("get_users")
+        if isinstance(user_ids, (list, tuple, set)):
+            return [FakeUser(int(uid)) for uid in user_ids]
+        return FakeUser(int(user_ids))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._rpc("send_message")
+        return FakeMessage(self, chat_id, self.next_id(), from_user=self.me, text=text)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        self.stats["edits"] += 1
+        await self._rpc("edit_message_text")
+        return FakeMessage(self, chat_id, message_id, from_user=self.me, text=text)
+
+    async def copy_message(self, chat_id, from_chat_id, message_id, **kwargs):
+        self.stats["copies"] += 1
+        await self._rpc("copy_message")
+        return FakeMessage(self, chat_id, self.next_id(), from_user=self.me)
+
+    async def download_media(self, message, file_name="downloads/", in_memory=False,
+                             block=True, progress=None, progress_args=()):
+        if isinstance(message, str):
+            media = FakeMedia(message, "thumb.jpg", 20 * 1024)
+        elif isinstance(message, FakeMessage):
+            media = message.document or message.video or message.audio
+        else:
+            media = message
+        await self._rpc("download_media")
+        self.stats["bytes_down"] += await self._transfer(media.file_size, progress, progress_args)
+
+        if in_memory:
+            buffer = io.BytesIO(bytes(media.file_size))
+            buffer.name = media.file_name
+            return buffer
+        if file_name.endswith("/"):
+            file_name = os.path.join(file_name, media.file_name)
+        os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+        with open(file_name, "wb") as f:
+            f.truncate(media.file_size)
+        return file_name
+
+    async def _upload(self, chat_id, path, file_name=None, progress=None, progress_args=(), kind="document"):
+        if isinstance(path, (str, os.PathLike)):
+            size = os.path.getsize(path)
+            name = file_name or os.path.basename(path)
+        else:
+            size = len(path.getbuffer())
+            name = file_name or getattr(path, "name", "file")
+        await self._rpc(f"send_{kind}")
+        if getattr(path, "input_file", None) is None:
+            self.stats["bytes_up"] += await self._transfer(size, progress, progress_args)
+        media = self.new_media(name, size)
+        return FakeMessage(self, chat_id, self.next_id(), from_user=self.me, **{kind: media})
+
+    async def send_document(self, chat_id, document, file_name=None, progress=None, progress_args=(), **kwargs):
+        return await self._upload(chat_id, document, file_name, progress, progress_args, "document")
+
+    async def send_video(self, chat_id, video, file_name=None, progress=None, progress_args=(), **kwargs):
+        return await self._upload(chat_id, video, file_name, progress, progress_args, "video")
+
+    async def send_audio(self, chat_id, audio, file_name=None, progress=None, progress_args=(), **kwargs):
+        return await self._upload(chat_id, audio, file_name, progress, progress_args, "audio")
+
+    async def send_cached_media(self, chat_id, file_id, caption=None, **kwargs):
+        await self._rpc("send_cached_media")
+        media = FakeMedia(file_id, "cached", 0)
+        return FakeMessage(self, chat_id, self.next_id(), from_user=self.me, document=media)
+
+    async def delete_messages(self, chat_id, message_ids):
+        await self._rpc("delete_messages")
+        ids = message_ids if isinstance(message_ids, (list, tuple)) else [message_ids]
+        for message_id in ids:
+            self.messages.pop((chat_id, message_id), None)
+        return len(ids)
+
+    async def send_photo(self, chat_id, photo, **kwargs):
+        await self._rpc("send_photo")
+        return FakeMessage(self, chat_id, self.next_id(), from_user=self.me)
+
+
+def synthetic_users(count, start_id=10_000):
+    return [FakeUser(start_id + i) for i in range(count)]
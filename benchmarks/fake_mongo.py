@@ -0,0 +1,300 @@
+import asyncio
+import copy
+from types import SimpleNamespace
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+# In-memory stand-in for the small part of the Motor API the bot uses. It is
+# installed under helper.database.codeflixbots so every Database method runs
+# unmodified against it.
+
+
+def _get(doc, key):
+    for part in key.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return None
+        doc = doc[part]
+    return doc
+
+
+def _set(doc, key, value):
+    parts = key.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _unset(doc, key):
+    parts = key.split(".")
+    for part in parts[:-1]:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(parts[-1], None)
+
+
+def _compare(value, condition):
+    if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+        for op, arg in condition.items():
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$nin" and value in arg:
+                return False
+            if op == "$ne" and value == arg:
+                return False
+            if op == "$exists" and (value is not None) != bool(arg):
+                return False
+            if op in ("$lt", "$lte", "$gt", "$gte"):
+                if value is None:
+                    return False
+                if op == "$lt" and not value < arg:
+                    return False
+                if op == "$lte" and not value <= arg:
+                    return False
+                if op == "$gt" and not value > arg:
+                    return False
+                if op == "$gte" and not value >= arg:
+                    return False
+        return True
+    return value == condition
+
+
+def matches(doc, query):
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif not _compare(_get(doc, key), condition):
+            return False
+    return True
+
+
+def apply_update(doc, update, inserting=False):
+    for op, fields in update.items():
+        for key, value in fields.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set(doc, key, copy.deepcopy(value))
+            elif op == "$unset":
+                _unset(doc, key)
+            elif op == "$inc":
+                _set(doc, key, (_get(doc, key) or 0) + value)
+            elif op == "$push":
+                current = _get(doc, key)
+                if current is None:
+                    current = []
+                    _set(doc, key, current)
+                if isinstance(value, dict) and "$each" in value:
+                    current.extend(copy.deepcopy(value["$each"]))
+                else:
+                    current.append(copy.deepcopy(value))
+            elif op == "$addToSet":
+                current = _get(doc, key)
+                if current is None:
+                    current = []
+                    _set(doc, key, current)
+                values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+                for item in values:
+                    if item not in current:
+                        current.append(copy.deepcopy(item))
+            elif op == "$pull":
+                current = _get(doc, key) or []
+                _set(doc, key, [item for item in current if item != value])
+
+
+def _sort_key(value):
+    # None sorts first, like MongoDB
+    return (value is not None, value)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._docs = docs
+        self._limit = 0
+
+    def sort(self, key, direction=1):
+        pairs = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(pairs):
+            if field == "$natural":
+                if order < 0:
+                    self._docs.reverse()
+            else:
+                self._docs.sort(key=lambda d: _sort_key(_get(d, field)), reverse=order < 0)
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def _result(self):
+        docs = self._docs[:self._limit] if self._limit else self._docs
+        return [copy.deepcopy(d) for d in docs]
+
+    async def to_list(self, length=None):
+        docs = self._result()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._result():
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, name, latency=0.0):
+        self.name = name
+        self.latency = latency
+        self.docs = []
+
+    async def _rtt(self):
+        await asyncio.sleep(self.latency)
+
+    def _find(self, query):
+        return [d for d in self.docs if matches(d, query)]
+
+    async def find_one(self, query=None, projection=None, sort=None):
+        await self._rtt()
+        found = self._find(query)
+        if sort:
+            found = FakeCursor(found).sort(sort)._docs
+        return copy.deepcopy(found[0]) if found else None
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(self._find(query))
+
+    async def insert_one(self, doc):
+        await self._rtt()
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", ObjectId())
+        if any(d["_id"] == doc["_id"] for d in self.docs):
+            raise ValueError(f"duplicate key {doc['_id']}")
+        self.docs.append(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs):
+        ids = [(await self.insert_one(doc)).inserted_id for doc in docs]
+        return SimpleNamespace(inserted_ids=ids)
+
+    def _upsert_doc(self, query):
+        doc = {k: copy.deepcopy(v) for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+        doc.setdefault("_id", ObjectId())
+        if any(d["_id"] == doc["_id"] for d in self.docs):
+            raise DuplicateKeyError(f"duplicate key {doc['_id']}")
+        self.docs.append(doc)
+        return doc
+
+    async def update_one(self, query, update, upsert=False):
+        await self._rtt()
+        found = self._find(query)
+        if found:
+            apply_update(found[0], update)
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = self._upsert_doc(query)
+            apply_update(doc, update, inserting=True)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def replace_one(self, query, replacement, upsert=False):
+        await self._rtt()
+        found = self._find(query)
+        if found:
+            replacement = {"_id": found[0]["_id"], **copy.deepcopy(replacement)}
+            self.docs[self.docs.index(found[0])] = replacement
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = self._upsert_doc(query)
+            doc.update(copy.deepcopy(replacement))
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query, update, upsert=False):
+        await self._rtt()
+        found = self._find(query)
+        for doc in found:
+            apply_update(doc, update)
+        return SimpleNamespace(matched_count=len(found), modified_count=len(found), upserted_id=None)
+
+    async def find_one_and_update(self, query, update, sort=None, upsert=False, return_document=False, projection=None):
+        await self._rtt()
+        found = self._find(query)
+        if sort:
+            found = FakeCursor(found).sort(sort)._docs
+        if found:
+            doc = found[0]
+            before = copy.deepcopy(doc)
+            apply_update(doc, update)
+            return copy.deepcopy(doc) if return_document else before
+        if upsert:
+            doc = self._upsert_doc(query)
+            apply_update(doc, update, inserting=True)
+            return copy.deepcopy(doc) if return_document else None
+        return None
+
+    async def delete_one(self, query):
+        await self._rtt()
+        found = self._find(query)
+        if found:
+            self.docs.remove(found[0])
+        return SimpleNamespace(deleted_count=len(found[:1]))
+
+    async def delete_many(self, query):
+        await self._rtt()
+        found = self._find(query)
+        for doc in found:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=len(found))
+
+    async def count_documents(self, query):
+        await self._rtt()
+        return len(self._find(query))
+
+    async def create_index(self, keys, **kwargs):
+        return "index"
+
+
+class FakeDatabase:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name, self.latency)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    async def list_collection_names(self):
+        return list(self._collections)
+
+    async def create_collection(self, name, **kwargs):
+        return self[name]
+
+    async def command(self, name, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+        return {"ok": 1}
+
+
+class FakeMongoClient:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._databases = {}
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = FakeDatabase(self.latency)
+        return self._databases[name]
+
+
+def install(database, latency=0.0):
+    """Point a helper.database.Database at a fresh in-memory client"""
+    database._client = FakeMongoClient(latency)
+    return database._client
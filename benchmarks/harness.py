@@ -0,0 +1,103 @@
+import asyncio
+import os
+import tempfile
+import time
+from helper import startup
+from helper.database import codeflixbots
+from helper.jobtrace import percentile
+from . import fake_mongo
+
+
+class LagRecorder:
+    """Samples event loop lag at a fixed interval and keeps every sample"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+class Dispatcher:
+    """Pyrogram's update dispatch in miniature: one queue drained by a fixed
+    number of handler workers, so a handler that runs long holds a worker"""
+
+    def __init__(self, workers):
+        self.queue = asyncio.Queue()
+        self.workers = [asyncio.create_task(self._work()) for _ in range(workers)]
+
+    async def _work(self):
+        while True:
+            handler, client, update, done = await self.queue.get()
+            try:
+                await handler(client, update)
+            except Exception as e:
+                done.set_exception(e)
+            else:
+                done.set_result(None)
+
+    def feed(self, handler, client, update):
+        """Queue an update; the returned future resolves once its handler has run"""
+        done = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((handler, client, update, done))
+        return done
+
+    async def stop(self):
+        for task in self.workers:
+            task.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+
+def setup_environment(db_latency=0.0):
+    """Run from a scratch directory against the in-memory database, with intake open"""
+    workdir = tempfile.mkdtemp(prefix="renamebot-bench-")
+    os.chdir(workdir)
+    fake_mongo.install(codeflixbots, db_latency)
+    startup.mark_ready()
+    return workdir
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+
+def format_summary(label, values, unit="s", scale=1.0):
+    row = summarize(values)
+    return (
+        f"{label:<22} n={row['count']:<6} p50={row['p50'] * scale:9.3f}{unit} "
+        f"p95={row['p95'] * scale:9.3f}{unit} p99={row['p99'] * scale:9.3f}{unit} "
+        f"max={row['max'] * scale:9.3f}{unit}"
+    )
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
@@ -6,11 +6,23 @@ from pyrogram.raw.all import layer
 from config import Config
 from aiohttp import web
 from route import web_server
+from helper import startup
+from helper.health import loop_lag_sampler
+from helper.database import codeflixbots
+from helper.eta import eta_model
+from helper.concurrency import concurrency_controller
+from helper.janitor import janitor
+from helper.journal import job_journal
+from helper.transfer_pool import transfer_pool
+from helper.cluster import cluster_node
+from helper.helper_bots import helper_pool
+from helper.uploader import ParallelUploadMixin
 import pyrogram.utils
 import pyromod
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 import os
 import time
+import logging
 
 pyrogram.utils.MIN_CHANNEL_ID = -1009147483647
 
@@ -19,7 +31,7 @@ SUPPORT_CHAT = int(os.environ.get("SUPPORT_CHAT", "-1002669902570"))
 
 PORT = Config.PORT
 
-class Bot(Client):
+class Bot(ParallelUploadMixin, Client):
 
     def __init__(self):
         super().__init__(
@@ -27,51 +39,113 @@ class Bot(Client):
             api_id=Config.API_ID,
             api_hash=Config.API_HASH,
             bot_token=Config.BOT_TOKEN,
-            workers=200,
+            workers=Config.HANDLER_WORKERS,
             plugins={"root": "plugins"},
             sleep_threshold=15,
         )
         # Initialize the bot's start time for uptime calculation
         self.start_time = time.time()
+        self.background_tasks = set()
 
     async def start(self, *args, **kwargs):
-        await super().start(*args, **kwargs)
-        me = await self.get_me()
+        if cluster_node.enabled:
+            # Only the leader polls updates, the other nodes just claim jobs
+            cluster_node.leader = bool(await cluster_node.campaign())
+            self.no_updates = not cluster_node.leader
+        await startup.timed("telegram_connect", super().start(*args, **kwargs))
+
+        # Independent startup steps run side by side
+        me, _ = await asyncio.gather(
+            startup.timed("get_me", self.get_me()),
+            startup.timed("web_server", self.start_web_server()),
+        )
         self.mention = me.mention
         self.username = me.username  
         self.uptime = Config.BOT_UPTIME     
+        print(f"{me.first_name} Is Started.....✨️")
+
+        # Job intake opens once MongoDB answers; restart notices never block startup
+        self.create_background_task(loop_lag_sampler.run())
+        if transfer_pool.enabled:
+            await transfer_pool.start(self.create_background_task)
+        if helper_pool.configured:
+            # Uploads use this bot alone until the helpers are logged in
+            self.create_background_task(helper_pool.start())
+        if Config.ADAPTIVE_CONCURRENCY:
+            self.create_background_task(concurrency_controller.run(self))
+        self.create_background_task(self.wait_for_database())
+        if not self.no_updates:
+            self.create_background_task(self.send_restart_notifications())
+
+    def create_background_task(self, coro):
+        """Schedule a coroutine and keep a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+
+    async def start_web_server(self):
         if Config.WEBHOOK:
-            app = web.AppRunner(await web_server())
+            app = web.AppRunner(await web_server(self))
             await app.setup()       
             await web.TCPSite(app, "0.0.0.0", PORT).start()     
-        print(f"{me.first_name} Is Started.....✨️")
 
+    async def wait_for_database(self):
+        """Ping MongoDB until it answers, then mark the bot ready"""
+        start = time.perf_counter()
+        delay = 1
+        while True:
+            try:
+                await codeflixbots.ping()
+                logging.info("Successfully connected to MongoDB")
+                break
+            except Exception as e:
+                logging.error(f"MongoDB not reachable yet, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+        await codeflixbots.ensure_job_traces_collection()
+        eta_model.warm_up(await codeflixbots.get_recent_job_traces(Config.JOB_TRACE_AGGREGATE_WINDOW))
+        startup.phase_timings["database"] = time.perf_counter() - start
+        startup.mark_ready()
+        print(startup.startup_report())
+        # Jobs cut short by the previous process go back in the queue; after
+        # that the janitor may treat anything else in downloads/ as orphaned.
+        # In cluster mode lapsed leases hand them to whichever node is free.
+        if cluster_node.enabled:
+            self.create_background_task(cluster_node.run(self))
+        else:
+            await job_journal.recover(self)
+        self.create_background_task(janitor.run())
+
+    async def send_restart_notifications(self):
         # Calculate uptime using timedelta
         uptime_seconds = int(time.time() - self.start_time)
         uptime_string = str(timedelta(seconds=uptime_seconds))
 
-        for chat_id in [Config.LOG_CHANNEL, SUPPORT_CHAT]:
-            try:
-                curr = datetime.now(timezone("Asia/Kolkata"))
-                date = curr.strftime('%d %B, %Y')
-                time_str = curr.strftime('%I:%M:%S %p')
-                
-                # Send the message with the photo
-                await self.send_photo(
-                    chat_id=chat_id,
-                    photo=Config.START_PIC,
-                    caption=(
-                        "**ᴀɴʏᴀ ɪs ʀᴇsᴛᴀʀᴛᴇᴅ ᴀɢᴀɪɴ  !**\n\n"
-                        f"ɪ ᴅɪᴅɴ'ᴛ sʟᴇᴘᴛ sɪɴᴄᴇ​: `{uptime_string}`"
-                    ),
-                    reply_markup=InlineKeyboardMarkup(
-                        [[
-                            InlineKeyboardButton("ᴜᴘᴅᴀᴛᴇs", url="https://t.me/codeflix_bots")
-                        ]]
-                    )
+        await startup.timed("restart_notifications", asyncio.gather(*[
+            self.send_restart_notification(chat_id, uptime_string)
+            for chat_id in [Config.LOG_CHANNEL, SUPPORT_CHAT]
+        ]))
+
+    async def send_restart_notification(self, chat_id, uptime_string):
+        try:
+            # Send the message with the photo
+            await self.send_photo(
+                chat_id=chat_id,
+                photo=Config.START_PIC,
+                caption=(
+                    "**ᴀɴʏᴀ ɪs ʀᴇsᴛᴀʀᴛᴇᴅ ᴀɢᴀɪɴ  !**\n\n"
+                    f"ɪ ᴅɪᴅɴ'ᴛ sʟᴇᴘᴛ sɪɴᴄᴇ​: `{uptime_string}`"
+                ),
+                reply_markup=InlineKeyboardMarkup(
+                    [[
+                        InlineKeyboardButton("ᴜᴘᴅᴀᴛᴇs", url="https://t.me/codeflix_bots")
+                    ]]
                 )
+            )
 
-            except Exception as e:
-                print(f"Failed to send message in chat {chat_id}: {e}")
+        except Exception as e:
+            print(f"Failed to send message in chat {chat_id}: {e}")
 
+print(f"Event loop: {startup.install_event_loop()}")
 Bot().run()
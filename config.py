@@ -26,8 +26,93 @@ class Config(object):
     WEBHOOK = bool(os.environ.get("WEBHOOK", "True"))
     
     # Queue system configuration
-    MAX_CONCURRENT_FILES = int(os.environ.get("MAX_CONCURRENT_FILES", "3"))
+    MAX_CONCURRENT_FILES = int(os.environ.get("MAX_CONCURRENT_FILES", "3"))  # jobs running at once, all users
+    MAX_CONCURRENT_PER_USER = int(os.environ.get("MAX_CONCURRENT_PER_USER", "2"))
+    SCHEDULER_POLICY = os.environ.get("SCHEDULER_POLICY", "fifo")  # fifo or sjf, switch at runtime with /scheduler
+    SCHEDULER_AGING = float(os.environ.get("SCHEDULER_AGING", "1.0"))  # sjf: seconds of estimated work forgiven per second waited
+    PREMIUM_USERS = [int(user) for user in os.environ.get("PREMIUM_USERS", "").split()]  # priority lane after admins
     QUEUE_TIMEOUT = int(os.environ.get("QUEUE_TIMEOUT", "3600"))  # 1 hour timeout
+    JOB_STATE_MAX_USERS = int(os.environ.get("JOB_STATE_MAX_USERS", "10000"))  # idle users kept in memory
+    ETA_EWMA_ALPHA = float(os.environ.get("ETA_EWMA_ALPHA", "0.2"))  # weight of the newest job in ETA averages
+    ETA_DEFAULT_SPEED_MB = float(os.environ.get("ETA_DEFAULT_SPEED_MB", "2"))  # MiB/s assumed before any job finished
+    USER_NAME_CACHE_SIZE = int(os.environ.get("USER_NAME_CACHE_SIZE", "50000"))  # names shown in /queuestats
+
+    # Transfer worker processes, each with its own Telegram session (0 = transfers run in the bot process);
+    # IN_MEMORY_BUDGET_MB and BANDWIDTH_GLOBAL_MB are split evenly between them
+    TRANSFER_WORKERS = int(os.environ.get("TRANSFER_WORKERS", "0"))
+    TRANSFER_WORKER_REPORT_INTERVAL = float(os.environ.get("TRANSFER_WORKER_REPORT_INTERVAL", "2"))  # seconds
+
+    # Helper bots: extra tokens (comma separated) that upload into HELPER_UPLOAD_CHAT, a channel where
+    # they and the main bot are admins; the main bot then delivers each file by file_id
+    HELPER_BOT_TOKENS = [token.strip() for token in os.environ.get("HELPER_BOT_TOKENS", "").split(",") if token.strip()]
+    HELPER_UPLOAD_CHAT = int(os.environ.get("HELPER_UPLOAD_CHAT", "0"))
+
+    # Cluster mode: several nodes with the same bot token share the job journal as a work queue
+    CLUSTER_MODE = os.environ.get("CLUSTER_MODE", "False").lower() in ("true", "1", "yes")
+    NODE_ID = os.environ.get("NODE_ID", f"{os.uname().nodename}-{os.getpid()}")  # the pid survives /restart
+    JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))  # a node that stops renewing loses its jobs
+    LEADER_LEASE_SECONDS = float(os.environ.get("LEADER_LEASE_SECONDS", "30"))  # the leader polls Telegram updates
+    CLUSTER_HEARTBEAT_SECONDS = float(os.environ.get("CLUSTER_HEARTBEAT_SECONDS", "10"))
+    CLUSTER_POLL_SECONDS = float(os.environ.get("CLUSTER_POLL_SECONDS", "2"))  # idle nodes look for jobs this often
+
+    # Run on uvloop instead of the default asyncio event loop (pip install uvloop; ignored when missing)
+    UVLOOP = os.environ.get("UVLOOP", "False").lower() in ("true", "1", "yes")
+
+    # Pyrogram handler workers; handlers only validate and enqueue, the work runs in background tasks
+    HANDLER_WORKERS = int(os.environ.get("HANDLER_WORKERS", "16"))
+
+    # Bandwidth shaping, MiB/s (0 = unlimited); change at runtime with /bandwidth
+    BANDWIDTH_GLOBAL_MB = float(os.environ.get("BANDWIDTH_GLOBAL_MB", "0"))
+    BANDWIDTH_USER_MB = float(os.environ.get("BANDWIDTH_USER_MB", "0"))
+    BANDWIDTH_FAIR_SHARE = os.environ.get("BANDWIDTH_FAIR_SHARE", "False").lower() in ("true", "1", "yes")
+
+    # Parallel downloads: files from PARALLEL_DOWNLOAD_MIN_MB up are fetched over several media sessions
+    DOWNLOAD_CONNECTIONS = int(os.environ.get("DOWNLOAD_CONNECTIONS", "4"))  # 1 = Pyrogram's sequential download
+    PARALLEL_DOWNLOAD_MIN_MB = int(os.environ.get("PARALLEL_DOWNLOAD_MIN_MB", "20"))
+
+    # Parallel uploads: SaveBigFilePart requests in flight over a pool of sessions, for files from PARALLEL_UPLOAD_MIN_MB up
+    UPLOAD_CONNECTIONS = int(os.environ.get("UPLOAD_CONNECTIONS", "4"))  # 0 = Pyrogram's save_file
+    UPLOAD_PARALLEL_PARTS = int(os.environ.get("UPLOAD_PARALLEL_PARTS", "16"))
+    UPLOAD_PART_RETRIES = int(os.environ.get("UPLOAD_PART_RETRIES", "3"))
+    PARALLEL_UPLOAD_MIN_MB = int(os.environ.get("PARALLEL_UPLOAD_MIN_MB", "20"))
+    # Files up to IN_MEMORY_MAX_MB skip the disk while IN_MEMORY_BUDGET_MB of RAM is free for them
+    IN_MEMORY_MAX_MB = int(os.environ.get("IN_MEMORY_MAX_MB", "50"))  # 0 = always use the disk
+    IN_MEMORY_BUDGET_MB = int(os.environ.get("IN_MEMORY_BUDGET_MB", "512"))
+    # Interrupted transfers resume from their finished parts this many times before the job fails
+    TRANSFER_RETRIES = int(os.environ.get("TRANSFER_RETRIES", "3"))
+    TRANSFER_RETRY_DELAY = float(os.environ.get("TRANSFER_RETRY_DELAY", "5"))  # seconds, times the attempt number
+    # Threads running filesystem calls (mkdir, rename, delete, ...) off the event loop
+    FS_THREADS = int(os.environ.get("FS_THREADS", "4"))
+    # /restart lets running jobs finish for up to RESTART_DRAIN_SECONDS, the rest resume after the restart
+    RESTART_DRAIN_SECONDS = float(os.environ.get("RESTART_DRAIN_SECONDS", "60"))
+    RESTART_FLUSH_SECONDS = float(os.environ.get("RESTART_FLUSH_SECONDS", "10"))
+    # Jobs left in the journal by a crash are resumed at most this many times
+    JOURNAL_MAX_RECOVERIES = int(os.environ.get("JOURNAL_MAX_RECOVERIES", "2"))
+    # Janitor: removes downloads/ entries of jobs that are gone once untouched this long
+    JANITOR_MAX_AGE_MINUTES = float(os.environ.get("JANITOR_MAX_AGE_MINUTES", "60"))
+    JANITOR_INTERVAL_MINUTES = float(os.environ.get("JANITOR_INTERVAL_MINUTES", "30"))
+
+    # Adaptive concurrency (AIMD): moves the MAX_CONCURRENT_FILES limit between the bounds below
+    ADAPTIVE_CONCURRENCY = os.environ.get("ADAPTIVE_CONCURRENCY", "True").lower() in ("true", "1", "yes")
+    CONCURRENCY_MIN = int(os.environ.get("CONCURRENCY_MIN", "1"))
+    CONCURRENCY_MAX = int(os.environ.get("CONCURRENCY_MAX", "12"))
+    CONCURRENCY_INTERVAL = float(os.environ.get("CONCURRENCY_INTERVAL", "15"))  # seconds between decisions
+    CONCURRENCY_DECREASE_FACTOR = float(os.environ.get("CONCURRENCY_DECREASE_FACTOR", "0.5"))
+    CONCURRENCY_MAX_ERROR_RATE = float(os.environ.get("CONCURRENCY_MAX_ERROR_RATE", "0.25"))  # failed / finished jobs
+    CONCURRENCY_MAX_LOOP_LAG = float(os.environ.get("CONCURRENCY_MAX_LOOP_LAG", "0.5"))  # seconds
+    CONCURRENCY_THROUGHPUT_DROP = float(os.environ.get("CONCURRENCY_THROUGHPUT_DROP", "0.2"))  # undo an increase that lost this much
+
+    # Job traces (/jobtrace), kept in a capped collection
+    JOB_TRACE_COLLECTION_MB = int(os.environ.get("JOB_TRACE_COLLECTION_MB", "64"))
+    JOB_TRACE_AGGREGATE_WINDOW = int(os.environ.get("JOB_TRACE_AGGREGATE_WINDOW", "1000"))
+
+    # Health check thresholds (/healthz and /readyz)
+    LOOP_LAG_SAMPLE_INTERVAL = float(os.environ.get("LOOP_LAG_SAMPLE_INTERVAL", "0.5"))
+    HEALTH_MAX_LOOP_LAG = float(os.environ.get("HEALTH_MAX_LOOP_LAG", "10"))  # seconds, liveness
+    READY_MAX_LOOP_LAG = float(os.environ.get("READY_MAX_LOOP_LAG", "1"))  # seconds
+    READY_MAX_MONGO_LATENCY = float(os.environ.get("READY_MAX_MONGO_LATENCY", "2"))  # seconds
+    READY_MIN_DISK_FREE_MB = int(os.environ.get("READY_MIN_DISK_FREE_MB", "2048"))
+    READY_MAX_SATURATION = float(os.environ.get("READY_MAX_SATURATION", "3.0"))  # (active + queued jobs) / capacity
 
 
 class Txt(object):
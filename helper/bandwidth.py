@@ -0,0 +1,198 @@
+import asyncio
+import math
+import time
+import logging
+from config import Config
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MiB = 1024 * 1024
+
+
+class TokenBucket:
+    """Token bucket that may go into debt: a caller takes its bytes at once and
+    sleeps for however long the debt takes to pay back. A rate of 0 is unlimited."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate=0, burst=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def capacity(self):
+        return self.burst or self.rate
+
+    def set_rate(self, rate):
+        self._refill(time.monotonic())
+        self.rate = rate
+        self.tokens = min(self.tokens, self.capacity)
+
+    def _refill(self, now):
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now=None):
+        """Take amount tokens and return the seconds to wait before using them"""
+        if not self.rate:
+            return 0.0
+        self._refill(now or time.monotonic())
+        self.tokens -= amount
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class RateMeter:
+    """Exponentially decaying bytes/s estimate with a time constant of tau seconds"""
+
+    __slots__ = ("tau", "rate", "updated", "total")
+
+    def __init__(self, tau=5.0):
+        self.tau = tau
+        self.rate = 0.0
+        self.updated = time.monotonic()
+        self.total = 0
+
+    def current(self, now=None):
+        now = now or time.monotonic()
+        return self.rate * math.exp(-(now - self.updated) / self.tau)
+
+    def add(self, amount, now=None):
+        now = now or time.monotonic()
+        self.rate = self.current(now) + amount / self.tau
+        self.updated = now
+        self.total += amount
+
+
+class UserBandwidth:
+    __slots__ = ("bucket", "meter", "transfers", "limit")
+
+    def __init__(self, rate):
+        self.bucket = TokenBucket(rate)
+        self.meter = RateMeter()
+        self.transfers = 0
+        self.limit = None
+
+
+class BandwidthShaper:
+    """Global and per-user caps on download and upload bytes/s.
+
+    Pyrogram awaits the progress callback after every chunk, so delaying
+    inside the callback paces the transfer itself. With fair_share on, the
+    per-user cap is at most the global cap divided by the users transferring.
+    """
+
+    def __init__(self, global_limit=None, user_limit=None, fair_share=None):
+        self.global_limit = Config.BANDWIDTH_GLOBAL_MB * MiB if global_limit is None else global_limit
+        self.user_limit = Config.BANDWIDTH_USER_MB * MiB if user_limit is None else user_limit
+        self.fair_share = Config.BANDWIDTH_FAIR_SHARE if fair_share is None else fair_share
+        self.bucket = TokenBucket(self.global_limit)
+        self.meter = RateMeter()
+        self.users = {}
+        self.throttled_seconds = 0.0
+
+    def set_global_limit(self, rate):
+        self.global_limit = rate
+        self.bucket.set_rate(rate)
+        self._apply_user_rates()
+        logger.info(f"Global bandwidth cap set to {rate / MiB:.1f} MiB/s" if rate else "Global bandwidth cap removed")
+
+    def set_user_limit(self, rate, user_id=None):
+        """Default cap for every user, or an override for one user (None clears it)"""
+        if user_id is None:
+            self.user_limit = rate
+        else:
+            self._user(user_id).limit = rate
+        self._apply_user_rates()
+
+    def _user(self, user_id):
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = UserBandwidth(self.user_limit)
+        return user
+
+    def _user_rate(self, user):
+        rate = user.limit if user.limit is not None else self.user_limit
+        if self.fair_share and self.global_limit:
+            busy = sum(1 for u in self.users.values() if u.transfers) or 1
+            share = self.global_limit / busy
+            rate = min(rate, share) if rate else share
+        return rate
+
+    def _apply_user_rates(self):
+        for user in self.users.values():
+            user.bucket.set_rate(self._user_rate(user))
+
+    def _prune(self, now):
+        """Forget users with no transfer, no override and a rate that has decayed away"""
+        for user_id in [
+            user_id for user_id, user in self.users.items()
+            if not user.transfers and user.limit is None and user.meter.current(now) < 1
+        ]:
+            del self.users[user_id]
+
+    def begin(self, user_id):
+        """Mark a transfer of this user as running, for fair-share accounting"""
+        self._prune(time.monotonic())
+        self._user(user_id).transfers += 1
+        if self.fair_share:
+            self._apply_user_rates()
+
+    def end(self, user_id):
+        user = self.users.get(user_id)
+        if user is None:
+            return
+        user.transfers -= 1
+        if self.fair_share:
+            self._apply_user_rates()
+
+    async def consume(self, user_id, direction, amount):
+        """Account for amount bytes and sleep until both caps allow them"""
+        user = self._user(user_id)
+        now = time.monotonic()
+        delay = max(self.bucket.reserve(amount, now), user.bucket.reserve(amount, now))
+        user.meter.add(amount, now)
+        self.meter.add(amount, now)
+        if delay > 0:
+            self.throttled_seconds += delay
+            metrics.BANDWIDTH_THROTTLE_SECONDS.labels(direction).inc(delay)
+            await asyncio.sleep(delay)
+
+    def shape(self, user_id, direction, progress):
+        """Wrap a Pyrogram progress callback so the transfer is paced by the caps"""
+        last = 0
+        shaper = self
+
+        async def wrapper(current, total, *args):
+            nonlocal last
+            if current > last:
+                await shaper.consume(user_id, direction, current - last)
+                last = current
+            await progress(current, total, *args)
+
+        return wrapper
+
+    def rates(self):
+        """Current bytes/s per user, busiest first"""
+        now = time.monotonic()
+        self._prune(now)
+        return sorted(
+            ((user_id, user.meter.current(now)) for user_id, user in self.users.items()),
+            key=lambda item: item[1], reverse=True
+        )
+
+    def snapshot(self):
+        return {
+            "global_limit": self.global_limit,
+            "user_limit": self.user_limit,
+            "fair_share": self.fair_share,
+            "rate": self.meter.current(),
+            "throttled_seconds": self.throttled_seconds,
+            "users": dict(self.rates()),
+        }
+
+
+bandwidth = BandwidthShaper()
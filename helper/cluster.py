@@ -0,0 +1,159 @@
+import asyncio
+import time
+import logging
+from config import Config
+from . import startup
+from .database import codeflixbots
+from .jobstate import job_registry
+from .journal import job_journal, RESUMED_TEXT
+from .restart import restart_drain
+from .scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class ClusterNode:
+    """This process as one node of a cluster sharing the job journal as a work queue.
+
+    With CLUSTER_MODE several processes, on one machine or many, run with
+    the same bot token and MongoDB. Exactly one of them, the leader, polls
+    Telegram updates and writes accepted jobs to the journal as queued.
+    Every node, the leader included, claims queued jobs with an atomic
+    find_one_and_update while it has free slots and holds each one under a
+    lease it renews every CLUSTER_HEARTBEAT_SECONDS. A node that dies stops
+    renewing; once the lease lapses another node claims the job, counted as
+    a recovery like a crash in single-node mode. A node that renewed too
+    late and finds a job claimed by another node stops its own run of it.
+
+    Leadership is a lease too, on the cluster collection. A node learns its
+    role at startup and the heartbeat keeps checking it; when the role
+    changes, on_role_change restarts the process into the other one, so
+    Pyrogram never has to switch update polling on or off at runtime.
+    """
+
+    def __init__(self, registry, node_id=None):
+        self.registry = registry
+        self.node_id = node_id or Config.NODE_ID
+        self.enabled = Config.CLUSTER_MODE
+        self.leader = False
+        self.wakeup = asyncio.Event()
+        self.claimed = 0
+        self.taken_over = 0
+        self.lost_leases = 0
+        # Called with (client, document) to start a claimed job; returns False if it cannot
+        self.start_job = None
+        # Called with (client) when this node gains or loses leadership
+        self.on_role_change = None
+
+    async def campaign(self):
+        """Take or renew the leader lease; returns whether this node leads, None if MongoDB is unreachable"""
+        now = time.time()
+        return await codeflixbots.claim_leadership(self.node_id, now, now + Config.LEADER_LEASE_SECONDS)
+
+    def wake(self):
+        """A slot was freed or a job was queued: look for work now instead of at the next poll"""
+        self.wakeup.set()
+
+    def _busy_users(self):
+        """Users already at the per-user limit on this node"""
+        return [
+            state.user_id for state in self.registry.busy_states()
+            if len(state.active) >= scheduler.per_user_limit
+        ]
+
+    async def claim(self):
+        """Claim the next job: first one abandoned by a dead node, then the oldest queued one"""
+        now = time.time()
+        lease_until = now + Config.JOB_LEASE_SECONDS
+        exclude = self._busy_users()
+        document = await codeflixbots.claim_job(self.node_id, now, lease_until, expired=True, exclude_users=exclude)
+        if document is not None:
+            self.taken_over += 1
+            logger.warning(f"Took over job {document['_id']}, its node stopped renewing the lease")
+            return document, True
+        document = await codeflixbots.claim_job(self.node_id, now, lease_until, exclude_users=exclude)
+        return document, False
+
+    async def start(self, client, document, taken_over):
+        self.claimed += 1
+        if document.get("recoveries", 0) > Config.JOURNAL_MAX_RECOVERIES:
+            await job_journal.drop(client, document)
+            return
+        ok = False
+        try:
+            ok = await self.start_job(client, document)
+        except Exception as e:
+            logger.error(f"Could not start claimed job {document['_id']}: {e}")
+        if not ok:
+            await job_journal.drop(client, document)
+        elif taken_over:
+            await job_journal.notify(client, document, RESUMED_TEXT)
+
+    async def run(self, client):
+        await asyncio.gather(self.work(client), self.heartbeat(client))
+
+    async def work(self, client):
+        """Claim jobs whenever this node has a free slot"""
+        while True:
+            self.wakeup.clear()
+            while startup.is_ready() and self.registry.active_count < scheduler.capacity:
+                document, taken_over = await self.claim()
+                if document is None:
+                    break
+                await self.start(client, document, taken_over)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), Config.CLUSTER_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def heartbeat(self, client):
+        """Renew the leases on this node's jobs and check which node leads"""
+        while True:
+            await asyncio.sleep(Config.CLUSTER_HEARTBEAT_SECONDS)
+            job_ids = self.registry.live_job_ids()
+            if job_ids:
+                held = await codeflixbots.renew_job_leases(
+                    self.node_id, job_ids, time.time() + Config.JOB_LEASE_SECONDS
+                )
+                if held is not None and held < len(job_ids):
+                    await self.stop_lost_jobs(job_ids)
+            leader = await self.campaign()
+            if leader is None or leader == self.leader:
+                continue
+            logger.warning(f"Node {self.node_id} {'became' if leader else 'is no longer'} the leader")
+            self.leader = leader
+            if self.on_role_change is not None:
+                self.on_role_change(client)
+
+    async def stop_lost_jobs(self, job_ids):
+        """Cancel the jobs another node claimed after this one renewed too late, so
+        the file is not delivered twice; the journal entry is the other node's now"""
+        owned = await codeflixbots.owned_jobs(self.node_id, job_ids)
+        if owned is None:
+            return
+        # Jobs that finished meanwhile left the journal, they are not lost
+        lost = [job_id for job_id in job_ids if job_id not in owned and job_id in self.registry.live_job_ids()]
+        if not lost:
+            return
+        self.lost_leases += len(lost)
+        logger.error(f"Node {self.node_id} lost the lease on {len(lost)} running jobs, stopping them")
+        for job_id in lost:
+            tracked = restart_drain.tasks.get(job_id)
+            if tracked is None:
+                continue
+            job, task = tracked
+            job.lease_lost = True
+            task.cancel()
+
+    def snapshot(self):
+        return {
+            "node_id": self.node_id,
+            "leader": self.leader,
+            "active": self.registry.active_count,
+            "claimed": self.claimed,
+            "taken_over": self.taken_over,
+            "lost_leases": self.lost_leases,
+        }
+
+
+cluster_node = ClusterNode(job_registry)
@@ -0,0 +1,155 @@
+import asyncio
+import time
+import logging
+from collections import deque
+from config import Config
+from . import metrics
+from .bandwidth import MiB
+from .health import loop_lag_sampler
+from .jobstate import job_registry
+from .scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencyController:
+    """Additive-increase, multiplicative-decrease control of the scheduler capacity.
+
+    Every interval it looks at what happened since the last decision: any
+    FloodWait on the bot's own downloads or uploads, too many failed jobs, a
+    lagging event loop, or throughput that fell after the previous increase
+    cuts the limit by the decrease factor.
+    Otherwise, while jobs are queued behind a full set of slots, the limit
+    grows by one.
+    """
+
+    def __init__(self, scheduler, registry, minimum=None, maximum=None, interval=None):
+        self.scheduler = scheduler
+        self.registry = registry
+        self.minimum = max(1, minimum or Config.CONCURRENCY_MIN)
+        self.maximum = max(self.minimum, maximum or Config.CONCURRENCY_MAX)
+        self.interval = interval or Config.CONCURRENCY_INTERVAL
+        self.decrease_factor = Config.CONCURRENCY_DECREASE_FACTOR
+        self.max_error_rate = Config.CONCURRENCY_MAX_ERROR_RATE
+        self.max_loop_lag = Config.CONCURRENCY_MAX_LOOP_LAG
+        self.throughput_drop = Config.CONCURRENCY_THROUGHPUT_DROP
+        # Called with the client after an increase so queued jobs take the new slots
+        self.on_increase = None
+        self.enabled = False
+        self.history = deque(maxlen=20)
+        self.last_sample = None
+        self.counters = None
+        # Throughput just before the last increase, checked by the next sample
+        self.baseline_throughput = None
+        metrics.CONCURRENCY_LIMIT.set_function(lambda: self.scheduler.capacity)
+
+    def _clamp(self, capacity):
+        return min(self.maximum, max(self.minimum, capacity))
+
+    def _read_counters(self):
+        return (
+            time.monotonic(),
+            metrics.TRANSFER_BYTES.total(),
+            # Only the bot's own transfers: broadcasts, sequences and helper accounts do not
+            # share its transfer limit, so their FloodWaits say nothing about it
+            metrics.FLOODWAITS.labels("download").value + metrics.FLOODWAITS.labels("upload").value,
+            metrics.JOBS.labels("completed").value,
+            metrics.JOBS.labels("failed").value,
+        )
+
+    def sample(self):
+        """Rates since the previous sample"""
+        counters = self._read_counters()
+        previous, self.counters = self.counters, counters
+        lag = loop_lag_sampler.take_window_lag()
+        if previous is None:
+            return None
+        elapsed = max(counters[0] - previous[0], 1e-9)
+        completed = counters[3] - previous[3]
+        failed = counters[4] - previous[4]
+        finished = completed + failed
+        self.last_sample = {
+            "throughput": (counters[1] - previous[1]) / elapsed,
+            "floodwaits": counters[2] - previous[2],
+            "finished": finished,
+            "error_rate": failed / finished if finished else 0.0,
+            "loop_lag": lag,
+            "saturated": self.registry.active_count >= self.scheduler.capacity,
+            "queued": self.registry.queued_count,
+        }
+        return self.last_sample
+
+    def decide(self, sample):
+        """Return (new capacity, reason) for a sample, or None to keep the limit"""
+        capacity = self.scheduler.capacity
+        reason = None
+        if sample["floodwaits"]:
+            reason = f"{sample['floodwaits']} FloodWait(s)"
+        elif sample["finished"] >= 3 and sample["error_rate"] > self.max_error_rate:
+            reason = f"error rate {sample['error_rate']:.0%}"
+        elif sample["loop_lag"] > self.max_loop_lag:
+            reason = f"event loop lag {sample['loop_lag']:.2f}s"
+        elif (
+            self.baseline_throughput is not None and sample["saturated"]
+            and sample["throughput"] < self.baseline_throughput * (1 - self.throughput_drop)
+        ):
+            reason = (
+                f"throughput fell to {sample['throughput'] / MiB:.1f} MiB/s "
+                f"from {self.baseline_throughput / MiB:.1f} MiB/s"
+            )
+        if reason:
+            new = self._clamp(int(capacity * self.decrease_factor))
+            return (new, reason) if new != capacity else None
+
+        if sample["saturated"] and sample["queued"] and capacity < self.maximum:
+            return capacity + 1, f"{sample['queued']} queued at {sample['throughput'] / MiB:.1f} MiB/s"
+        return None
+
+    def adjust(self, client=None):
+        """Take one sample and apply the decision, returns the change if there was one"""
+        sample = self.sample()
+        if sample is None:
+            return None
+        decision = self.decide(sample)
+        self.baseline_throughput = None
+        if decision is None:
+            return None
+        new, reason = decision
+        old = self.scheduler.capacity
+        direction = "increase" if new > old else "decrease"
+        self.scheduler.capacity = new
+        if direction == "increase":
+            self.baseline_throughput = sample["throughput"]
+        change = {"at": time.time(), "from": old, "to": new, "direction": direction, "reason": reason}
+        self.history.append(change)
+        metrics.CONCURRENCY_ADJUSTMENTS.labels(direction).inc()
+        logger.info(f"Concurrency {direction}d {old} -> {new}: {reason}")
+        if direction == "increase" and self.on_increase is not None and client is not None:
+            self.on_increase(client)
+        return change
+
+    async def run(self, client):
+        self.enabled = True
+        self.scheduler.capacity = self._clamp(self.scheduler.capacity)
+        self.sample()
+        logger.info(f"Adaptive concurrency started at {self.scheduler.capacity} ({self.minimum}-{self.maximum})")
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.adjust(client)
+            except Exception as e:
+                logger.error(f"Concurrency controller error: {e}")
+
+    def snapshot(self):
+        return {
+            "enabled": self.enabled,
+            "capacity": self.scheduler.capacity,
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+            "sample": self.last_sample,
+            "baseline_throughput": self.baseline_throughput,
+            "history": list(self.history),
+        }
+
+
+concurrency_controller = ConcurrencyController(scheduler, job_registry)
@@ -1,20 +1,49 @@
 import motor.motor_asyncio, datetime, pytz
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from config import Config
 import logging  # Added for logging errors and important information
 from .utils import send_log
+from .metrics import MongoCommandListener
+from .usernames import user_names
 
 
 class Database:
     def __init__(self, uri, database_name):
-        try:
-            self._client = motor.motor_asyncio.AsyncIOMotorClient(uri)
-            self._client.server_info()  # This will raise an exception if the connection fails
-            logging.info("Successfully connected to MongoDB")
-        except Exception as e:
-            logging.error(f"Failed to connect to MongoDB: {e}")
-            raise e  # Re-raise the exception after logging it
-        self.codeflixbots = self._client[database_name]
-        self.col = self.codeflixbots.user
+        # The Motor client is created on first use so importing plugins never
+        # opens a connection; every collection shares this one pool.
+        self._uri = uri
+        self._database_name = database_name
+        self._client = None
+
+    @property
+    def client(self):
+        """Shared Motor client, created lazily"""
+        if self._client is None:
+            try:
+                self._client = motor.motor_asyncio.AsyncIOMotorClient(
+                    self._uri, event_listeners=[MongoCommandListener()]
+                )
+            except Exception as e:
+                logging.error(f"Failed to create MongoDB client: {e}")
+                raise e
+        return self._client
+
+    @property
+    def codeflixbots(self):
+        return self.client[self._database_name]
+
+    @property
+    def col(self):
+        return self.codeflixbots.user
+
+    def get_collection(self, name):
+        """Get a collection backed by the shared client"""
+        return self.codeflixbots[name]
+
+    async def ping(self):
+        """Round-trip to MongoDB, raises if the server is unreachable"""
+        await self.codeflixbots.command("ping")
 
     def new_user(self, id):
         return dict(
@@ -37,6 +66,7 @@ class Database:
 
     async def add_user(self, b, m):
         u = m.from_user
+        user_names.remember(u)
         if not await self.is_user_exist(u.id):
             user = self.new_user(u.id)
             try:
@@ -317,6 +347,164 @@ class Database:
         except Exception as e:
             logging.error(f"Error updating user settings for user {user_id}: {e}")
 
+    # Job trace methods
+    async def ensure_job_traces_collection(self):
+        """Create the capped job trace collection and its index if missing"""
+        try:
+            if "job_traces" not in await self.codeflixbots.list_collection_names():
+                await self.codeflixbots.create_collection(
+                    "job_traces", capped=True, size=Config.JOB_TRACE_COLLECTION_MB * 1024 * 1024
+                )
+            await self.get_collection("job_traces").create_index([("user_id", 1), ("started_at", -1)])
+        except Exception as e:
+            logging.error(f"Error creating job trace collection: {e}")
+
+    async def add_job_trace(self, trace):
+        try:
+            await self.get_collection("job_traces").insert_one(trace)
+        except Exception as e:
+            logging.error(f"Error saving job trace {trace.get('job_id')}: {e}")
+
+    async def get_user_job_traces(self, user_id, limit=5):
+        try:
+            cursor = self.get_collection("job_traces").find({"user_id": int(user_id)}).sort("started_at", -1)
+            return await cursor.limit(limit).to_list(length=limit)
+        except Exception as e:
+            logging.error(f"Error getting job traces for user {user_id}: {e}")
+            return []
+
+    async def get_recent_job_traces(self, limit=1000):
+        try:
+            # Natural order of a capped collection is insertion order
+            cursor = self.get_collection("job_traces").find(
+                {}, {"stages": 1, "duration": 1, "status": 1, "dc_id": 1, "predicted_duration": 1}
+            ).sort("$natural", -1)
+            return await cursor.limit(limit).to_list(length=limit)
+        except Exception as e:
+            logging.error(f"Error getting recent job traces: {e}")
+            return []
+
+    # Job journal: one entry per accepted job until it finishes (see helper.journal)
+    async def journal_job(self, document):
+        try:
+            await self.get_collection("job_journal").replace_one({"_id": document["_id"]}, document, upsert=True)
+            return True
+        except Exception as e:
+            logging.error(f"Error journaling job {document['_id']}: {e}")
+            return False
+
+    async def update_journal(self, job_id, fields):
+        try:
+            result = await self.get_collection("job_journal").update_one({"_id": job_id}, {"$set": fields})
+            return result.matched_count > 0
+        except Exception as e:
+            logging.error(f"Error updating journal entry {job_id}: {e}")
+            return False
+
+    async def remove_journal(self, job_id):
+        try:
+            await self.get_collection("job_journal").delete_one({"_id": job_id})
+        except Exception as e:
+            logging.error(f"Error removing journal entry {job_id}: {e}")
+
+    # Cluster mode: the journal doubles as a work queue that nodes claim jobs from under a lease
+    async def claim_job(self, node_id, now, lease_until, expired=False, exclude_users=()):
+        """Take the oldest queued job, or with expired=True the oldest one whose node
+        stopped renewing its lease; returns the claimed entry or None"""
+        query = {"state": "active", "lease_until": {"$lt": now}} if expired else {"state": "queued"}
+        if exclude_users:
+            query["user_id"] = {"$nin": list(exclude_users)}
+        update = {"$set": {
+            "state": "active", "owner": node_id, "lease_until": lease_until, "checkpointed": False, "updated_at": now,
+        }}
+        if expired:
+            update["$inc"] = {"recoveries": 1}
+        try:
+            return await self.get_collection("job_journal").find_one_and_update(
+                query, update, sort=[("accepted_at", 1)], return_document=ReturnDocument.AFTER
+            )
+        except Exception as e:
+            logging.error(f"Error claiming a job for node {node_id}: {e}")
+            return None
+
+    async def renew_job_leases(self, node_id, job_ids, lease_until):
+        """Extend the node's leases on job_ids; returns how many it still held"""
+        try:
+            result = await self.get_collection("job_journal").update_many(
+                {"_id": {"$in": list(job_ids)}, "owner": node_id}, {"$set": {"lease_until": lease_until}}
+            )
+            return result.matched_count
+        except Exception as e:
+            logging.error(f"Error renewing job leases of node {node_id}: {e}")
+            return None
+
+    async def owned_jobs(self, node_id, job_ids):
+        """Which of job_ids the node still owns in the journal; None if MongoDB is unreachable"""
+        try:
+            documents = await self.get_collection("job_journal").find(
+                {"_id": {"$in": list(job_ids)}, "owner": node_id}, {"_id": 1}
+            ).to_list(length=None)
+            return {document["_id"] for document in documents}
+        except Exception as e:
+            logging.error(f"Error reading job owners for node {node_id}: {e}")
+            return None
+
+    async def count_queued_jobs(self, accepted_before=None, user_id=None):
+        """Queued jobs across every node, optionally only those accepted up to
+        accepted_before or those of one user"""
+        query = {"state": "queued"}
+        if accepted_before is not None:
+            query["accepted_at"] = {"$lte": accepted_before}
+        if user_id is not None:
+            query["user_id"] = user_id
+        try:
+            return await self.get_collection("job_journal").count_documents(query)
+        except Exception as e:
+            logging.error(f"Error counting queued jobs: {e}")
+            return None
+
+    async def get_user_jobs(self, user_id):
+        """The user's journaled jobs on every node, oldest first"""
+        try:
+            return await self.get_collection("job_journal").find(
+                {"user_id": user_id}
+            ).sort("accepted_at", 1).to_list(length=None)
+        except Exception as e:
+            logging.error(f"Error reading journaled jobs of user {user_id}: {e}")
+            return []
+
+    async def remove_queued_jobs(self, user_id):
+        """Drop the user's jobs no node has claimed yet; returns how many went"""
+        try:
+            result = await self.get_collection("job_journal").delete_many({"user_id": user_id, "state": "queued"})
+            return result.deleted_count
+        except Exception as e:
+            logging.error(f"Error removing queued jobs of user {user_id}: {e}")
+            return 0
+
+    async def claim_leadership(self, node_id, now, lease_until):
+        """Take or renew the leader lease; True if node_id holds it, None if MongoDB did not answer"""
+        try:
+            await self.get_collection("cluster").find_one_and_update(
+                {"_id": "leader", "$or": [{"node_id": node_id}, {"lease_until": {"$lt": now}}]},
+                {"$set": {"node_id": node_id, "lease_until": lease_until}},
+                upsert=True,
+            )
+            return True
+        except DuplicateKeyError:
+            # Another node holds a live lease, so the upsert collided with its entry
+            return False
+        except Exception as e:
+            logging.error(f"Error claiming cluster leadership for node {node_id}: {e}")
+            return None
+
+    async def get_journal(self):
+        """Every journaled job, oldest first"""
+        try:
+            return await self.get_collection("job_journal").find().sort("accepted_at", 1).to_list(length=None)
+        except Exception as e:
+            logging.error(f"Error reading the job journal: {e}")
+            return []
 
 # Create the database instance
 codeflixbots = Database(Config.DB_URL, Config.DB_NAME)
@@ -0,0 +1,383 @@
+import asyncio
+import os
+import threading
+import time
+import logging
+from pyrogram import raw
+from pyrogram.errors import AuthBytesInvalid, FloodWait, InternalServerError
+from pyrogram.file_id import FileId
+from pyrogram.session import Auth, Session
+from config import Config
+from . import metrics, fs
+from .memory import new_memory_file
+
+logger = logging.getLogger(__name__)
+
+# upload.GetFile returns at most 1 MiB and a request may not cross a 1 MiB boundary
+PART_SIZE = 1024 * 1024
+# The parallel engines call the progress callback at most this often, in seconds
+PROGRESS_INTERVAL = 1.0
+
+
+# Failures worth resuming a transfer after; anything else fails the job
+RETRYABLE_ERRORS = (OSError, asyncio.TimeoutError, InternalServerError, FloodWait)
+
+
+class CdnRedirect(Exception):
+    """The file is served from a CDN DC, which the parallel path does not handle"""
+
+
+class MediaSessionPool:
+    """Media sessions per DC for parallel transfers, separate from the single
+    one Pyrogram keeps in client.media_sessions"""
+
+    def __init__(self, client):
+        self.client = client
+        self.sessions = {}
+        self.lock = asyncio.Lock()
+
+    async def create_session(self, dc_id):
+        """Open and authorize one media session, the same way Client.get_file does"""
+        client = self.client
+        test_mode = await client.storage.test_mode()
+        if dc_id == await client.storage.dc_id():
+            session = Session(client, dc_id, await client.storage.auth_key(), test_mode, is_media=True)
+            await session.start()
+            return session
+
+        session = Session(client, dc_id, await Auth(client, dc_id, test_mode).create(), test_mode, is_media=True)
+        await session.start()
+        for _ in range(3):
+            exported = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+            try:
+                await session.invoke(raw.functions.auth.ImportAuthorization(id=exported.id, bytes=exported.bytes))
+            except AuthBytesInvalid:
+                continue
+            return session
+        await session.stop()
+        raise AuthBytesInvalid
+
+    async def get(self, dc_id, count):
+        """count sessions to dc_id, opening the missing ones"""
+        async with self.lock:
+            sessions = self.sessions.setdefault(dc_id, [])
+            while len(sessions) < count:
+                sessions.append(await self.create_session(dc_id))
+                logger.info(f"Opened media session {len(sessions)} to DC{dc_id}")
+            return sessions[:count]
+
+    async def stop(self):
+        """Close every session in the pool"""
+        async with self.lock:
+            sessions = [session for dc_sessions in self.sessions.values() for session in dc_sessions]
+            self.sessions.clear()
+        for session in sessions:
+            try:
+                await session.stop()
+            except Exception as e:
+                logger.warning(f"Error closing media session: {e}")
+
+
+def session_pool(client):
+    """The client's parallel session pool, created on first use"""
+    pool = getattr(client, "parallel_sessions", None)
+    if pool is None:
+        pool = client.parallel_sessions = MediaSessionPool(client)
+    return pool
+
+
+async def run_workers(coros):
+    """Run the coroutines together; the first failure cancels the others and is raised"""
+    workers = [asyncio.create_task(coro) for coro in coros]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        raise
+
+
+class ThrottledProgress:
+    """Progress of a parallel transfer, shared by its workers.
+
+    Workers add the bytes of each part without waiting; the callback runs in
+    a task of its own, at most once per PROGRESS_INTERVAL, with the running
+    total. A worker only waits when the previous report is still running
+    once the next one is due, which is how a bandwidth cap sleeping in the
+    callback (helper.bandwidth) paces the transfer.
+    """
+
+    def __init__(self, progress, progress_args, total, done=0):
+        self.progress = progress
+        self.progress_args = progress_args
+        self.total = total
+        self.done = done
+        self.reported_at = time.monotonic()
+        self.task = None
+
+    async def add(self, amount):
+        self.done += amount
+        if self.progress is None or time.monotonic() - self.reported_at < PROGRESS_INTERVAL:
+            return
+        task = self.task
+        if task is not None:
+            if not task.done():
+                await asyncio.shield(task)
+                if self.task is not task:
+                    # Another worker started the next report meanwhile
+                    return
+            task.result()
+        self.reported_at = time.monotonic()
+        self.task = asyncio.create_task(self.progress(self.done, self.total, *self.progress_args))
+
+    async def finish(self):
+        """Wait for the running report, then report the final count"""
+        if self.task is not None:
+            await self.task
+        if self.progress is not None:
+            await self.progress(self.done, self.total, *self.progress_args)
+
+    def close(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+def document_location(file_id):
+    """DC and InputDocumentFileLocation for a document, video or audio file_id"""
+    decoded = FileId.decode(file_id)
+    return decoded.dc_id, raw.types.InputDocumentFileLocation(
+        id=decoded.media_id,
+        access_hash=decoded.access_hash,
+        file_reference=decoded.file_reference,
+        thumb_size=decoded.thumbnail_size,
+    )
+
+
+def bitmap_path(file_name):
+    return f"{file_name}.parts"
+
+
+class PartBitmap:
+    """Completed parts of a download, one bit each, mirrored to a sidecar
+    file next to it so an interrupted download continues where it stopped.
+    load, open, mark, close and remove block; run them through fs.run."""
+
+    def __init__(self, file_name, total_parts):
+        self.path = bitmap_path(file_name)
+        self.bits = bytearray(-(-total_parts // 8))
+        self.fd = None
+        # Parts finish on several fs threads; a byte holds eight of them
+        self.lock = threading.Lock()
+
+    def load(self):
+        """Take over the bits saved by an earlier attempt, if any"""
+        try:
+            with open(self.path, "rb") as f:
+                saved = f.read()
+            if len(saved) == len(self.bits):
+                self.bits[:] = saved
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, part):
+        return bool(self.bits[part >> 3] & (1 << (part & 7)))
+
+    def count(self):
+        return sum(bin(byte).count("1") for byte in self.bits)
+
+    def clear(self):
+        self.bits[:] = bytes(len(self.bits))
+
+    def open(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        os.ftruncate(self.fd, len(self.bits))
+        os.pwrite(self.fd, self.bits, 0)
+
+    def mark(self, part):
+        index = part >> 3
+        with self.lock:
+            self.bits[index] |= 1 << (part & 7)
+            os.pwrite(self.fd, self.bits[index:index + 1], index)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+
+
+def preallocate(fd, size):
+    """Reserve the whole file up front so positional writes never extend it"""
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        os.ftruncate(fd, size)
+
+
+async def fetch_part(session, location, part):
+    r = await session.invoke(
+        raw.functions.upload.GetFile(location=location, offset=part * PART_SIZE, limit=PART_SIZE),
+        sleep_threshold=30
+    )
+    if isinstance(r, raw.types.upload.FileCdnRedirect):
+        raise CdnRedirect
+    return r.bytes
+
+
+async def fetch_parts(client, media, connections, parts, write, done=0, progress=None, progress_args=()):
+    """Fetch the given parts over several media sessions at once and hand
+    each to await write(part, data). Parts are handed out in order from a
+    shared iterator, so a slow session simply takes fewer of them."""
+    file_size = media.file_size
+    dc_id, location = document_location(media.file_id)
+    sessions = await session_pool(client).get(dc_id, connections)
+    parts = iter(parts)
+
+    reporter = ThrottledProgress(progress, progress_args, file_size, done)
+
+    async def worker(session):
+        for part in parts:
+            data = await fetch_part(session, location, part)
+            await write(part, data)
+            await reporter.add(len(data))
+
+    try:
+        await run_workers(worker(session) for session in sessions)
+        await reporter.finish()
+    finally:
+        reporter.close()
+
+
+def part_bytes(file_size, parts):
+    return sum(min(PART_SIZE, file_size - part * PART_SIZE) for part in parts)
+
+
+async def download_parallel(client, media, file_name, connections, progress=None, progress_args=()):
+    """Download to a preallocated file with a positional write per part.
+    Parts already marked in the file's PartBitmap are not fetched again."""
+    file_size = media.file_size
+    total_parts = -(-file_size // PART_SIZE)
+
+    bitmap = PartBitmap(file_name, total_parts)
+    await fs.run("open", bitmap.load)
+    resuming = bitmap.count() and await fs.exists(file_name) and await fs.getsize(file_name) == file_size
+    if not resuming:
+        bitmap.clear()
+    finished = [part for part in range(total_parts) if part in bitmap]
+    if resuming:
+        logger.info(f"Resuming download of {file_name} at {len(finished)}/{total_parts} parts")
+
+    fd = await fs.run("open", os.open, file_name, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        if not resuming:
+            await fs.run("preallocate", preallocate, fd, file_size)
+        await fs.run("open", bitmap.open)
+
+        def write_part(part, data):
+            os.pwrite(fd, data, part * PART_SIZE)
+            bitmap.mark(part)
+
+        async def write(part, data):
+            await fs.run("write", write_part, part, data)
+
+        await fetch_parts(
+            client, media, connections, (part for part in range(total_parts) if part not in bitmap), write,
+            part_bytes(file_size, finished), progress, progress_args
+        )
+        await fs.run("remove", bitmap.remove)
+    finally:
+        await fs.run("close", close_download, bitmap, fd)
+    return file_name
+
+
+def close_download(bitmap, fd):
+    bitmap.close()
+    os.close(fd)
+
+
+async def download_parallel_to_memory(client, media, buffer, connections, progress=None, progress_args=()):
+    """Download into a BytesIO of the file's size (see helper.memory.new_memory_file).
+    Finished parts are kept in buffer.parts so a retry skips them."""
+    file_size = media.file_size
+    total_parts = -(-file_size // PART_SIZE)
+    if not hasattr(buffer, "parts"):
+        buffer.parts = set()
+
+    with buffer.getbuffer() as view:
+        async def write(part, data):
+            view[part * PART_SIZE:part * PART_SIZE + len(data)] = data
+            buffer.parts.add(part)
+
+        await fetch_parts(
+            client, media, connections, [part for part in range(total_parts) if part not in buffer.parts], write,
+            part_bytes(file_size, buffer.parts), progress, progress_args
+        )
+    return buffer
+
+
+async def resume_on_failure(transfer, direction, description, trace=None):
+    """Run transfer() and call it again after a retryable failure, up to
+    TRANSFER_RETRIES times. The parallel engines keep their finished parts,
+    so each retry only moves what is still missing."""
+    attempt = 0
+    while True:
+        try:
+            return await transfer()
+        except RETRYABLE_ERRORS as e:
+            attempt += 1
+            if attempt > Config.TRANSFER_RETRIES:
+                raise
+            if isinstance(e, FloodWait):
+                metrics.record_floodwait(direction, e.value)
+                delay = e.value
+            else:
+                delay = Config.TRANSFER_RETRY_DELAY * attempt
+            metrics.TRANSFER_RESUMES.labels(direction).inc()
+            if trace:
+                trace.add_retry()
+                trace.add_wait(delay)
+            logger.warning(
+                f"{description} interrupted ({e}), resuming in {delay}s "
+                f"(retry {attempt}/{Config.TRANSFER_RETRIES})"
+            )
+            await asyncio.sleep(delay)
+
+
+async def download_media(client, media, file_name=None, progress=None, progress_args=(), trace=None, in_memory=False):
+    """Download a document, video or audio to file_name, or into a BytesIO
+    with in_memory. Files from PARALLEL_DOWNLOAD_MIN_MB up use several
+    connections; smaller ones and CDN-served files go through Pyrogram's own
+    sequential download."""
+    connections = Config.DOWNLOAD_CONNECTIONS
+    parallel = connections > 1 and (media.file_size or 0) >= Config.PARALLEL_DOWNLOAD_MIN_MB * PART_SIZE
+    buffer = new_memory_file(media.file_name or "file", media.file_size) if in_memory and parallel else None
+
+    async def transfer():
+        nonlocal parallel, buffer
+        if parallel:
+            try:
+                if in_memory:
+                    return await download_parallel_to_memory(
+                        client, media, buffer, connections, progress, progress_args
+                    )
+                return await download_parallel(client, media, file_name, connections, progress, progress_args)
+            except CdnRedirect:
+                logger.info(f"{media.file_id} is served from a CDN, using the sequential download")
+                parallel = False
+                if in_memory:
+                    # Pyrogram fills a BytesIO of its own, which the job's RAM reservation now covers
+                    buffer = None
+                else:
+                    await fs.remove(file_name)
+                    await fs.remove(bitmap_path(file_name))
+        return await client.download_media(
+            media, file_name=file_name or "downloads/", in_memory=in_memory,
+            progress=progress, progress_args=progress_args
+        )
+
+    description = f"Download of {file_name or media.file_name}"
+    return await resume_on_failure(transfer, "download", description, trace)
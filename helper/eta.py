@@ -0,0 +1,136 @@
+import time
+import logging
+from config import Config
+from .utils import TimeFormatter
+from .jobtrace import percentile
+
+logger = logging.getLogger(__name__)
+
+TRANSFER_STAGES = ("download", "upload")
+
+
+class Ewma:
+    """Exponentially weighted moving average; the first sample seeds it"""
+
+    __slots__ = ("alpha", "value", "samples")
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.value = None
+        self.samples = 0
+
+    def update(self, sample):
+        if self.value is None:
+            self.value = sample
+        else:
+            self.value += self.alpha * (sample - self.value)
+        self.samples += 1
+        return self.value
+
+
+class EtaModel:
+    """Online job duration estimate learned from finished job traces.
+
+    Download throughput is tracked globally and per source DC, upload
+    throughput globally (uploads always go to the bot's own DC), and every
+    other stage as a fixed overhead in seconds.
+    """
+
+    def __init__(self, alpha=None, default_speed=None, min_dc_samples=3):
+        self.alpha = alpha or Config.ETA_EWMA_ALPHA
+        self.default_speed = default_speed or Config.ETA_DEFAULT_SPEED_MB * 1024 * 1024
+        self.min_dc_samples = min_dc_samples
+        self.throughput = {direction: Ewma(self.alpha) for direction in TRANSFER_STAGES}
+        self.dc_throughput = {}
+        self.overhead = {}
+        self.error = Ewma(self.alpha)
+
+    def speed(self, direction, dc_id=None):
+        """Expected bytes/s for a transfer, preferring the DC figure once it has enough samples"""
+        if dc_id is not None:
+            dc = self.dc_throughput.get((direction, dc_id))
+            if dc is not None and dc.samples >= self.min_dc_samples:
+                return dc.value
+        overall = self.throughput[direction]
+        return overall.value if overall.value else self.default_speed
+
+    def estimate(self, file_size, dc_id=None):
+        """Expected wall time of a whole job in seconds"""
+        seconds = sum(ewma.value for ewma in self.overhead.values())
+        if file_size:
+            seconds += file_size / self.speed("download", dc_id)
+            seconds += file_size / self.speed("upload")
+        return seconds
+
+    def remaining(self, job, now=None):
+        """Expected seconds left for a job that is already running"""
+        elapsed = (now or time.time()) - (job.started_at or time.time())
+        return max(0.0, self.estimate(job.file_size, job.dc_id) - elapsed)
+
+    def observe(self, trace):
+        """Learn from a finished trace document (see JobTrace.to_document)"""
+        if trace.get("status") != "completed":
+            return
+        dc_id = trace.get("dc_id")
+        staged = 0.0
+        for stage in trace.get("stages", []):
+            duration = stage.get("duration")
+            if duration is None:
+                continue
+            staged += duration
+            name = stage["name"]
+            active = duration - (stage.get("wait") or 0)
+            if name in TRANSFER_STAGES:
+                if stage.get("bytes") and active > 0:
+                    rate = stage["bytes"] / active
+                    self.throughput[name].update(rate)
+                    if dc_id is not None:
+                        self.dc_throughput.setdefault((name, dc_id), Ewma(self.alpha)).update(rate)
+            else:
+                self.overhead.setdefault(name, Ewma(self.alpha)).update(duration)
+        if trace.get("duration"):
+            # Status messages and bookkeeping between stages
+            self.overhead.setdefault("other", Ewma(self.alpha)).update(max(0.0, trace["duration"] - staged))
+
+        predicted = trace.get("predicted_duration")
+        if predicted and trace.get("duration"):
+            self.error.update(abs(predicted - trace["duration"]) / trace["duration"])
+
+    def warm_up(self, traces):
+        """Seed the averages from stored traces, oldest first"""
+        for trace in reversed(traces):
+            self.observe(trace)
+        logger.info(f"ETA model warmed up from {len(traces)} job traces")
+
+    def snapshot(self):
+        return {
+            "download": self.throughput["download"].value,
+            "upload": self.throughput["upload"].value,
+            "dc_download": {
+                dc_id: ewma.value for (direction, dc_id), ewma in self.dc_throughput.items()
+                if direction == "download"
+            },
+            "overhead": {name: ewma.value for name, ewma in self.overhead.items()},
+            "relative_error": self.error.value,
+        }
+
+
+def format_eta(seconds):
+    if seconds is None:
+        return "unknown"
+    return TimeFormatter(milliseconds=round(seconds) * 1000) or "< 1ꜱ"
+
+
+def prediction_error(traces):
+    """Median and p90 relative error of stored ETA predictions against actual durations"""
+    errors = sorted(
+        abs(t["predicted_duration"] - t["duration"]) / t["duration"]
+        for t in traces
+        if t.get("predicted_duration") and t.get("duration") and t.get("status") == "completed"
+    )
+    if not errors:
+        return None
+    return {"count": len(errors), "p50": percentile(errors, 50), "p90": percentile(errors, 90)}
+
+
+eta_model = EtaModel()
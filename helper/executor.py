@@ -0,0 +1,41 @@
+import asyncio
+import logging
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundExecutor:
+    """Runs the long part of a command outside Pyrogram's handler workers.
+
+    Handlers validate, hand the work to submit() and return, so a small
+    worker pool keeps answering /start, /queue and callback queries while
+    renames, sequence sends and broadcasts run here.
+    """
+
+    def __init__(self):
+        self.tasks = set()
+
+    def submit(self, coro, kind):
+        """Start coro as a background task of the given kind and return the task"""
+        task = asyncio.create_task(self._run(coro, kind))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _run(self, coro, kind):
+        metrics.BACKGROUND_TASKS.labels(kind).inc()
+        try:
+            await coro
+        except Exception:
+            logger.exception(f"Background {kind} task failed")
+        finally:
+            metrics.BACKGROUND_TASKS.labels(kind).dec()
+
+    async def join(self):
+        """Wait until nothing is running, including tasks submitted meanwhile"""
+        while self.tasks:
+            await asyncio.wait(list(self.tasks))
+
+
+background = BackgroundExecutor()
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import shutil
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from config import Config
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DOWNLOADS_DIR = "downloads"
+# Job thumbnails, downloads/thumbs/<job_id>.jpg
+THUMBS_DIR = "thumbs"
+
+# Blocking filesystem calls run here instead of on the event loop, so a
+# slow disk (or network storage) delays only the job that touches it
+_executor = ThreadPoolExecutor(max_workers=Config.FS_THREADS, thread_name_prefix="fs")
+_deletions = set()
+
+metrics.FS_PENDING_DELETIONS.set_function(lambda: len(_deletions))
+
+
+async def run(op, func, *args):
+    """Run func(*args) on the filesystem pool, timed under op"""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, func, *args)
+    except Exception:
+        metrics.FS_FAILURES.labels(op).inc()
+        raise
+    finally:
+        metrics.FS_SECONDS.labels(op).observe(time.perf_counter() - start)
+
+
+async def makedirs(path):
+    await run("makedirs", lambda: os.makedirs(path, exist_ok=True))
+
+
+async def rename(src, dst):
+    await run("rename", os.rename, src, dst)
+
+
+async def getsize(path):
+    return await run("getsize", os.path.getsize, path)
+
+
+async def exists(path):
+    return await run("exists", os.path.exists, path)
+
+
+async def disk_usage(path):
+    return await run("disk_usage", shutil.disk_usage, path)
+
+
+def _delete(path):
+    # Already gone (the janitor swept it, or the job cleaned up first) is not a
+    # failure, so it never reaches the FS_FAILURES count in run()
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def remove(path):
+    """Delete a file or a whole directory now; a missing path is fine"""
+    await run("remove", _delete, path)
+
+
+def remove_later(path):
+    """Delete a file or directory in the background; the caller does not wait.
+    Failures are logged, pending deletions can be awaited with drain()."""
+    async def delete():
+        try:
+            await remove(path)
+        except OSError as e:
+            logger.warning(f"Deferred deletion of {path} failed: {e}")
+
+    task = asyncio.create_task(delete())
+    _deletions.add(task)
+    task.add_done_callback(_deletions.discard)
+    return task
+
+
+async def drain():
+    """Wait for the deferred deletions still running"""
+    if _deletions:
+        await asyncio.gather(*_deletions, return_exceptions=True)
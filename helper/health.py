@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+import logging
+from config import Config
+from . import metrics, startup, fs
+from .fs import DOWNLOADS_DIR
+from .database import codeflixbots
+from .scheduler import scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagSampler:
+    """Measures how late the event loop wakes up from a fixed sleep"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.window_lag = 0.0
+        self.last_sample = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.window_lag = max(self.window_lag, lag)
+            self.last_sample = time.monotonic()
+            metrics.EVENT_LOOP_LAG.set(lag)
+            if lag > Config.READY_MAX_LOOP_LAG:
+                logger.warning(f"Event loop lagged {lag:.3f}s")
+
+    def current_lag(self):
+        """Last measured lag, or time since the last sample if the sampler itself is stuck"""
+        if self.last_sample is None:
+            return 0.0
+        overdue = time.monotonic() - self.last_sample - self.interval
+        return max(self.last_lag, overdue)
+
+    def take_window_lag(self):
+        """Worst lag since the previous call, including a sampler that is stuck right now"""
+        lag = max(self.window_lag, self.current_lag())
+        self.window_lag = 0.0
+        return lag
+
+
+loop_lag_sampler = LoopLagSampler(Config.LOOP_LAG_SAMPLE_INTERVAL)
+
+
+async def check_mongo():
+    """Ping MongoDB, returns (ok, latency seconds, error)"""
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(codeflixbots.ping(), timeout=Config.READY_MAX_MONGO_LATENCY * 2)
+    except Exception as e:
+        return False, time.perf_counter() - start, str(e) or type(e).__name__
+    latency = time.perf_counter() - start
+    return latency <= Config.READY_MAX_MONGO_LATENCY, latency, None
+
+
+async def check_disk():
+    """Free space where downloads are written, returns (ok, free MB)"""
+    path = DOWNLOADS_DIR if await fs.run("isdir", os.path.isdir, DOWNLOADS_DIR) else "."
+    free_mb = (await fs.disk_usage(path)).free // (1024 * 1024)
+    return free_mb >= Config.READY_MIN_DISK_FREE_MB, free_mb
+
+
+def scheduler_saturation():
+    """Active plus queued jobs relative to the processing capacity"""
+    capacity = max(1, scheduler.capacity)
+    return (metrics.ACTIVE_JOBS.get() + metrics.QUEUED_JOBS.get()) / capacity
+
+
+def liveness():
+    """Cheap liveness verdict: the loop is running and not badly stalled"""
+    lag = loop_lag_sampler.current_lag()
+    ok = lag <= Config.HEALTH_MAX_LOOP_LAG
+    return ok, {
+        "status": "ok" if ok else "stalled",
+        "event_loop_lag_seconds": round(lag, 4),
+        "event_loop_max_lag_seconds": round(loop_lag_sampler.max_lag, 4),
+        "uptime_seconds": int(time.time() - Config.BOT_UPTIME),
+    }
+
+
+async def readiness(bot=None):
+    """Full readiness verdict with every dependency check"""
+    checks = {}
+
+    checks["startup"] = {"ok": startup.is_ready()}
+
+    telegram_ok = bool(bot is not None and bot.is_connected)
+    checks["telegram"] = {"ok": telegram_ok, "connected": telegram_ok}
+
+    mongo_ok, mongo_latency, mongo_error = await check_mongo()
+    checks["mongo"] = {"ok": mongo_ok, "latency_seconds": round(mongo_latency, 4)}
+    if mongo_error:
+        checks["mongo"]["error"] = mongo_error
+
+    lag = loop_lag_sampler.current_lag()
+    checks["event_loop"] = {"ok": lag <= Config.READY_MAX_LOOP_LAG, "lag_seconds": round(lag, 4)}
+
+    disk_ok, free_mb = await check_disk()
+    checks["disk"] = {"ok": disk_ok, "free_mb": free_mb}
+
+    saturation = scheduler_saturation()
+    checks["scheduler"] = {"ok": saturation <= Config.READY_MAX_SATURATION, "saturation": round(saturation, 3)}
+
+    ok = all(check["ok"] for check in checks.values())
+    return ok, {"status": "ready" if ok else "not_ready", "checks": checks}
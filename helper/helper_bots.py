@@ -0,0 +1,146 @@
+import time
+import logging
+from pyrogram import Client
+from config import Config
+from . import metrics
+from .uploader import ParallelUploadMixin
+
+logger = logging.getLogger(__name__)
+
+
+class HelperClient(ParallelUploadMixin, Client):
+
+    def __init__(self, index, bot_token, name=None):
+        super().__init__(
+            name=name or f"codeflixbots_helper{index}",
+            api_id=Config.API_ID,
+            api_hash=Config.API_HASH,
+            bot_token=bot_token,
+            no_updates=True,
+            # FloodWait is raised instead of slept, so the upload can move to another helper
+            sleep_threshold=0,
+        )
+
+
+class HelperBot:
+    """One helper account: its client, what it is uploading and its own FloodWait state"""
+
+    __slots__ = ("index", "client", "active", "active_bytes", "uploads", "floodwaits", "blocked_until")
+
+    def __init__(self, index, client):
+        self.index = index
+        self.client = client
+        self.active = 0
+        self.active_bytes = 0
+        self.uploads = 0
+        self.floodwaits = 0
+        self.blocked_until = 0.0
+
+    @property
+    def name(self):
+        return f"helper{self.index}"
+
+    def available(self, now):
+        return self.blocked_until <= now
+
+    def block(self, seconds):
+        """Keep new uploads off this account until its FloodWait is over"""
+        self.floodwaits += 1
+        self.blocked_until = max(self.blocked_until, time.time() + max(seconds, 1))
+        metrics.record_floodwait(self.name, seconds)
+
+
+class HelperBotPool:
+    """Extra bot accounts (HELPER_BOT_TOKENS) that take uploads off the primary bot.
+
+    A helper uploads the renamed file to HELPER_UPLOAD_CHAT, a channel where
+    it and the primary bot are admins. The primary bot reads that message
+    back, which gives it a file_id of its own, and delivers the file to the
+    user with send_cached_media, which moves no file bytes. Each helper
+    keeps its own FloodWait state: an account that is flood-limited gets no
+    uploads until the wait is over, and the upload moves to the least loaded
+    other helper, as does an upload that fails on a helper for any other
+    reason. When no helper is available the primary uploads as before.
+    """
+
+    def __init__(self, tokens=None, chat_id=None):
+        self.tokens = Config.HELPER_BOT_TOKENS if tokens is None else tokens
+        self.chat_id = Config.HELPER_UPLOAD_CHAT if chat_id is None else chat_id
+        self.helpers = []
+        metrics.HELPER_BOTS_AVAILABLE.set_function(lambda: sum(h.available(time.time()) for h in self.helpers))
+
+    @property
+    def configured(self):
+        return bool(self.tokens and self.chat_id)
+
+    @property
+    def enabled(self):
+        return bool(self.helpers)
+
+    async def start(self, client_factory=HelperClient):
+        """Log every helper in; one that fails to start is left out"""
+        for index, token in enumerate(self.tokens):
+            client = client_factory(index, token)
+            try:
+                await client.start()
+            except Exception as e:
+                logger.error(f"Helper bot {index} could not start, uploads skip it: {e}")
+                continue
+            self.helpers.append(HelperBot(index, client))
+        logger.info(f"{len(self.helpers)}/{len(self.tokens)} helper bots ready for uploads")
+
+    async def stop(self):
+        for helper in self.helpers:
+            try:
+                await helper.client.stop()
+            except Exception as e:
+                logger.warning(f"Could not stop {helper.name}: {e}")
+        self.helpers.clear()
+
+    def acquire(self, size, exclude=()):
+        """The least loaded helper that is not flood-limited and not in exclude,
+        or None for the primary to upload"""
+        now = time.time()
+        candidates = [helper for helper in self.helpers if helper.available(now) and helper not in exclude]
+        if not candidates:
+            return None
+        helper = min(candidates, key=lambda helper: (helper.active, helper.active_bytes))
+        helper.active += 1
+        helper.active_bytes += size
+        return helper
+
+    def release(self, helper, size, status):
+        helper.active -= 1
+        helper.active_bytes -= size
+        if status == "completed":
+            helper.uploads += 1
+        metrics.HELPER_UPLOADS.labels(helper.name, status).inc()
+
+    async def deliver(self, client, helper, staged, chat_id, topic_id=None, caption=None):
+        """Send what a helper uploaded to chat_id from the primary bot, by file_id"""
+        message = (await client.get_messages(self.chat_id, [staged.id]))[0]
+        media = message.document or message.video or message.audio or message.photo
+        sent = await client.send_cached_media(
+            chat_id=chat_id, file_id=media.file_id, caption=caption, message_thread_id=topic_id
+        )
+        try:
+            await helper.client.delete_messages(self.chat_id, staged.id)
+        except Exception as e:
+            logger.warning(f"Could not remove staged upload {staged.id} of {helper.name}: {e}")
+        return sent
+
+    def snapshot(self):
+        now = time.time()
+        return [
+            {
+                "name": helper.name,
+                "active": helper.active,
+                "uploads": helper.uploads,
+                "floodwaits": helper.floodwaits,
+                "blocked_for": max(0.0, helper.blocked_until - now),
+            }
+            for helper in self.helpers
+        ]
+
+
+helper_pool = HelperBotPool()
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+import logging
+from config import Config
+from . import metrics, fs
+from .fs import DOWNLOADS_DIR, THUMBS_DIR
+from .jobstate import job_registry
+
+logger = logging.getLogger(__name__)
+
+
+def _owner(name):
+    """Job id a downloads/ entry belongs to: downloads/<job_id>/ or thumbs/<job_id>.jpg"""
+    return name.split(".", 1)[0]
+
+
+def _measure(path):
+    """Total size and newest modification time of a file or a directory tree"""
+    stat = os.lstat(path)
+    if not os.path.isdir(path) or os.path.islink(path):
+        return stat.st_size, stat.st_mtime
+    size, newest = 0, stat.st_mtime
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            size += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    return size, newest
+
+
+class Janitor:
+    """Deletes what crashed or interrupted jobs left in downloads/.
+
+    Job directories and thumbnails are named after their job, so anything
+    whose job is not running or queued in the registry, and that has not
+    been written to for max_age seconds, is an orphan.
+    """
+
+    def __init__(self, registry, root=DOWNLOADS_DIR, max_age=None, interval=None):
+        self.registry = registry
+        self.root = root
+        self.max_age = max_age or Config.JANITOR_MAX_AGE_MINUTES * 60
+        self.interval = interval or Config.JANITOR_INTERVAL_MINUTES * 60
+        self.runs = 0
+        self.removed = 0
+        self.reclaimed = 0
+        self.last_run = None
+        self.last_reclaimed = 0
+
+    def scan(self, live, now):
+        """Orphaned entries as (path, size); runs on the filesystem pool"""
+        orphans = []
+        for directory in (self.root, os.path.join(self.root, THUMBS_DIR)):
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.name == THUMBS_DIR and directory == self.root:
+                    continue
+                if _owner(entry.name) in live:
+                    continue
+                try:
+                    size, mtime = _measure(entry.path)
+                except FileNotFoundError:
+                    continue
+                if now - mtime >= self.max_age:
+                    orphans.append((entry.path, size))
+        return orphans
+
+    async def sweep(self):
+        """One pass; returns the bytes reclaimed"""
+        orphans = await fs.run("janitor_scan", self.scan, self.registry.live_job_ids(), time.time())
+        reclaimed = 0
+        for path, size in orphans:
+            try:
+                await fs.remove(path)
+            except OSError as e:
+                logger.warning(f"Janitor could not remove {path}: {e}")
+                continue
+            reclaimed += size
+            self.removed += 1
+        self.runs += 1
+        self.last_run = time.time()
+        self.last_reclaimed = reclaimed
+        self.reclaimed += reclaimed
+        metrics.JANITOR_RECLAIMED_BYTES.inc(reclaimed)
+        if orphans:
+            logger.info(f"Janitor removed {len(orphans)} orphaned entries, reclaimed {reclaimed} bytes")
+        return reclaimed
+
+    async def run(self):
+        """Sweep at startup and then every interval"""
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Janitor sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def snapshot(self):
+        return {
+            "runs": self.runs,
+            "removed": self.removed,
+            "reclaimed": self.reclaimed,
+            "last_run": self.last_run,
+            "last_reclaimed": self.last_reclaimed,
+        }
+
+
+janitor = Janitor(job_registry)
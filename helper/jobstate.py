@@ -0,0 +1,259 @@
+import heapq
+import itertools
+import time
+import logging
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+ACTIVE = "active"
+FINISHED = "finished"
+
+
+class Job:
+    """One rename request, from the moment it is accepted until it finishes"""
+
+    __slots__ = (
+        "job_id", "user_id", "file_name", "original_filename", "file_size", "dc_id",
+        "lane", "message", "file_message", "state", "enqueued_at", "started_at", "recovered_file",
+        "recoveries", "lease_lost",
+    )
+
+    def __init__(self, job_id, user_id, file_name, original_filename=None, file_size=0, dc_id=None,
+                 lane="default", message=None, file_message=None):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.file_name = file_name
+        self.original_filename = original_filename or file_name
+        self.file_size = file_size or 0
+        self.dc_id = dc_id
+        self.lane = lane
+        self.message = message
+        self.file_message = file_message
+        self.state = None
+        self.enqueued_at = None
+        self.started_at = None
+        # A finished download from before a restart, used instead of downloading again
+        self.recovered_file = None
+        # Times the job was cut short by a crash or a lost transfer worker
+        self.recoveries = 0
+        # Cluster mode: another node claimed the job after this one failed to renew its lease
+        self.lease_lost = False
+
+
+class UserJobs:
+    """Per-user slots: running and waiting jobs keyed by job_id, in arrival order"""
+
+    __slots__ = (
+        "user_id", "active", "queued", "total_processed", "successful", "failed",
+        "current_operation", "last_update",
+    )
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.active = {}
+        self.queued = {}
+        self.total_processed = 0
+        self.successful = 0
+        self.failed = 0
+        self.current_operation = None
+        self.last_update = time.time()
+
+    @property
+    def busy(self):
+        return bool(self.active or self.queued)
+
+    @property
+    def load(self):
+        return len(self.active) + len(self.queued)
+
+
+class JobRegistry:
+    """In-memory job state for every user, bounded by an LRU cap on idle users.
+
+    Every insert and removal is a dict operation, and the global counters are
+    updated on each transition so status commands never rescan all users.
+    """
+
+    def __init__(self, max_users=None):
+        self.max_users = max_users or Config.JOB_STATE_MAX_USERS
+        self._users = OrderedDict()
+        self._busy = {}
+        self._queue = {}
+        self._ids = itertools.count(1)
+        self.active_count = 0
+        self.queued_count = 0
+        self.active_bytes = 0
+        self.queued_bytes = 0
+        self.total_processed = 0
+        self.successful = 0
+        self.failed = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._users)
+
+    def new_job_id(self, user_id):
+        return f"{user_id}_{int(time.time())}_{next(self._ids)}"
+
+    # -- lookups
+
+    def get(self, user_id):
+        """The user's slots, or None when the user has no state"""
+        return self._users.get(user_id)
+
+    def user(self, user_id):
+        """The user's slots, created on first use and marked recently used"""
+        state = self._users.get(user_id)
+        if state is None:
+            self._evict(room=1)
+            state = self._users[user_id] = UserJobs(user_id)
+        else:
+            self._users.move_to_end(user_id)
+        return state
+
+    def active_jobs(self, user_id):
+        state = self._users.get(user_id)
+        return list(state.active.values()) if state else []
+
+    def queued_jobs(self, user_id):
+        state = self._users.get(user_id)
+        return list(state.queued.values()) if state else []
+
+    def queued(self):
+        """All waiting jobs, oldest first"""
+        return self._queue.values()
+
+    def live_job_ids(self):
+        """Ids of every running or waiting job"""
+        return {job_id for state in self._busy.values() for job_id in (*state.active, *state.queued)}
+
+    def busy_users(self):
+        return len(self._busy)
+
+    def busy_states(self):
+        """Slots of every user with running or waiting jobs"""
+        return self._busy.values()
+
+    def top_users(self, count=5):
+        """Users with the most active plus queued jobs"""
+        return heapq.nlargest(count, self._busy.values(), key=lambda state: state.load)
+
+    # -- transitions
+
+    def enqueue(self, job):
+        """Park a job in its user's queue and return its position there (1-based)"""
+        state = self.user(job.user_id)
+        job.state = QUEUED
+        job.enqueued_at = time.time()
+        state.queued[job.job_id] = job
+        self._queue[job.job_id] = job
+        self.queued_count += 1
+        self.queued_bytes += job.file_size
+        self._touch(state)
+        return len(state.queued)
+
+    def start(self, job):
+        """Move a job into an active slot, taking it out of the queue if it was waiting"""
+        state = self.user(job.user_id)
+        if job.state == QUEUED:
+            self._unqueue(state, job)
+        job.state = ACTIVE
+        job.started_at = time.time()
+        state.active[job.job_id] = job
+        state.current_operation = f"Processing {job.file_name}"
+        self.active_count += 1
+        self.active_bytes += job.file_size
+        self._touch(state)
+
+    def finish(self, job, status):
+        """Release the job's slot and count it as completed or failed. A
+        checkpointed job is not counted, it runs again after a restart."""
+        state = self._users.get(job.user_id)
+        if state is None or state.active.pop(job.job_id, None) is None:
+            return
+        job.state = FINISHED
+        self.active_count -= 1
+        self.active_bytes -= job.file_size
+        if status != "checkpointed":
+            state.total_processed += 1
+            self.total_processed += 1
+            if status == "completed":
+                state.successful += 1
+                self.successful += 1
+            else:
+                state.failed += 1
+                self.failed += 1
+        if not state.active:
+            state.current_operation = None
+        self._touch(state)
+
+    def requeue(self, job):
+        """Put a running job back in its user's queue without counting it as finished"""
+        state = self._users.get(job.user_id)
+        if state is None or state.active.pop(job.job_id, None) is None:
+            return
+        self.active_count -= 1
+        self.active_bytes -= job.file_size
+        job.state = None
+        self.enqueue(job)
+
+    def clear_queue(self, user_id):
+        """Drop every waiting job of a user; running jobs are left alone"""
+        state = self._users.get(user_id)
+        if not state:
+            return []
+        removed = list(state.queued.values())
+        for job in removed:
+            self._unqueue(state, job)
+            job.state = FINISHED
+        self._touch(state)
+        return removed
+
+    def _unqueue(self, state, job):
+        del state.queued[job.job_id]
+        del self._queue[job.job_id]
+        self.queued_count -= 1
+        self.queued_bytes -= job.file_size
+
+    def _touch(self, state):
+        state.last_update = time.time()
+        if state.busy:
+            self._busy[state.user_id] = state
+        else:
+            self._busy.pop(state.user_id, None)
+
+    def _evict(self, room=0):
+        """Drop least recently used idle users until the cap holds with room to spare"""
+        limit = self.max_users - room
+        checked = 0
+        while len(self._users) > limit and checked < len(self._users):
+            user_id, state = next(iter(self._users.items()))
+            if state.busy:
+                # Never drop a user with live jobs; rotate it behind the idle ones
+                self._users.move_to_end(user_id)
+                checked += 1
+                continue
+            del self._users[user_id]
+            self.evicted += 1
+        if len(self._users) > limit:
+            logger.warning(f"Job state holds {len(self._users)} users, all busy (cap {self.max_users})")
+
+    def snapshot(self):
+        return {
+            "users": len(self._users),
+            "busy_users": len(self._busy),
+            "active": self.active_count,
+            "queued": self.queued_count,
+            "active_bytes": self.active_bytes,
+            "queued_bytes": self.queued_bytes,
+            "total_processed": self.total_processed,
+            "successful": self.successful,
+            "failed": self.failed,
+            "evicted": self.evicted,
+        }
+
+
+job_registry = JobRegistry()
@@ -0,0 +1,119 @@
+import math
+import time
+import logging
+from datetime import datetime
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("download", "rename", "thumbnail", "metadata", "upload")
+
+
+class JobTrace:
+    """Stage-by-stage timing record for one rename job"""
+
+    def __init__(self, job_id, user_id, file_name, file_size=0):
+        self.job_id = job_id
+        self.user_id = user_id
+        self.file_name = file_name
+        self.file_size = file_size
+        self.dc_id = None
+        self.predicted_duration = None
+        self.started_at = datetime.now()
+        self.status = "running"
+        self.error = None
+        self.stages = []
+        self._current = None
+        self._start = time.perf_counter()
+
+    def start_stage(self, name):
+        """Begin a stage, closing the previous one if it is still open"""
+        if self._current is not None:
+            self.end_stage()
+        self._current = {
+            "name": name,
+            "start": time.perf_counter() - self._start,
+            "end": None,
+            "duration": None,
+            "bytes": 0,
+            "throughput": None,
+            "retries": 0,
+            "wait": 0.0,
+        }
+
+    def end_stage(self, bytes=0):
+        """Close the open stage and feed its duration into the metrics"""
+        stage = self._current
+        if stage is None:
+            return
+        stage["end"] = time.perf_counter() - self._start
+        stage["duration"] = stage["end"] - stage["start"]
+        stage["bytes"] = bytes
+        if bytes and stage["duration"] > 0:
+            stage["throughput"] = bytes / stage["duration"]
+        self.stages.append(stage)
+        self._current = None
+        metrics.JOB_STAGE_SECONDS.labels(stage["name"]).observe(stage["duration"])
+
+    def add_retry(self):
+        if self._current is not None:
+            self._current["retries"] += 1
+
+    def add_wait(self, seconds):
+        """Record time slept inside the open stage, e.g. for FloodWait"""
+        if self._current is not None:
+            self._current["wait"] += seconds
+
+    def finish(self, status, error=None):
+        if self._current is not None:
+            self.end_stage()
+        self.status = status
+        self.error = error
+
+    def total_duration(self):
+        return time.perf_counter() - self._start
+
+    def to_document(self):
+        return {
+            "job_id": self.job_id,
+            "user_id": self.user_id,
+            "file_name": self.file_name,
+            "file_size": self.file_size,
+            "dc_id": self.dc_id,
+            "predicted_duration": self.predicted_duration,
+            "started_at": self.started_at,
+            "duration": self.total_duration(),
+            "status": self.status,
+            "error": self.error,
+            "stages": self.stages,
+        }
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def aggregate_stages(traces):
+    """p50/p95/p99 duration per stage over a list of trace documents"""
+    durations = {}
+    for trace in traces:
+        for stage in trace.get("stages", []):
+            if stage.get("duration") is not None:
+                durations.setdefault(stage["name"], []).append(stage["duration"])
+        if trace.get("duration") is not None:
+            durations.setdefault("total", []).append(trace["duration"])
+
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+        }
+    return summary
@@ -0,0 +1,127 @@
+import time
+import logging
+from config import Config
+from .database import codeflixbots
+
+logger = logging.getLogger(__name__)
+
+RESUMED_TEXT = "♻️ The bot restarted, your file `{name}` is back in the queue."
+LOST_TEXT = "❌ The bot restarted and your file `{name}` could not be resumed. Please send it again."
+FAILED_TEXT = "❌ Could not process `{name}`. Please send it again."
+
+
+def journal_document(job, state):
+    """What it takes to run a job again in a new process: its messages and the new name"""
+    now = time.time()
+    return {
+        "_id": job.job_id,
+        "user_id": job.user_id,
+        "chat_id": job.message.chat.id,
+        "message_id": job.message.id,
+        "file_chat_id": job.file_message.chat.id,
+        "file_message_id": job.file_message.id,
+        "file_name": job.file_name,
+        "file_size": job.file_size,
+        "state": state,
+        "stage": None,
+        "file_path": None,
+        "progress_chat_id": None,
+        "progress_message_id": None,
+        "checkpointed": False,
+        "recoveries": 0,
+        # Cluster mode: the node running the job and until when it may (see helper.cluster)
+        "owner": None,
+        "lease_until": None,
+        "accepted_at": now,
+        "updated_at": now,
+    }
+
+
+class JobJournal:
+    """Write-ahead log of every accepted job, in the job_journal collection.
+
+    A job is written when it is accepted and updated on every stage
+    transition, before the stage runs; the entry is removed once the job is
+    over. Whatever is left at startup was cut short by a crash, a kill or a
+    /restart, and recover() hands it back to the rename pipeline, which
+    reuses a finished download that is still on disk.
+    """
+
+    def __init__(self):
+        # Called with (client, document) to queue a journaled job again; returns False if it cannot
+        self.resume = None
+
+    async def accept(self, job, state):
+        await codeflixbots.journal_job(journal_document(job, state))
+
+    async def stage(self, job, stage, file_path=None, progress=None):
+        fields = {"state": "active", "stage": stage, "updated_at": time.time()}
+        if file_path is not None:
+            fields["file_path"] = file_path
+        if progress is not None:
+            fields["progress_chat_id"] = progress.chat.id
+            fields["progress_message_id"] = progress.id
+        await codeflixbots.update_journal(job.job_id, fields)
+
+    async def checkpoint(self, job):
+        """Mark a job stopped on purpose by a restart, so recovery does not count it as a crash.
+        It goes back to queued, where another cluster node can claim it right away."""
+        return await codeflixbots.update_journal(job.job_id, {
+            "checkpointed": True, "state": "queued", "owner": None, "lease_until": None, "updated_at": time.time(),
+        })
+
+    async def requeue(self, job, recoveries):
+        await codeflixbots.update_journal(job.job_id, {
+            "state": "queued", "checkpointed": False, "recoveries": recoveries, "updated_at": time.time(),
+        })
+
+    async def finish(self, job):
+        await codeflixbots.remove_journal(job.job_id)
+
+    async def drop(self, client, document, text=LOST_TEXT):
+        """Give up on a journaled job and tell its user"""
+        await codeflixbots.remove_journal(document["_id"])
+        await self.notify(client, document, text)
+
+    async def notify(self, client, document, text):
+        """Replace the job's stale progress message, or reply to the file if it never had one"""
+        text = text.format(name=document["file_name"])
+        try:
+            if document.get("progress_message_id"):
+                await client.edit_message_text(document["progress_chat_id"], document["progress_message_id"], text)
+            else:
+                await client.send_message(
+                    document["file_chat_id"], text, reply_to_message_id=document["file_message_id"]
+                )
+        except Exception as e:
+            logger.warning(f"Could not notify user {document['user_id']} about job {document['_id']}: {e}")
+
+    async def recover(self, client):
+        """Resume every job the journal still holds; returns how many went back to the queue.
+
+        A job that was running when the bot crashed counts a recovery; one
+        that keeps crashing the bot is dropped after JOURNAL_MAX_RECOVERIES.
+        Queued jobs never started, so they count nothing.
+        """
+        documents = await codeflixbots.get_journal()
+        resumed = 0
+        for document in documents:
+            recoveries = document.get("recoveries", 0) + (1 if document.get("state") == "active" else 0)
+            document["recoveries"] = recoveries
+            ok = False
+            if self.resume is not None and recoveries <= Config.JOURNAL_MAX_RECOVERIES:
+                try:
+                    ok = await self.resume(client, document)
+                except Exception as e:
+                    logger.error(f"Could not resume journaled job {document['_id']}: {e}")
+            if ok:
+                resumed += 1
+                await self.notify(client, document, RESUMED_TEXT)
+            else:
+                await self.drop(client, document)
+        if documents:
+            logger.info(f"Recovered {resumed}/{len(documents)} journaled jobs")
+        return resumed
+
+
+job_journal = JobJournal()
@@ -0,0 +1,71 @@
+import io
+from config import Config
+from . import metrics, fs
+
+MiB = 1024 * 1024
+
+
+class MemoryBudget:
+    """Bytes of file content held in RAM by in-memory transfers at once.
+    A job that does not fit is not made to wait, it just uses the disk."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.granted = 0
+        self.refused = 0
+
+    def try_reserve(self, size):
+        if size > self.limit - self.used:
+            self.refused += 1
+            return False
+        self.used += size
+        self.peak = max(self.peak, self.used)
+        self.granted += 1
+        return True
+
+    def release(self, size):
+        self.used = max(0, self.used - size)
+
+    def snapshot(self):
+        return {
+            "limit": self.limit,
+            "used": self.used,
+            "peak": self.peak,
+            "granted": self.granted,
+            "refused": self.refused,
+        }
+
+
+def new_memory_file(name, size):
+    """A BytesIO of the given size, zero-filled with a single allocation"""
+    buffer = io.BytesIO()
+    if size:
+        buffer.seek(size - 1)
+        buffer.write(b"\0")
+        buffer.seek(0)
+    buffer.name = name
+    return buffer
+
+
+def is_memory_file(file):
+    return isinstance(file, io.BytesIO)
+
+
+async def file_size(file):
+    """Size of a path or an in-memory file"""
+    if is_memory_file(file):
+        return file.getbuffer().nbytes
+    return await fs.getsize(file)
+
+
+def use_memory(size):
+    """Whether a file of this size should skip the disk, reserving its RAM if so"""
+    if not size or size > Config.IN_MEMORY_MAX_MB * MiB:
+        return False
+    return memory_budget.try_reserve(size)
+
+
+memory_budget = MemoryBudget(Config.IN_MEMORY_BUDGET_MB * MiB)
+metrics.IN_MEMORY_BYTES.set_function(lambda: memory_budget.used)
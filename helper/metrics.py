@@ -0,0 +1,312 @@
+import bisect
+import time
+from pymongo import monitoring
+
+# Minimal Prometheus text-format metrics. Each update is a dict lookup plus an
+# add, cheap enough to sit on the per-chunk transfer path.
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        if not self.labelnames:
+            self._children[()] = self._new_child()
+        _registry.append(self)
+
+    def labels(self, *values):
+        """Get the child series for the given label values"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _default(self):
+        return self._children[()]
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, child in list(self._children.items()):
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def total(self):
+        """Sum over every label combination"""
+        return sum(child.value for child in list(self._children.values()))
+
+    def values(self):
+        """Current value of every series, keyed by label values"""
+        return {values: child.value for values, child in list(self._children.items())}
+
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set_function(self, function):
+        """Compute the value at scrape time instead of tracking it"""
+        self.function = function
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+    def render(self, name, labelnames, values):
+        value = self.value
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                value = float("nan")
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+    def get(self):
+        return self._default().get()
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def render(self, name, labelnames, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            labels = _format_labels(labelnames, values, ("le", _format_value(float(bound))))
+            lines.append(f"{name}_bucket{labels} {cumulative}")
+        labels = _format_labels(labelnames, values, ("le", "+Inf"))
+        lines.append(f"{name}_bucket{labels} {self.count}")
+        labels = _format_labels(labelnames, values)
+        lines.append(f"{name}_sum{labels} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{labels} {self.count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("child", "start")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+def render():
+    """Render every registered metric in Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Rename pipeline
+JOBS = Counter("renamebot_jobs_total", "Rename jobs finished, by result", ["status"])
+JOB_STAGE_SECONDS = Histogram("renamebot_job_stage_seconds", "Time spent in each rename stage", ["stage"])
+ACTIVE_JOBS = Gauge("renamebot_active_jobs", "Rename jobs currently being processed")
+QUEUED_JOBS = Gauge("renamebot_queued_jobs", "Rename jobs waiting in user queues")
+CONCURRENCY_LIMIT = Gauge("renamebot_concurrency_limit", "Jobs allowed to run at once")
+CONCURRENCY_ADJUSTMENTS = Counter(
+    "renamebot_concurrency_adjustments_total", "Changes made by the adaptive concurrency controller", ["direction"]
+)
+TRANSFER_WORKERS = Gauge("renamebot_transfer_workers", "Transfer worker processes connected to this bot")
+BACKGROUND_TASKS = Gauge("renamebot_background_tasks", "Work running outside the handler workers, by kind", ["kind"])
+QUEUE_WAIT_SECONDS = Histogram("renamebot_queue_wait_seconds", "Time a job waited for a slot, by lane", ["lane"])
+ACTIVE_TRANSFERS = Gauge("renamebot_active_transfers", "Downloads and uploads in flight", ["direction"])
+TRANSFER_BYTES = Counter("renamebot_transfer_bytes_total", "Bytes moved to or from Telegram", ["direction"])
+IN_MEMORY_BYTES = Gauge("renamebot_in_memory_bytes", "File content held in RAM by in-memory transfers")
+TRANSFER_RESUMES = Counter(
+    "renamebot_transfer_resumes_total", "Interrupted transfers resumed from their finished parts", ["direction"]
+)
+HELPER_UPLOADS = Counter("renamebot_helper_uploads_total", "Uploads done by helper bots, by helper and result", ["helper", "status"])
+HELPER_BOTS_AVAILABLE = Gauge("renamebot_helper_bots_available", "Helper bots not waiting out a FloodWait")
+FLOODWAITS = Counter("renamebot_floodwait_total", "FloodWait errors received", ["source"])
+FLOODWAIT_SECONDS = Counter("renamebot_floodwait_seconds_total", "Seconds slept because of FloodWait", ["source"])
+BANDWIDTH_THROTTLE_SECONDS = Counter(
+    "renamebot_bandwidth_throttle_seconds_total", "Seconds transfers were delayed by the bandwidth caps", ["direction"]
+)
+
+# Filesystem
+FS_SECONDS = Histogram("renamebot_fs_seconds", "Time spent in filesystem calls, by operation", ["op"])
+FS_FAILURES = Counter("renamebot_fs_failures_total", "Filesystem calls that raised, by operation", ["op"])
+JANITOR_RECLAIMED_BYTES = Counter(
+    "renamebot_janitor_reclaimed_bytes_total", "Bytes freed by removing orphaned downloads"
+)
+FS_PENDING_DELETIONS = Gauge("renamebot_fs_pending_deletions", "Deferred deletions not finished yet")
+
+# MongoDB
+MONGO_COMMAND_SECONDS = Histogram(
+    "renamebot_mongo_command_seconds", "MongoDB command latency", ["command"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+MONGO_COMMAND_FAILURES = Counter("renamebot_mongo_command_failures_total", "MongoDB commands that failed", ["command"])
+
+# Health
+EVENT_LOOP_LAG = Gauge("renamebot_event_loop_lag_seconds", "Most recent event loop lag measured by the sampler")
+
+# Broadcast
+BROADCAST_MESSAGES = Counter("renamebot_broadcast_messages_total", "Broadcast deliveries, by result", ["status"])
+
+# Sequence mode
+SEQUENCE_FILES = Counter("renamebot_sequence_files_total", "Files handled in sequence mode", ["action"])
+SEQUENCE_SEND_SECONDS = Histogram("renamebot_sequence_send_seconds", "Time to send a whole sorted sequence")
+
+
+def record_floodwait(source, seconds):
+    """Count a FloodWait and the time it costs"""
+    FLOODWAITS.labels(source).inc()
+    FLOODWAIT_SECONDS.labels(source).inc(seconds)
+
+
+def count_transfer(direction, progress):
+    """Wrap a Pyrogram progress callback so it also counts transferred bytes"""
+    counter = TRANSFER_BYTES.labels(direction)
+    last = 0
+
+    async def wrapper(current, total, *args):
+        nonlocal last
+        if current > last:
+            counter.inc(current - last)
+            last = current
+        await progress(current, total, *args)
+
+    return wrapper
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Feeds MongoDB command latencies into the metrics registry"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_COMMAND_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGO_COMMAND_SECONDS.labels(event.command_name).observe(event.duration_micros / 1e6)
+        MONGO_COMMAND_FAILURES.labels(event.command_name).inc()
@@ -0,0 +1,101 @@
+import asyncio
+import time
+import logging
+from config import Config
+from . import startup, fs
+from .downloader import session_pool
+from .eta import eta_model
+from .jobstate import job_registry
+from .journal import job_journal
+from .transfer_pool import transfer_pool
+from .helper_bots import helper_pool
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTED_TEXT = "♻️ Bot is restarting, this file will resume automatically."
+
+
+class RestartDrain:
+    """Empties the bot before a restart instead of killing jobs mid-transfer.
+
+    Intake closes and queued jobs are dropped, their journal entries stay.
+    Running jobs that the ETA model expects to finish before the deadline are
+    left to do so and the others are checkpointed and cancelled. Whatever is
+    still running at the deadline is checkpointed too. After the restart the
+    journal recovery (helper.journal) queues them all again.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.tasks = {}
+        self.draining = False
+
+    def track(self, job, task):
+        """Remember the task running a job, until it finishes"""
+        self.tasks[job.job_id] = (job, task)
+        task.add_done_callback(lambda _: self.tasks.pop(job.job_id, None))
+
+    async def checkpoint(self, job, stage):
+        saved = await job_journal.checkpoint(job)
+        if saved:
+            logger.info(f"Checkpointed {stage} job {job.job_id} for the restart")
+        return saved
+
+    async def drain(self, client, deadline=None):
+        """Drain within deadline seconds and flush what is buffered; returns a summary"""
+        deadline = Config.RESTART_DRAIN_SECONDS if deadline is None else deadline
+        started = time.monotonic()
+        self.draining = True
+        startup.close_intake()
+        summary = {"queued": 0, "finished": 0, "checkpointed": 0, "lost": 0}
+
+        # Queued jobs lose nothing by waiting for the next process
+        queued = list(self.registry.queued())
+        for user_id in {job.user_id for job in queued}:
+            self.registry.clear_queue(user_id)
+        for job in queued:
+            summary["queued" if await self.checkpoint(job, "queued") else "lost"] += 1
+
+        # Running jobs that would not make it are stopped now rather than at the deadline
+        now = time.time()
+        running = list(self.tasks.values())
+        stopped = [(job, task) for job, task in running if eta_model.remaining(job, now) > deadline]
+        cancelled = await self.stop_jobs(stopped, summary)
+        pending = {task for job, task in running} - {task for job, task in stopped}
+        if pending:
+            _, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - (time.monotonic() - started)))
+        cancelled += await self.stop_jobs([(job, task) for job, task in running if task in pending], summary)
+
+        if cancelled:
+            # Cancelled jobs still edit their progress message and save their trace
+            await asyncio.wait(cancelled, timeout=Config.RESTART_FLUSH_SECONDS)
+        summary["finished"] = len(running) - len(cancelled)
+
+        await self.flush(client)
+        summary["seconds"] = time.monotonic() - started
+        return summary
+
+    async def stop_jobs(self, jobs, summary):
+        """Checkpoint and cancel running jobs; returns the cancelled tasks"""
+        cancelled = []
+        for job, task in jobs:
+            if task.done():
+                continue
+            summary["checkpointed" if await self.checkpoint(job, "active") else "lost"] += 1
+            task.cancel()
+            cancelled.append(task)
+        return cancelled
+
+    async def flush(self, client):
+        """Finish deferred deletions and close the parallel transfer sessions"""
+        try:
+            await asyncio.wait_for(fs.drain(), timeout=Config.RESTART_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Deferred deletions still running at restart, the janitor will finish them")
+        await session_pool(client).stop()
+        if transfer_pool.enabled:
+            await transfer_pool.stop()
+        await helper_pool.stop()
+
+
+restart_drain = RestartDrain(job_registry)
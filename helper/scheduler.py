@@ -0,0 +1,165 @@
+import heapq
+import time
+import logging
+from config import Config
+from . import metrics
+from .eta import Ewma, eta_model
+from .jobstate import job_registry
+
+logger = logging.getLogger(__name__)
+
+# Lanes are served strictly in this order; the policy orders jobs within a lane
+LANES = ("admin", "premium", "default")
+LANE_RANK = {lane: rank for rank, lane in enumerate(LANES)}
+
+
+class FifoPolicy:
+    name = "fifo"
+    description = "first-come, first-served"
+
+    def key(self, job, now):
+        return job.enqueued_at
+
+
+class SjfPolicy:
+    """Shortest estimated job first. Waiting lowers a job's score so large
+    files are not starved by a steady stream of small ones."""
+
+    name = "sjf"
+    description = "shortest job first, with aging"
+
+    def __init__(self, aging=None):
+        self.aging = Config.SCHEDULER_AGING if aging is None else aging
+
+    def key(self, job, now):
+        return eta_model.estimate(job.file_size, job.dc_id) - self.aging * (now - job.enqueued_at)
+
+
+POLICIES = {policy.name: policy for policy in (FifoPolicy, SjfPolicy)}
+
+
+class LaneStats:
+    __slots__ = ("started", "total_wait", "max_wait", "recent_wait")
+
+    def __init__(self):
+        self.started = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_wait = Ewma(Config.ETA_EWMA_ALPHA)
+
+    def record(self, wait):
+        self.started += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_wait.update(wait)
+
+    @property
+    def mean_wait(self):
+        return self.total_wait / self.started if self.started else 0.0
+
+
+class Scheduler:
+    """Hands the global job slots to queued jobs: by lane first, then by policy,
+    never giving one user more than per_user_limit slots"""
+
+    def __init__(self, registry, capacity=None, per_user_limit=None, policy=None):
+        self.registry = registry
+        self.capacity = capacity or Config.MAX_CONCURRENT_FILES
+        self.per_user_limit = per_user_limit or Config.MAX_CONCURRENT_PER_USER
+        self.policy = None
+        self.set_policy(policy or Config.SCHEDULER_POLICY)
+        self.lanes = {lane: LaneStats() for lane in LANES}
+
+    def set_policy(self, name):
+        if name not in POLICIES:
+            raise ValueError(f"Unknown scheduler policy {name!r}, choose from {', '.join(POLICIES)}")
+        self.policy = POLICIES[name]()
+        logger.info(f"Scheduler policy set to {name}")
+
+    def lane_for(self, user_id):
+        if user_id in Config.ADMIN:
+            return "admin"
+        if user_id in Config.PREMIUM_USERS:
+            return "premium"
+        return "default"
+
+    def _user_has_slot(self, user_id):
+        state = self.registry.get(user_id)
+        return state is None or len(state.active) < self.per_user_limit
+
+    def can_start(self, job):
+        """True when the job may run right away instead of queueing"""
+        return self.registry.active_count < self.capacity and self._user_has_slot(job.user_id)
+
+    def _order(self, job, now):
+        return LANE_RANK[job.lane], self.policy.key(job, now)
+
+    def next_job(self, now=None):
+        """The queued job that should get the next free slot, if any may run"""
+        if self.registry.active_count >= self.capacity:
+            return None
+        now = now or time.time()
+        best = None
+        best_order = None
+        for job in self.registry.queued():
+            if not self._user_has_slot(job.user_id):
+                continue
+            order = self._order(job, now)
+            if best is None or order < best_order:
+                best, best_order = job, order
+        return best
+
+    def start(self, job):
+        """Give the job a slot and account for how long it waited"""
+        self.registry.start(job)
+        wait = job.started_at - job.enqueued_at if job.enqueued_at else 0.0
+        self.lanes[job.lane].record(wait)
+        metrics.QUEUE_WAIT_SECONDS.labels(job.lane).observe(wait)
+
+    def plan(self, now=None):
+        """Expected start and finish offsets (seconds from now) for every queued job,
+        simulating the global slots and per-user limits in scheduling order"""
+        now = now or time.time()
+        slots = []
+        user_slots = {}
+        for state in self.registry.busy_states():
+            for job in state.active.values():
+                remaining = eta_model.remaining(job, now)
+                slots.append(remaining)
+                user_slots.setdefault(job.user_id, []).append(remaining)
+        slots.sort()
+        slots += [0.0] * max(0, self.capacity - len(slots))
+        slots = slots[len(slots) - self.capacity:] if len(slots) > self.capacity else slots
+        heapq.heapify(slots)
+
+        schedule = {}
+        for job in sorted(self.registry.queued(), key=lambda job: self._order(job, now)):
+            own = user_slots.setdefault(job.user_id, [])
+            if len(own) < self.per_user_limit:
+                own.extend([0.0] * (self.per_user_limit - len(own)))
+            heapq.heapify(own)
+            start = max(heapq.heappop(slots), heapq.heappop(own))
+            finish = start + eta_model.estimate(job.file_size, job.dc_id)
+            heapq.heappush(slots, finish)
+            heapq.heappush(own, finish)
+            schedule[job.job_id] = (start, finish)
+        return schedule
+
+    def snapshot(self):
+        return {
+            "policy": self.policy.name,
+            "capacity": self.capacity,
+            "per_user_limit": self.per_user_limit,
+            "lanes": {
+                lane: {
+                    "started": stats.started,
+                    "mean_wait": stats.mean_wait,
+                    "recent_wait": stats.recent_wait.value or 0.0,
+                    "max_wait": stats.max_wait,
+                }
+                for lane, stats in self.lanes.items()
+            },
+        }
+
+
+scheduler = Scheduler(job_registry)
@@ -0,0 +1,73 @@
+import asyncio
+import time
+import logging
+from config import Config
+
+# Set once Telegram and MongoDB are both reachable; file handlers refuse new
+# jobs until then.
+bot_ready = asyncio.Event()
+NOT_READY_TEXT = "⏳ Bot is still starting up. Please send your file again in a moment."
+# Set when /restart starts draining; intake stays closed until the new process is up
+intake_closed = False
+RESTARTING_TEXT = "♻️ Bot is restarting. Please send your file again in a minute."
+
+# Phase name -> seconds spent, in the order the phases finished
+phase_timings = {}
+_boot_started = time.perf_counter()
+
+
+def install_event_loop():
+    """Make uvloop the event loop when Config.UVLOOP is on and uvloop is installed.
+    Run it before creating the Client, which keeps the loop current at that
+    moment; returns the name of the loop in use."""
+    if not Config.UVLOOP:
+        return "asyncio"
+    try:
+        import uvloop
+    except ImportError:
+        logging.warning("UVLOOP is on but uvloop is not installed, staying on the asyncio event loop")
+        return "asyncio"
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    # Importing pyrogram already made a default loop current; replace it
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    return "uvloop"
+
+
+def is_ready():
+    """Check if the bot is accepting new jobs"""
+    return bot_ready.is_set() and not intake_closed
+
+
+def not_ready_text():
+    """Reply for a file sent while is_ready() is False"""
+    return RESTARTING_TEXT if intake_closed else NOT_READY_TEXT
+
+
+def close_intake():
+    """Refuse new jobs from now on, for a restart"""
+    global intake_closed
+    intake_closed = True
+
+
+def mark_ready():
+    """Open job intake and stamp the total startup time"""
+    if not bot_ready.is_set():
+        phase_timings["total"] = time.perf_counter() - _boot_started
+        bot_ready.set()
+
+
+async def timed(name, coro):
+    """Await a coroutine and record how long it took under the given phase name"""
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        phase_timings[name] = time.perf_counter() - start
+
+
+def startup_report():
+    """Format the startup-time breakdown by phase"""
+    lines = ["Startup report:"]
+    for name, seconds in phase_timings.items():
+        lines.append(f"  {name:<20} {seconds * 1000:9.1f} ms")
+    return "\n".join(lines)
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import secrets
+import sys
+import logging
+from collections import Counter
+from config import Config
+from . import metrics
+from .bandwidth import bandwidth
+from .journal import journal_document
+from .memory import memory_budget
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "worker.py")
+# Counters a worker moves, summed into this process so /metrics and the
+# concurrency controller see every transfer
+REPORTED_COUNTERS = {
+    counter.name: counter for counter in (
+        metrics.TRANSFER_BYTES, metrics.TRANSFER_RESUMES, metrics.FLOODWAITS,
+        metrics.FLOODWAIT_SECONDS, metrics.BANDWIDTH_THROTTLE_SECONDS,
+    )
+}
+RESPAWN_DELAY = 5
+
+
+async def send_message(writer, message):
+    # Trace documents carry a datetime; the other side only needs it as text
+    writer.write(json.dumps(message, default=str).encode() + b"\n")
+    await writer.drain()
+
+
+async def read_message(reader):
+    """Next message from the other side, or None once it has disconnected"""
+    line = await reader.readline()
+    return json.loads(line) if line else None
+
+
+class CounterReport:
+    """Increments of REPORTED_COUNTERS since the previous report, on the worker side"""
+
+    def __init__(self):
+        self.last = {}
+
+    def take(self):
+        report = {}
+        for name, counter in REPORTED_COUNTERS.items():
+            for values, value in counter.values().items():
+                delta = value - self.last.get((name, values), 0)
+                if delta:
+                    report.setdefault(name, []).append([list(values), delta])
+                    self.last[(name, values)] = value
+        return report
+
+
+class WorkerLink:
+    """Connection to one worker process and the jobs it is running"""
+
+    def __init__(self, index, writer):
+        self.index = index
+        self.writer = writer
+        self.jobs = {}
+        self.users = Counter()
+
+
+class TransferPool:
+    """Runs rename jobs in TRANSFER_WORKERS separate processes.
+
+    The bot process keeps Telegram updates, the scheduler and every job's
+    bookkeeping; workers (worker.py) each open their own Telegram session and
+    do the downloads, uploads, progress edits and hachoir parsing. They talk
+    to this process over a localhost socket with JSON lines: run, cancel and
+    limits one way, finished plus periodic counter reports the other. A
+    worker that dies is started again and its jobs go back in the queue.
+
+    The in-memory budget and the global bandwidth cap are split evenly
+    between the workers, so together they keep to the configured values.
+    All running jobs of one user go to the same worker, whose per-user cap
+    is then the user's whole cap.
+    """
+
+    def __init__(self, size=None):
+        self.size = Config.TRANSFER_WORKERS if size is None else size
+        self.token = secrets.token_hex(16)
+        self.links = {}
+        self.processes = {}
+        self.connected = asyncio.Event()
+        self.server = None
+        self.stopping = False
+        metrics.TRANSFER_WORKERS.set_function(lambda: len(self.links))
+
+    @property
+    def enabled(self):
+        return self.size > 0
+
+    async def start(self, create_task=asyncio.create_task):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        for index in range(self.size):
+            create_task(self._supervise(index, port))
+        logger.info(f"Starting {self.size} transfer workers on port {port}")
+
+    async def _supervise(self, index, port):
+        """Keep worker index running until the pool stops"""
+        env = dict(os.environ, TRANSFER_POOL_ADDRESS=f"127.0.0.1:{port}", TRANSFER_POOL_TOKEN=self.token)
+        while not self.stopping:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, WORKER_SCRIPT, str(index), env=env
+            )
+            self.processes[index] = process
+            code = await process.wait()
+            if self.stopping:
+                return
+            logger.error(f"Transfer worker {index} exited with {code}, restarting in {RESPAWN_DELAY}s")
+            await asyncio.sleep(RESPAWN_DELAY)
+
+    async def _serve(self, reader, writer):
+        hello = await read_message(reader)
+        if not hello or hello.get("token") != self.token:
+            writer.close()
+            return
+        link = WorkerLink(hello["index"], writer)
+        try:
+            await send_message(writer, self.limits())
+        except OSError:
+            return
+        self.links[link.index] = link
+        self.connected.set()
+        logger.info(f"Transfer worker {link.index} connected")
+        try:
+            while (message := await read_message(reader)) is not None:
+                if message["type"] == "finished":
+                    future = link.jobs.get(message["job_id"])
+                    if future and not future.done():
+                        future.set_result(message)
+                elif message["type"] == "counters":
+                    for name, series in message["counters"].items():
+                        for values, amount in series:
+                            REPORTED_COUNTERS[name].labels(*values).inc(amount)
+        except OSError:
+            pass
+        finally:
+            del self.links[link.index]
+            if not self.links:
+                self.connected.clear()
+            for future in link.jobs.values():
+                if not future.done():
+                    future.set_result({"type": "finished", "status": "lost"})
+            logger.warning(f"Transfer worker {link.index} disconnected with {len(link.jobs)} jobs")
+
+    def limits(self):
+        """This process's caps as each worker should apply them"""
+        return {
+            "type": "limits",
+            "memory_budget": memory_budget.limit // self.size,
+            "global_bandwidth": bandwidth.global_limit / self.size,
+            "user_bandwidth": bandwidth.user_limit,
+            "user_overrides": [[user_id, user.limit] for user_id, user in bandwidth.users.items()
+                               if user.limit is not None],
+            "fair_share": bandwidth.fair_share,
+        }
+
+    async def update_limits(self):
+        """Send changed caps (/bandwidth) to every worker"""
+        message = self.limits()
+        for link in list(self.links.values()):
+            try:
+                await send_message(link.writer, message)
+            except OSError:
+                pass
+
+    async def run(self, job):
+        """Run a started job in a worker: the one already running this user's jobs,
+        else the least busy; returns its finished report, status "lost" if the
+        worker went away meanwhile"""
+        while not self.links:
+            await self.connected.wait()
+        busy = [link for link in self.links.values() if link.users[job.user_id]]
+        link = busy[0] if busy else min(self.links.values(), key=lambda link: len(link.jobs))
+        future = asyncio.get_running_loop().create_future()
+        link.jobs[job.job_id] = future
+        link.users[job.user_id] += 1
+        document = journal_document(job, "active")
+        document["recovered_file"] = job.recovered_file
+        try:
+            await send_message(link.writer, {"type": "run", "job": document})
+            return await future
+        except asyncio.CancelledError:
+            # A restart checkpoints the job, or another node took it over: stop it
+            # in the worker and let it tidy up
+            try:
+                await send_message(link.writer, {"type": "cancel", "job_id": job.job_id, "lease_lost": job.lease_lost})
+                await asyncio.wait_for(asyncio.shield(future), Config.RESTART_FLUSH_SECONDS)
+            except (OSError, asyncio.TimeoutError):
+                pass
+            raise
+        finally:
+            link.jobs.pop(job.job_id, None)
+            link.users[job.user_id] -= 1
+            if not link.users[job.user_id]:
+                del link.users[job.user_id]
+
+    async def stop(self):
+        self.stopping = True
+        if self.server:
+            self.server.close()
+        for process in self.processes.values():
+            if process.returncode is None:
+                process.terminate()
+        await asyncio.gather(*(process.wait() for process in self.processes.values()))
+
+
+transfer_pool = TransferPool()
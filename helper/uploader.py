@@ -0,0 +1,172 @@
+import asyncio
+import os
+import logging
+from pyrogram import raw
+from pyrogram.errors import FloodWait, InternalServerError
+from config import Config
+from . import metrics, fs
+from .downloader import ThrottledProgress, resume_on_failure, run_workers, session_pool
+from .memory import file_size, is_memory_file
+
+logger = logging.getLogger(__name__)
+
+# Largest part upload.SaveBigFilePart accepts
+PART_SIZE = 512 * 1024
+# Telegram only takes SaveBigFilePart uploads for files above 10 MiB
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+
+class UploadedFile(str):
+    """A local path whose content is already on Telegram as input_file.
+
+    It is still a plain path to Pyrogram's send_document/send_video, which
+    hand it to Client.save_file; ParallelUploadMixin.save_file answers with
+    the InputFile instead of uploading the file again. In-memory files get
+    an input_file attribute for the same purpose.
+    """
+
+    def __new__(cls, path, input_file):
+        uploaded = super().__new__(cls, path)
+        uploaded.input_file = input_file
+        return uploaded
+
+
+class UploadProgress:
+    """Parts of one upload (file_id) Telegram already has, so a retry
+    with the same file_id only sends the missing ones"""
+
+    __slots__ = ("file_id", "total_parts", "uploaded")
+
+    def __init__(self, file_id, total_parts):
+        self.file_id = file_id
+        self.total_parts = total_parts
+        self.uploaded = set()
+
+    def missing(self):
+        return [part for part in range(self.total_parts) if part not in self.uploaded]
+
+
+class FileParts:
+    """Reads upload parts from a path (os.pread on the fs pool) or an in-memory file"""
+
+    def __init__(self, file):
+        self.file = file
+        self.fd = None
+        self.view = None
+
+    async def open(self):
+        if is_memory_file(self.file):
+            self.view = self.file.getbuffer()
+        else:
+            self.fd = await fs.run("open", os.open, self.file, os.O_RDONLY)
+        return self
+
+    async def read(self, part):
+        if self.view is not None:
+            return bytes(self.view[part * PART_SIZE:(part + 1) * PART_SIZE])
+        return await fs.run("read", os.pread, self.fd, PART_SIZE, part * PART_SIZE)
+
+    async def close(self):
+        if self.view is not None:
+            self.view.release()
+        elif self.fd is not None:
+            await fs.run("close", os.close, self.fd)
+
+
+async def save_part(session, reader, file_id, part, total_parts, retries=None):
+    """Send one part, retrying just this part on failure; returns its size"""
+    retries = retries or Config.UPLOAD_PART_RETRIES
+    data = await reader.read(part)
+    query = raw.functions.upload.SaveBigFilePart(
+        file_id=file_id, file_part=part, file_total_parts=total_parts, bytes=data
+    )
+    for attempt in range(1, retries + 1):
+        delay = attempt
+        try:
+            if not await session.invoke(query, sleep_threshold=30):
+                raise ConnectionError("part not saved")
+            return len(data)
+        except FloodWait as e:
+            if attempt == retries:
+                raise
+            metrics.record_floodwait("upload", e.value)
+            error, delay = e, e.value
+        except (OSError, asyncio.TimeoutError, InternalServerError) as e:
+            if attempt == retries:
+                raise
+            error = e
+        logger.warning(f"Upload part {part}/{total_parts} failed ({error}), retry {attempt} in {delay}s")
+        await asyncio.sleep(delay)
+
+
+async def upload_parallel(client, file, connections=None, progress=None, progress_args=(), state=None):
+    """Upload a big file (a path or an in-memory file) with UPLOAD_PARALLEL_PARTS
+    SaveBigFilePart requests in flight, spread over UPLOAD_CONNECTIONS media
+    sessions to the bot's DC. Pass the UploadProgress of an interrupted
+    attempt to resume it."""
+    connections = connections or Config.UPLOAD_CONNECTIONS
+    size = await file_size(file)
+    if state is None:
+        state = UploadProgress(client.rnd_id(), -(-size // PART_SIZE))
+    sessions = await session_pool(client).get(await client.storage.dc_id(), connections)
+    parts = iter(state.missing())
+    done = sum(min(PART_SIZE, size - part * PART_SIZE) for part in state.uploaded)
+    reporter = ThrottledProgress(progress, progress_args, size, done)
+
+    reader = await FileParts(file).open()
+    try:
+        async def worker(session):
+            for part in parts:
+                sent = await save_part(session, reader, state.file_id, part, state.total_parts)
+                state.uploaded.add(part)
+                await reporter.add(sent)
+
+        await run_workers(
+            worker(sessions[n % len(sessions)]) for n in range(Config.UPLOAD_PARALLEL_PARTS)
+        )
+        await reporter.finish()
+    finally:
+        reporter.close()
+        await reader.close()
+
+    name = file.name if is_memory_file(file) else os.path.basename(file)
+    input_file = raw.types.InputFileBig(id=state.file_id, parts=state.total_parts, name=name)
+    if is_memory_file(file):
+        file.input_file = input_file
+        return file
+    return UploadedFile(file, input_file)
+
+
+async def prepare_upload(client, file, progress=None, progress_args=(), trace=None):
+    """Upload big files ahead of send_document/send_video and return what to
+    pass them: the uploaded file, or the file itself for Pyrogram to upload"""
+    if getattr(file, "input_file", None) is not None or not isinstance(client, ParallelUploadMixin):
+        return file
+    size = await file_size(file)
+    if not Config.UPLOAD_CONNECTIONS or size < max(Config.PARALLEL_UPLOAD_MIN_MB * 1024 * 1024, BIG_FILE_SIZE + 1):
+        return file
+
+    state = UploadProgress(client.rnd_id(), -(-size // PART_SIZE))
+    return await resume_on_failure(
+        lambda: upload_parallel(client, file, progress=progress, progress_args=progress_args, state=state),
+        "upload", f"Upload of {getattr(file, 'name', file)}", trace
+    )
+
+
+class ParallelUploadMixin:
+    """Client mixin that lets send_* methods reuse a file uploaded by upload_parallel"""
+
+    async def save_file(self, path, file_id=None, file_part=0, progress=None, progress_args=()):
+        input_file = getattr(path, "input_file", None)
+        if input_file is None:
+            return await super().save_file(path, file_id, file_part, progress, progress_args)
+        if file_id is not None:
+            # FilePartMissing while sending: put that one part up again
+            sessions = await session_pool(self).get(await self.storage.dc_id(), 1)
+            reader = await FileParts(path).open()
+            try:
+                await save_part(sessions[0], reader, file_id, file_part, input_file.parts)
+            finally:
+                await reader.close()
+            return None
+        return input_file
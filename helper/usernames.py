@@ -0,0 +1,64 @@
+import logging
+from collections import OrderedDict
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class UserNameCache:
+    """Display names of recently seen users, so stats never look them up one by one"""
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size or Config.USER_NAME_CACHE_SIZE
+        self._names = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._names)
+
+    def remember(self, user):
+        """Store the name of a pyrogram User we already have in hand"""
+        if user is None:
+            return
+        self._store(user.id, user.first_name or user.username or f"User {user.id}")
+
+    def get(self, user_id):
+        name = self._names.get(user_id)
+        if name is not None:
+            self._names.move_to_end(user_id)
+        return name
+
+    async def resolve(self, client, user_ids):
+        """Map user ids to names with at most one batched get_users call for the misses"""
+        names = {}
+        missing = []
+        for user_id in user_ids:
+            name = self.get(user_id)
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+        self.hits += len(names)
+        self.misses += len(missing)
+
+        if missing:
+            try:
+                for user in await client.get_users(missing):
+                    self.remember(user)
+                    names[user.id] = self.get(user.id)
+            except Exception as e:
+                logger.warning(f"Batched get_users for {len(missing)} users failed: {e}")
+
+        for user_id in missing:
+            names.setdefault(user_id, f"User {user_id}")
+        return names
+
+    def _store(self, user_id, name):
+        self._names[user_id] = name
+        self._names.move_to_end(user_id)
+        while len(self._names) > self.max_size:
+            self._names.popitem(last=False)
+
+
+user_names = UserNameCache()
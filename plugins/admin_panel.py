@@ -1,9 +1,20 @@
 from config import Config, Txt
 from helper.database import codeflixbots
+from helper import metrics
+from helper.bandwidth import bandwidth, MiB
+from helper.concurrency import concurrency_controller
+from helper.janitor import janitor
+from helper.cluster import cluster_node
+from helper.helper_bots import helper_pool
+from helper.transfer_pool import transfer_pool
+from helper.restart import restart_drain
+from helper.executor import background
+from helper.usernames import user_names
+from helper.utils import humanbytes
 from pyrogram.types import Message
 from pyrogram import Client, filters
 from pyrogram.errors import FloodWait, InputUserDeactivated, UserIsBlocked, PeerIdInvalid
-import os, sys, time, asyncio, logging, datetime
+import os, sys, time, math, asyncio, logging, datetime
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 logger = logging.getLogger(__name__)
@@ -15,15 +26,44 @@ is_restarting = False
 
 @Client.on_message(filters.private & filters.command("restart") & filters.user(ADMIN_USER_ID))
 async def restart_bot(b, m):
+    """/restart [seconds] - let running jobs finish for up to seconds, then restart"""
     global is_restarting
-    if not is_restarting:
-        is_restarting = True
-        await m.reply_text("**Restarting.....**")
+    if is_restarting:
+        return
+    try:
+        deadline = float(m.command[1]) if len(m.command) > 1 else Config.RESTART_DRAIN_SECONDS
+    except ValueError:
+        await m.reply_text("**Usage:** `/restart [drain seconds]`")
+        return
+    is_restarting = True
+    status = await m.reply_text(f"**Restarting.....**\nDraining jobs for up to {deadline:.0f}s")
+    # Outside the handler: stopping the client waits for every running handler
+    b.create_background_task(drain_and_restart(b, status, deadline))
+
+def restart_for_role_change(b):
+    """Leader and followers differ in update polling, which only a new process can switch.
+    Running jobs go straight back to the shared queue for the other nodes."""
+    global is_restarting
+    if is_restarting:
+        return
+    is_restarting = True
+    b.create_background_task(drain_and_restart(b, None, 0))
 
-        # Gracefully stop the bot's event loop
-        b.stop()
-        time.sleep(2)  # Adjust the delay duration based on your bot's shutdown time
+cluster_node.on_role_change = restart_for_role_change
 
+async def drain_and_restart(b, status, deadline):
+    try:
+        summary = await restart_drain.drain(b, deadline)
+        logger.info(f"Drained for restart: {summary}")
+        if status is not None:
+            await status.edit(
+                f"**Restarting.....**\n{summary['finished']} jobs finished, {summary['checkpointed']} running "
+                f"and {summary['queued']} queued checkpointed, {summary['lost']} lost ({summary['seconds']:.1f}s)"
+            )
+        await b.stop()
+    except Exception as e:
+        logger.error(f"Error while draining for restart: {e}")
+    finally:
         # Restart the bot process
         os.execl(sys.executable, sys.executable, *sys.argv)
 
@@ -50,10 +90,123 @@ async def get_stats(bot, message):
     st = await message.reply('**Accessing The Details.....**')    
     end_t = time.time()
     time_taken_s = (end_t - start_t) * 1000
-    await st.edit(text=f"**--Bot Status--** \n\n**⌚️ Bot Uptime :** {uptime} \n**🐌 Current Ping :** `{time_taken_s:.3f} ms` \n**👭 Total Users :** `{total_users}`")
+    await st.edit(
+        text=f"**--Bot Status--** \n\n**⌚️ Bot Uptime :** {uptime} \n**🐌 Current Ping :** `{time_taken_s:.3f} ms` \n**👭 Total Users :** `{total_users}`"
+        f"\n\n{concurrency_text()}\n{janitor_text()}{cluster_text()}{helper_bots_text()}"
+    )
+
+def concurrency_text():
+    """Adaptive concurrency state for /stats"""
+    state = concurrency_controller.snapshot()
+    mode = f"adaptive {state['minimum']}-{state['maximum']}" if state["enabled"] else "fixed"
+    text = f"**⚙️ Concurrency :** `{state['capacity']}` ({mode})"
+    sample = state["sample"]
+    if sample:
+        text += (
+            f"\n**📈 Last window :** {format_rate(sample['throughput']) if sample['throughput'] else '0 B/s'}, "
+            f"{sample['floodwaits']} FloodWait, {sample['error_rate']:.0%} errors, "
+            f"lag {sample['loop_lag'] * 1000:.0f} ms"
+        )
+    for change in reversed(state["history"][-3:]):
+        ago = time.strftime("%Hh%Mm%Ss", time.gmtime(time.time() - change["at"]))
+        text += f"\n• {change['from']} → {change['to']} {ago} ago: {change['reason']}"
+    return text
+
+def janitor_text():
+    """Orphaned download cleanup for /stats"""
+    state = janitor.snapshot()
+    if not state["last_run"]:
+        return "**🧹 Janitor :** not run yet"
+    ago = time.strftime("%Hh%Mm%Ss", time.gmtime(time.time() - state["last_run"]))
+    return (
+        f"**🧹 Janitor :** {state['removed']} orphans removed, {humanbytes(state['reclaimed']) or '0 B'} reclaimed "
+        f"(last run {ago} ago, {humanbytes(state['last_reclaimed']) or '0 B'})"
+    )
+
+def cluster_text():
+    """This node's share of the cluster for /stats, empty outside cluster mode"""
+    if not cluster_node.enabled:
+        return ""
+    state = cluster_node.snapshot()
+    return (
+        f"\n**🛰 Node :** `{state['node_id']}` ({'leader' if state['leader'] else 'follower'}), "
+        f"{state['active']} running, {state['claimed']} claimed, {state['taken_over']} taken over, "
+        f"{state['lost_leases']} leases lost"
+    )
+
+def helper_bots_text():
+    """Upload share and FloodWait state of every helper bot for /stats, empty without helpers"""
+    lines = []
+    for helper in helper_pool.snapshot():
+        state = f"flood-limited for {helper['blocked_for']:.0f}s" if helper["blocked_for"] else "ready"
+        lines.append(
+            f"  `{helper['name']}`: {helper['uploads']} uploads, {helper['active']} running, "
+            f"{helper['floodwaits']} FloodWaits, {state}"
+        )
+    return "\n**🤖 Helper bots :**\n" + "\n".join(lines) if lines else ""
+
+def format_rate(rate):
+    return f"{humanbytes(rate) or '0 B'}/s" if rate else "unlimited"
+
+def parse_rate(text):
+    """A /bandwidth cap in MiB/s as bytes/s; 0 is unlimited"""
+    try:
+        rate = float(text)
+    except ValueError:
+        rate = None
+    if rate is None or not math.isfinite(rate) or rate < 0:
+        raise ValueError(f"`{text}` is not a valid cap, use 0 or more MiB/s")
+    return rate * MiB
+
+@Client.on_message(filters.private & filters.command("bandwidth") & filters.user(Config.ADMIN))
+async def bandwidth_command(bot, message):
+    """/bandwidth [global <MiB/s> | user [user_id] <MiB/s|off> | fair <on|off>]"""
+    args = message.command[1:]
+    try:
+        if len(args) == 2 and args[0] == "global":
+            bandwidth.set_global_limit(parse_rate(args[1]))
+        elif len(args) == 2 and args[0] == "user":
+            bandwidth.set_user_limit(parse_rate(args[1]))
+        elif len(args) == 3 and args[0] == "user":
+            bandwidth.set_user_limit(None if args[2] == "off" else parse_rate(args[2]), int(args[1]))
+        elif len(args) == 2 and args[0] == "fair":
+            bandwidth.fair_share = args[1] == "on"
+            bandwidth.set_global_limit(bandwidth.global_limit)
+        elif args:
+            raise ValueError
+    except ValueError as e:
+        error = f"❌ {e}\n\n" if e.args else ""
+        await message.reply_text(
+            f"{error}**Usage:**\n`/bandwidth global <MiB/s>`\n`/bandwidth user <MiB/s>`\n"
+            "`/bandwidth user <user_id> <MiB/s|off>`\n`/bandwidth fair <on|off>`\n(0 MiB/s = unlimited)"
+        )
+        return
+    if args and transfer_pool.enabled:
+        # Transfer workers pace themselves with their share of these caps
+        await transfer_pool.update_limits()
+
+    snapshot = bandwidth.snapshot()
+    top = list(snapshot["users"].items())[:10]
+    names = await user_names.resolve(bot, [user_id for user_id, _ in top])
+    text = (
+        f"**📶 Bandwidth**\n\n"
+        f"**Global cap:** {format_rate(snapshot['global_limit'])}\n"
+        f"**Per-user cap:** {format_rate(snapshot['user_limit'])}"
+        f"{' (fair share on)' if snapshot['fair_share'] else ''}\n"
+        f"**Current total:** {format_rate(snapshot['rate']) if snapshot['rate'] else '0 B/s'}\n"
+        f"**Throttled so far:** {snapshot['throttled_seconds']:.0f}s\n"
+    )
+    if top:
+        text += "\n**Per user:**\n" + "\n".join(
+            f"• {names[user_id]} (`{user_id}`): {format_rate(rate) if rate else '0 B/s'}" for user_id, rate in top
+        )
+    await message.reply_text(text)
 
 @Client.on_message(filters.command("broadcast") & filters.user(Config.ADMIN) & filters.reply)
 async def broadcast_handler(bot: Client, m: Message):
+    background.submit(run_broadcast(bot, m), "broadcast")
+
+async def run_broadcast(bot, m):
     await bot.send_message(Config.LOG_CHANNEL, f"{m.from_user.mention} or {m.from_user.id} Is Started The Broadcast......")
     all_users = await codeflixbots.get_all_users()
     broadcast_msg = m.reply_to_message
@@ -80,19 +233,25 @@ async def broadcast_handler(bot: Client, m: Message):
 async def send_msg(user_id, message):
     try:
         await message.copy(chat_id=int(user_id))
+        metrics.BROADCAST_MESSAGES.labels("success").inc()
         return 200
     except FloodWait as e:
+        metrics.record_floodwait("broadcast", e.value)
         await asyncio.sleep(e.value)
-        return send_msg(user_id, message)
+        return await send_msg(user_id, message)
     except InputUserDeactivated:
         logger.info(f"{user_id} : Deactivated")
+        metrics.BROADCAST_MESSAGES.labels("deactivated").inc()
         return 400
     except UserIsBlocked:
         logger.info(f"{user_id} : Blocked The Bot")
+        metrics.BROADCAST_MESSAGES.labels("blocked").inc()
         return 400
     except PeerIdInvalid:
         logger.info(f"{user_id} : User ID Invalid")
+        metrics.BROADCAST_MESSAGES.labels("invalid").inc()
         return 400
     except Exception as e:
         logger.error(f"{user_id} : {e}")
+        metrics.BROADCAST_MESSAGES.labels("error").inc()
         return 500
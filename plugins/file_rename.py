@@ -5,25 +5,44 @@ from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ForceReply
 from pyrogram.errors import FloodWait, MessageNotModified
 from hachoir.metadata import extractMetadata
-from hachoir.parser import createParser
+from hachoir.parser import createParser, guessParser
+from hachoir.stream import InputIOStream
 from helper.utils import progress_for_pyrogram, convert, humanbytes
 from helper.database import codeflixbots
+from helper.jobtrace import JobTrace
+from helper.jobstate import ACTIVE, Job, job_registry
+from helper.eta import eta_model, format_eta
+from helper.scheduler import scheduler
+from helper.bandwidth import bandwidth
+from helper.concurrency import concurrency_controller
+from helper.downloader import download_media
+from helper.uploader import prepare_upload
+from helper.restart import restart_drain, CHECKPOINTED_TEXT
+from helper.journal import job_journal
+from helper.executor import background
+from helper.transfer_pool import transfer_pool
+from helper.cluster import cluster_node
+from helper.helper_bots import helper_pool
+from helper import startup, metrics, memory, fs
 from PIL import Image
+from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Queue system variables
-processing_stats = {}
-user_queues = {}
-active_tasks = {}
-MAX_CONCURRENT_PER_USER = 2
+# Queue system settings; job state lives in helper.jobstate
+MAX_CONCURRENT_PER_USER = Config.MAX_CONCURRENT_PER_USER
+MAX_QUEUED_PER_USER = 10
+
+metrics.ACTIVE_JOBS.set_function(lambda: job_registry.active_count)
+metrics.QUEUED_JOBS.set_function(lambda: job_registry.queued_count)
 
 # File extensions mapping for media type detection
 VIDEO_EXTENSIONS = {'.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm', '.m4v', '.3gp', '.ts', '.mts'}
 AUDIO_EXTENSIONS = {'.mp3', '.wav', '.flac', '.aac', '.ogg', '.wma', '.m4a', '.opus'}
 IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tiff', '.svg'}
 DOCUMENT_EXTENSIONS = {'.pdf', '.doc', '.docx', '.txt', '.zip', '.rar', '.7z', '.tar', '.gz'}
+INVALID_FILENAME_CHARS = '<>:"/\\|?*'
 
 async def get_upload_destination(user_id):
     """Get user's upload destination settings"""
@@ -48,48 +67,176 @@ def get_media_type(filename):
     else:
         return 'document'
 
-async def update_processing_stats(user_id, operation, status):
-    """Update processing statistics"""
-    if user_id not in processing_stats:
-        processing_stats[user_id] = {
-            'total_processed': 0,
-            'successful': 0,
-            'failed': 0,
-            'current_operation': None,
-            'last_update': time.time()
-        }
-    
-    stats = processing_stats[user_id]
-    stats['current_operation'] = operation
-    stats['last_update'] = time.time()
+def transfer_progress(user_id, direction, trace=None):
+    """Progress callback for a transfer, paced by the bandwidth caps and counted in metrics.
+    With a trace the message also shows the job ETA, recomputed on every update."""
+    progress = progress_for_pyrogram
+    if trace is not None:
+        async def progress(current, total, ud_type, message, start):
+            await progress_for_pyrogram(current, total, f"{ud_type}\n⏱️ Job ETA: {job_eta(trace)}", message, start)
+    return bandwidth.shape(user_id, direction, metrics.count_transfer(direction, progress))
+
+def job_eta(trace):
+    """Time left for a running job according to the ETA model"""
+    if trace.predicted_duration is None:
+        return format_eta(None)
+    return format_eta(max(0.0, trace.predicted_duration - trace.total_duration()))
+
+def media_parser(file):
+    """hachoir parser for a path or an in-memory file"""
+    if memory.is_memory_file(file):
+        return guessParser(InputIOStream(file, source=f"memory:{file.name}", filename=file.name))
+    return createParser(file)
+
+def sanitize_filename(name):
+    """Remove characters Telegram clients and filesystems reject"""
+    for char in INVALID_FILENAME_CHARS:
+        name = name.replace(char, '')
+    return name
+
+def prepare_for(sender, upload):
+    """Big files go up over several sessions first, send_* then only sends the message"""
+    return prepare_upload(
+        sender,
+        upload["file_path"],
+        progress=transfer_progress(upload["user_id"], "upload", upload["trace"]),
+        progress_args=(f"{upload['upload_info']}\n\n📤 Uploading...", upload["message"], time.time()),
+        trace=upload["trace"]
+    )
+
+async def send_media(sender, chat_id, topic_id, file_path, filename, file_size, upload_as_document,
+                     thumbnail, caption, user_id, upload_info, message, trace):
+    """Upload the file from sender's account as a document, video, audio or photo.
+    A file prepared for sender (prepare_for) is only sent, not uploaded again."""
+    # Send file based on upload mode and file type
+    if upload_as_document:
+        # Always send as document
+        sent_file = await sender.send_document(
+            chat_id=chat_id,
+            document=file_path,
+            file_name=filename,
+            thumb=thumbnail,
+            caption=caption,
+            message_thread_id=topic_id,
+            progress=transfer_progress(user_id, "upload", trace),
+            progress_args=(f"{upload_info}\n\n📤 Uploading...", message, time.time())
+        )
+    else:
+        # Send based on media type
+        media_type = get_media_type(filename)
+        
+        if media_type == 'video':
+            # Extract video metadata
+            duration = 0
+            width = 0
+            height = 0
+            
+            try:
+                metadata = await fs.run("metadata", lambda: extractMetadata(media_parser(file_path)))
+                if metadata:
+                    if metadata.has("duration"):
+                        duration = metadata.get('duration').seconds
+                    if metadata.has("width"):
+                        width = metadata.get('width')
+                    if metadata.has("height"):
+                        height = metadata.get('height')
+            except:
+                pass
+            
+            sent_file = await sender.send_video(
+                chat_id=chat_id,
+                video=file_path,
+                file_name=filename,
+                duration=duration,
+                width=width,
+                height=height,
+                thumb=thumbnail,
+                caption=caption,
+                message_thread_id=topic_id,
+                progress=transfer_progress(user_id, "upload", trace),
+                progress_args=(f"{upload_info}\n\n📤 Uploading video...", message, time.time())
+            )
+            
+        elif media_type == 'audio':
+            # Extract audio metadata
+            duration = 0
+            performer = ""
+            title = ""
+            
+            try:
+                metadata = await fs.run("metadata", lambda: extractMetadata(media_parser(file_path)))
+                if metadata:
+                    if metadata.has("duration"):
+                        duration = metadata.get('duration').seconds
+                    if metadata.has("author"):
+                        performer = metadata.get('author')
+                    if metadata.has("title"):
+                        title = metadata.get('title')
+            except:
+                pass
+            
+            sent_file = await sender.send_audio(
+                chat_id=chat_id,
+                audio=file_path,
+                file_name=filename,
+                duration=duration,
+                performer=performer,
+                title=title,
+                thumb=thumbnail,
+                caption=caption,
+                message_thread_id=topic_id,
+                progress=transfer_progress(user_id, "upload", trace),
+                progress_args=(f"{upload_info}\n\n📤 Uploading audio...", message, time.time())
+            )
+            
+        elif media_type == 'photo' and file_size < 10 * 1024 * 1024:  # Less than 10MB
+            sent_file = await sender.send_photo(
+                chat_id=chat_id,
+                photo=file_path,
+                caption=caption,
+                message_thread_id=topic_id
+            )
+        else:
+            # Send as document for other file types or large images
+            sent_file = await sender.send_document(
+                chat_id=chat_id,
+                document=file_path,
+                file_name=filename,
+                thumb=thumbnail,
+                caption=caption,
+                message_thread_id=topic_id,
+                progress=transfer_progress(user_id, "upload", trace),
+                progress_args=(f"{upload_info}\n\n📤 Uploading document...", message, time.time())
+            )
     
-    if status == 'completed':
-        stats['total_processed'] += 1
-        stats['successful'] += 1
-        stats['current_operation'] = None
-    elif status == 'failed':
-        stats['total_processed'] += 1
-        stats['failed'] += 1
-        stats['current_operation'] = None
-
-async def get_user_active_tasks(user_id):
-    """Get number of active tasks for user"""
-    return len(active_tasks.get(user_id, []))
-
-async def add_active_task(user_id, task_id):
-    """Add active task for user"""
-    if user_id not in active_tasks:
-        active_tasks[user_id] = []
-    active_tasks[user_id].append(task_id)
-
-async def remove_active_task(user_id, task_id):
-    """Remove active task for user"""
-    if user_id in active_tasks and task_id in active_tasks[user_id]:
-        active_tasks[user_id].remove(task_id)
-        if not active_tasks[user_id]:
-            del active_tasks[user_id]
-
-async def send_file_to_destination(client, user_id, file_path, filename, thumbnail=None, caption=None, message=None):
+    return sent_file
+
+async def send_via_helper(client, helper, chat_id, topic_id, upload):
+    """Upload with a helper bot into the staging channel, then deliver it from this bot by file_id.
+    Returns None when the helper's upload failed, so the caller tries another account."""
+    status = "failed"
+    try:
+        try:
+            prepared = await prepare_for(helper.client, upload)
+            staged = await send_media(helper.client, helper_pool.chat_id, None, **dict(upload, file_path=prepared))
+        except FloodWait as e:
+            logger.warning(f"FloodWait of {e.value}s on {helper.name}, moving the upload")
+            helper.block(e.value)
+            status = "floodwait"
+            return None
+        except Exception as e:
+            logger.error(f"Upload through {helper.name} failed, moving the upload: {e}")
+            return None
+        sent_file = await helper_pool.deliver(client, helper, staged, chat_id, topic_id, upload["caption"])
+        status = "completed"
+        return sent_file
+    finally:
+        # An in-memory file remembers the helper's upload, which no other account can send
+        if memory.is_memory_file(upload["file_path"]):
+            upload["file_path"].input_file = None
+        helper_pool.release(helper, upload["file_size"], status)
+
+async def send_file_to_destination(client, user_id, file_path, filename, thumbnail=None, caption=None, message=None, trace=None):
     """Send file to user's configured destination"""
     try:
         # Get destination settings
@@ -109,120 +256,39 @@ async def send_file_to_destination(client, user_id, file_path, filename, thumbna
         # Update progress message if provided
         if message:
             try:
-                await message.edit_text(f"{upload_info}\n\n⏱️ Starting upload...")
+                eta_info = f"\n⏱️ Job ETA: {job_eta(trace)}" if trace else ""
+                await message.edit_text(f"{upload_info}{eta_info}\n\n⏱️ Starting upload...")
             except:
                 pass
         
         # Get file size for progress
-        file_size = os.path.getsize(file_path)
-        
-        # Send file based on upload mode and file type
-        if upload_as_document:
-            # Always send as document
-            sent_file = await client.send_document(
-                chat_id=chat_id,
-                document=file_path,
-                file_name=filename,
-                thumb=thumbnail,
-                caption=caption,
-                message_thread_id=topic_id,
-                progress=progress_for_pyrogram,
-                progress_args=(f"{upload_info}\n\n📤 Uploading...", message, time.time())
-            )
-        else:
-            # Send based on media type
-            media_type = get_media_type(filename)
-            
-            if media_type == 'video':
-                # Extract video metadata
-                duration = 0
-                width = 0
-                height = 0
-                
-                try:
-                    metadata = extractMetadata(createParser(file_path))
-                    if metadata:
-                        if metadata.has("duration"):
-                            duration = metadata.get('duration').seconds
-                        if metadata.has("width"):
-                            width = metadata.get('width')
-                        if metadata.has("height"):
-                            height = metadata.get('height')
-                except:
-                    pass
-                
-                sent_file = await client.send_video(
-                    chat_id=chat_id,
-                    video=file_path,
-                    file_name=filename,
-                    duration=duration,
-                    width=width,
-                    height=height,
-                    thumb=thumbnail,
-                    caption=caption,
-                    message_thread_id=topic_id,
-                    progress=progress_for_pyrogram,
-                    progress_args=(f"{upload_info}\n\n📤 Uploading video...", message, time.time())
-                )
-                
-            elif media_type == 'audio':
-                # Extract audio metadata
-                duration = 0
-                performer = ""
-                title = ""
-                
-                try:
-                    metadata = extractMetadata(createParser(file_path))
-                    if metadata:
-                        if metadata.has("duration"):
-                            duration = metadata.get('duration').seconds
-                        if metadata.has("author"):
-                            performer = metadata.get('author')
-                        if metadata.has("title"):
-                            title = metadata.get('title')
-                except:
-                    pass
-                
-                sent_file = await client.send_audio(
-                    chat_id=chat_id,
-                    audio=file_path,
-                    file_name=filename,
-                    duration=duration,
-                    performer=performer,
-                    title=title,
-                    thumb=thumbnail,
-                    caption=caption,
-                    message_thread_id=topic_id,
-                    progress=progress_for_pyrogram,
-                    progress_args=(f"{upload_info}\n\n📤 Uploading audio...", message, time.time())
-                )
-                
-            elif media_type == 'photo' and file_size < 10 * 1024 * 1024:  # Less than 10MB
-                sent_file = await client.send_photo(
-                    chat_id=chat_id,
-                    photo=file_path,
-                    caption=caption,
-                    message_thread_id=topic_id
-                )
-            else:
-                # Send as document for other file types or large images
-                sent_file = await client.send_document(
-                    chat_id=chat_id,
-                    document=file_path,
-                    file_name=filename,
-                    thumb=thumbnail,
-                    caption=caption,
-                    message_thread_id=topic_id,
-                    progress=progress_for_pyrogram,
-                    progress_args=(f"{upload_info}\n\n📤 Uploading document...", message, time.time())
-                )
-        
-        return sent_file
+        file_size = await memory.file_size(file_path)
+
+        upload = dict(
+            file_path=file_path, filename=filename, file_size=file_size, upload_as_document=upload_as_document,
+            thumbnail=thumbnail, caption=caption, user_id=user_id, upload_info=upload_info, message=message,
+            trace=trace,
+        )
+        # Helper bots take the upload while one is free of FloodWait, this bot otherwise. A retry
+        # after this bot's FloodWait skips them, the file is already uploaded from this account.
+        tried = []
+        while getattr(file_path, "input_file", None) is None and (helper := helper_pool.acquire(file_size, tried)):
+            tried.append(helper)
+            sent_file = await send_via_helper(client, helper, chat_id, topic_id, upload)
+            if sent_file is not None:
+                return sent_file
+        # Uploaded once: the FloodWait retry and the private chat fallback below send the same upload
+        file_path = upload["file_path"] = await prepare_for(client, upload)
+        return await send_media(client, chat_id, topic_id, **upload)
         
     except FloodWait as e:
         logger.warning(f"FloodWait: {e.value} seconds")
+        metrics.record_floodwait("upload", e.value)
+        if trace:
+            trace.add_retry()
+            trace.add_wait(e.value)
         await asyncio.sleep(e.value)
-        return await send_file_to_destination(client, user_id, file_path, filename, thumbnail, caption, message)
+        return await send_file_to_destination(client, user_id, file_path, filename, thumbnail, caption, message, trace)
         
     except Exception as e:
         logger.error(f"Error sending file to destination: {e}")
@@ -237,7 +303,7 @@ async def send_file_to_destination(client, user_id, file_path, filename, thumbna
                 file_name=filename,
                 thumb=thumbnail,
                 caption=caption,
-                progress=progress_for_pyrogram,
+                progress=transfer_progress(user_id, "upload"),
                 progress_args=("📤 Uploading to private chat...", message, time.time())
             )
         except Exception as fallback_error:
@@ -250,12 +316,13 @@ async def send_file_to_destination(client, user_id, file_path, filename, thumbna
 async def rename_start(client, message):
     user_id = message.from_user.id
     
-    # Check if user is in premium mode or has remaining renames
+    if not startup.is_ready():
+        await message.reply_text(startup.not_ready_text())
+        return
+    
+    # Make sure the user is registered
     try:
-        user_data = await codeflixbots.find_one({"_id": user_id})
-        if not user_data:
-            await codeflixbots.add_user(client, message)
-            user_data = await codeflixbots.find_one({"_id": user_id})
+        await codeflixbots.add_user(client, message)
     except:
         await message.reply_text("❌ Database error. Please try again.")
         return
@@ -270,23 +337,11 @@ async def rename_start(client, message):
     except:
         pass
     
-    # Check queue status
-    try:
-        if user_id in user_queues and len(user_queues[user_id]) >= 10:
-            await message.reply_text(
-                "⚠️ Your queue is full (10 files max).\n"
-                "Please wait for current files to process or use /clearqueue"
-            )
-            return
-    except:
-        pass
-    
-    # Check if user has reached max concurrent tasks
-    active_count = await get_user_active_tasks(user_id)
-    if active_count >= MAX_CONCURRENT_PER_USER:
+    # Files that can't get a slot right away are queued, up to MAX_QUEUED_PER_USER
+    if await queue_is_full(user_id):
         await message.reply_text(
-            f"⚠️ You have reached the maximum concurrent processing limit ({MAX_CONCURRENT_PER_USER}).\n"
-            "Please wait for current files to complete."
+            f"⚠️ Your queue is full ({MAX_QUEUED_PER_USER} files max).\n"
+            "Please wait for current files to process or use /clearqueue"
         )
         return
     
@@ -347,6 +402,10 @@ async def rename_doc(client, message):
     if not (reply_message.document or reply_message.video or reply_message.audio):
         return
     
+    if not startup.is_ready():
+        await message.reply_text(startup.not_ready_text())
+        return
+    
     new_name = message.text.strip()
     
     # Validate filename
@@ -354,100 +413,254 @@ async def rename_doc(client, message):
         await message.reply_text("❌ Please provide a valid filename.")
         return
     
-    # Remove invalid characters
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        new_name = new_name.replace(char, '')
+    new_name = sanitize_filename(new_name)
     
     if not new_name:
         await message.reply_text("❌ Invalid filename. Please try again.")
         return
     
-    # Check if queue is enabled
+    await submit_rename(client, message, reply_message, new_name)
+
+def new_job(message, file_message, new_name, job_id=None):
+    """Build the job record for renaming file_message to new_name"""
+    user_id = message.from_user.id
+    media = file_message.document or file_message.video or file_message.audio
+    return Job(
+        job_id or job_registry.new_job_id(user_id),
+        user_id,
+        new_name,
+        original_filename=getattr(media, 'file_name', None),
+        file_size=getattr(media, 'file_size', 0),
+        dc_id=getattr(media, 'dc_id', None),
+        lane=scheduler.lane_for(user_id),
+        message=message,
+        file_message=file_message,
+    )
+
+async def submit_rename(client, message, file_message, new_name):
+    """Start the file in the background if a slot is free, otherwise queue it for the scheduler"""
+    if restart_drain.draining:
+        await message.reply_text(startup.RESTARTING_TEXT)
+        return
+    job = new_job(message, file_message, new_name)
+    if cluster_node.enabled:
+        await add_to_shared_queue(client, message, job)
+        return
+    if not scheduler.can_start(job):
+        await add_to_queue(client, message, job)
+        return
+    scheduler.start(job)
+    await job_journal.accept(job, "active")
+    run_job(client, job)
+
+def run_job(client, job):
+    """Run a started job on the background executor, where a restart can checkpoint and cancel it"""
+    if transfer_pool.enabled:
+        coro = run_remote(client, job)
+    else:
+        coro = process_file_rename(client, job.message, job.file_message, job.file_name, job)
+    task = background.submit(coro, "rename")
+    restart_drain.track(job, task)
+    return task
+
+def settle_job(client, job, status, document=None):
+    """Free a finished job's slot, hand it to the next queued file and learn from its trace"""
+    job_registry.finish(job, status)
+    metrics.JOBS.labels(status).inc()
+    dispatch_queued(client)
+    if document is not None:
+        eta_model.observe(document)
+
+async def run_remote(client, job):
+    """Run a started job in a transfer worker process and settle it here"""
     try:
-        queue_data = await codeflixbots.get_user_queue(user_id)
-        if queue_data and queue_data.get('enabled', False):
-            await add_to_queue(client, message, reply_message, new_name)
+        result = await transfer_pool.run(job)
+    except asyncio.CancelledError:
+        # Checkpointed by /restart inside the worker; it runs again after the restart
+        settle_job(client, job, "checkpointed")
+        raise
+    if result["status"] != "lost":
+        settle_job(client, job, result["status"], result["trace"])
+        return
+    # The worker died under the job: count it like a crash and queue the job again
+    job.recoveries += 1
+    if job.recoveries > Config.JOURNAL_MAX_RECOVERIES:
+        settle_job(client, job, "failed")
+        await job_journal.finish(job)
+        await job.file_message.reply_text(f"❌ Could not process `{job.file_name}`. Please send it again.")
+        return
+    logger.warning(f"Transfer worker lost job {job.job_id}, queueing it again")
+    job_registry.requeue(job)
+    await job_journal.requeue(job, job.recoveries)
+    dispatch_queued(client)
+
+def dispatch_queued(client):
+    """Start queued jobs, in scheduler order, while there are free slots"""
+    if restart_drain.draining:
+        return
+    if cluster_node.enabled:
+        # Jobs wait in the shared queue; this node claims the next one itself
+        cluster_node.wake()
+        return
+    while True:
+        job = scheduler.next_job()
+        if job is None:
             return
-    except:
-        pass
-    
-    # Process file immediately
-    await process_file_rename(client, message, reply_message, new_name)
+        # Claim the slot before the task runs so a new file can't take it meanwhile
+        scheduler.start(job)
+        run_job(client, job)
+
+async def journaled_messages(client, document):
+    """A journaled job's command and file messages; a sequence or forwarded file may be in another chat"""
+    file_chat_id = document.get("file_chat_id", document["chat_id"])
+    if file_chat_id == document["chat_id"]:
+        return await client.get_messages(document["chat_id"], [document["message_id"], document["file_message_id"]])
+    [message] = await client.get_messages(document["chat_id"], [document["message_id"]])
+    [file_message] = await client.get_messages(file_chat_id, [document["file_message_id"]])
+    return message, file_message
 
-async def process_file_rename(client, message, file_message, new_name):
-    """Process file renaming and upload"""
+async def journaled_job(client, document):
+    """Rebuild a job from its journal entry and original messages; None if they are gone"""
+    message, file_message = await journaled_messages(client, document)
+    if message.empty or file_message.empty:
+        return None
+    # Same job id, so a half-done parallel download in downloads/<job_id> continues too
+    job = new_job(message, file_message, document["file_name"], job_id=document["_id"])
+    job.recoveries = document["recoveries"]
+    path = document.get("file_path")
+    if path and await fs.exists(path) and await fs.getsize(path) == job.file_size:
+        job.recovered_file = path
+    return job
+
+async def resume_journaled(client, document):
+    """Queue a job left in the journal by the previous process"""
+    job = await journaled_job(client, document)
+    if job is None:
+        return False
+    job_registry.enqueue(job)
+    await job_journal.requeue(job, document["recoveries"])
+    dispatch_queued(client)
+    return True
+
+async def start_claimed(client, document):
+    """Run a job this node claimed from the shared queue (cluster mode)"""
+    job = await journaled_job(client, document)
+    if job is None:
+        return False
+    job.enqueued_at = document["accepted_at"]
+    scheduler.start(job)
+    run_job(client, job)
+    return True
+
+concurrency_controller.on_increase = dispatch_queued
+job_journal.resume = resume_journaled
+cluster_node.start_job = start_claimed
+
+async def process_file_rename(client, message, file_message, new_name, job=None, settle=None):
+    """Process file renaming and upload.
+
+    settle(status, trace_document) replaces the slot bookkeeping at the end,
+    for a transfer worker whose slots live in the bot process.
+    """
     user_id = message.from_user.id
-    task_id = f"{user_id}_{int(time.time())}"
+    if job is None:
+        job = new_job(message, file_message, new_name)
+    if job.state != ACTIVE:
+        scheduler.start(job)
+    task_id = job.job_id
+    media = file_message.document or file_message.video or file_message.audio
+    trace = JobTrace(task_id, user_id, new_name, job.file_size)
+    trace.dc_id = job.dc_id
+    trace.predicted_duration = eta_model.estimate(job.file_size, job.dc_id)
+    in_memory = False
+    ms = None
+    checkpointed = False
     
     try:
-        # Add to active tasks
-        await add_active_task(user_id, task_id)
-        await update_processing_stats(user_id, f"Processing {new_name}", "started")
-        
         # Start processing message
-        ms = await message.reply_text("⏳ Processing your request...")
+        ms = await message.reply_text(
+            f"⏳ Processing your request...\n⏱️ Estimated time: {format_eta(trace.predicted_duration)}"
+        )
         
         # Download file
+        await job_journal.stage(job, "download", progress=ms)
+        trace.start_stage("download")
+        metrics.ACTIVE_TRANSFERS.labels("download").inc()
+        bandwidth.begin(user_id)
         try:
             await ms.edit_text("📥 Downloading file...")
             
-            download_path = f"downloads/{user_id}_{int(time.time())}"
-            os.makedirs(download_path, exist_ok=True)
+            # Small files stay in RAM, within the global budget
+            in_memory = not job.recovered_file and memory.use_memory(job.file_size)
+            download_path = None if in_memory else f"{fs.DOWNLOADS_DIR}/{task_id}"
+            if download_path:
+                await fs.makedirs(download_path)
             
-            if file_message.document:
-                file_path = await client.download_media(
-                    file_message.document,
-                    file_name=f"{download_path}/temp_file",
-                    progress=progress_for_pyrogram,
-                    progress_args=("📥 Downloading...", ms, time.time())
-                )
-            elif file_message.video:
-                file_path = await client.download_media(
-                    file_message.video,
-                    file_name=f"{download_path}/temp_file",
-                    progress=progress_for_pyrogram,
-                    progress_args=("📥 Downloading...", ms, time.time())
-                )
-            elif file_message.audio:
-                file_path = await client.download_media(
-                    file_message.audio,
-                    file_name=f"{download_path}/temp_file",
-                    progress=progress_for_pyrogram,
-                    progress_args=("📥 Downloading...", ms, time.time())
+            if job.recovered_file:
+                # Downloaded before a restart and still on disk
+                file_path = job.recovered_file
+            elif media:
+                file_path = await download_media(
+                    client,
+                    media,
+                    file_name=f"{download_path}/temp_file" if download_path else None,
+                    progress=transfer_progress(user_id, "download", trace),
+                    progress_args=("📥 Downloading...", ms, time.time()),
+                    trace=trace,
+                    in_memory=in_memory
                 )
             else:
                 await ms.edit_text("❌ Unsupported file type.")
+                trace.error = "Unsupported file type"
                 return
                 
         except Exception as e:
             logger.error(f"Download error: {e}")
+            if isinstance(e, FloodWait):
+                metrics.record_floodwait("download", e.value)
             await ms.edit_text(f"❌ Download failed: {str(e)}")
-            await update_processing_stats(user_id, f"Processing {new_name}", "failed")
+            trace.error = f"Download failed: {e}"
             return
+        finally:
+            metrics.ACTIVE_TRANSFERS.labels("download").dec()
+            bandwidth.end(user_id)
+            # A resumed download moved no bytes now; its near-zero time must not teach the ETA model
+            trace.end_stage(bytes=0 if job.recovered_file else trace.file_size)
         
         # Rename file
+        await job_journal.stage(job, "rename", file_path=None if in_memory else file_path)
+        trace.start_stage("rename")
         try:
             await ms.edit_text("🔄 Renaming file...")
             
-            new_file_path = f"{download_path}/{new_name}"
-            os.rename(file_path, new_file_path)
-            file_path = new_file_path
+            if in_memory:
+                file_path.name = new_name
+            else:
+                new_file_path = f"{download_path}/{new_name}"
+                await fs.rename(file_path, new_file_path)
+                file_path = new_file_path
             
         except Exception as e:
             logger.error(f"Rename error: {e}")
             await ms.edit_text(f"❌ Rename failed: {str(e)}")
-            await update_processing_stats(user_id, f"Processing {new_name}", "failed")
+            trace.error = f"Rename failed: {e}"
             return
+        trace.end_stage()
         
         # Get thumbnail
+        await job_journal.stage(job, "thumbnail", file_path=None if in_memory else file_path)
+        trace.start_stage("thumbnail")
         thumbnail = None
         try:
             thumb_data = await codeflixbots.get_thumbnail(user_id)
             if thumb_data and thumb_data.get('file_id'):
-                thumbnail = await client.download_media(thumb_data['file_id'])
+                # Named after the job so the janitor knows whose it is
+                thumbnail = await client.download_media(
+                    thumb_data['file_id'], file_name=f"{fs.DOWNLOADS_DIR}/{fs.THUMBS_DIR}/{task_id}.jpg"
+                )
         except:
             pass
+        trace.end_stage()
         
         # Get caption
         caption = None
@@ -459,6 +672,8 @@ async def process_file_rename(client, message, file_message, new_name):
             pass
         
         # Apply metadata if enabled
+        await job_journal.stage(job, "metadata")
+        trace.start_stage("metadata")
         try:
             metadata_data = await codeflixbots.get_metadata(user_id)
             if metadata_data and metadata_data.get('enabled', False):
@@ -466,13 +681,23 @@ async def process_file_rename(client, message, file_message, new_name):
                 file_path = await apply_metadata(file_path, metadata_data, new_name)
         except Exception as e:
             logger.warning(f"Metadata application failed: {e}")
+        trace.end_stage()
         
         # Upload file to destination
         await ms.edit_text("📤 Uploading file...")
         
-        sent_file = await send_file_to_destination(
-            client, user_id, file_path, new_name, thumbnail, caption, ms
-        )
+        await job_journal.stage(job, "upload", file_path=None if in_memory else file_path)
+        trace.start_stage("upload")
+        metrics.ACTIVE_TRANSFERS.labels("upload").inc()
+        bandwidth.begin(user_id)
+        try:
+            sent_file = await send_file_to_destination(
+                client, user_id, file_path, new_name, thumbnail, caption, ms, trace
+            )
+        finally:
+            metrics.ACTIVE_TRANSFERS.labels("upload").dec()
+            bandwidth.end(user_id)
+            trace.end_stage(bytes=job.file_size)
         
         if sent_file:
             # Success message
@@ -488,30 +713,52 @@ async def process_file_rename(client, message, file_message, new_name):
                 success_msg += f"📁 **New name:** `{new_name}`"
             
             await ms.edit_text(success_msg)
-            await update_processing_stats(user_id, f"Processing {new_name}", "completed")
+            trace.status = "completed"
         else:
             await ms.edit_text("❌ Upload failed. Please try again.")
-            await update_processing_stats(user_id, f"Processing {new_name}", "failed")
+            trace.error = "Upload failed"
         
-        # Cleanup
-        try:
-            import shutil
-            shutil.rmtree(download_path)
-            if thumbnail and os.path.exists(thumbnail):
-                os.remove(thumbnail)
-        except:
-            pass
+        # Cleanup happens in the background, the job does not wait for the disk
+        if download_path:
+            fs.remove_later(download_path)
+        if thumbnail:
+            fs.remove_later(thumbnail)
             
+    except asyncio.CancelledError:
+        # Checkpointed by /restart, the job runs again after it; or in cluster
+        # mode another node took it over and reports progress itself
+        trace.error = "Lease lost to another node" if job.lease_lost else "Interrupted by restart"
+        checkpointed = True
+        if ms and not job.lease_lost:
+            try:
+                await ms.edit_text(CHECKPOINTED_TEXT)
+            except Exception:
+                pass
+        raise
     except Exception as e:
         logger.error(f"Error in process_file_rename: {e}")
         try:
             await ms.edit_text(f"❌ Error: {str(e)}")
         except:
             await message.reply_text(f"❌ Error: {str(e)}")
-        await update_processing_stats(user_id, f"Processing {new_name}", "failed")
+        trace.error = str(e)
     finally:
-        # Remove from active tasks
-        await remove_active_task(user_id, task_id)
+        if in_memory:
+            memory.memory_budget.release(job.file_size)
+        if not checkpointed:
+            await job_journal.finish(job)
+        # Free the slot and hand it to the next queued file
+        if checkpointed:
+            status = "checkpointed"
+        else:
+            status = "completed" if trace.status == "completed" else "failed"
+        trace.finish(status, trace.error)
+        document = trace.to_document()
+        if settle is None:
+            settle_job(client, job, status, document)
+        else:
+            settle(status, document)
+        await codeflixbots.add_job_trace(document)
 
 async def auto_rename_file(client, message, format_template):
     """Auto rename file using template"""
@@ -554,7 +801,7 @@ async def auto_rename_file(client, message, format_template):
             new_name += file_extension
         
         # Process the file
-        await process_file_rename(client, message, message, new_name)
+        await submit_rename(client, message, message, new_name)
         
     except Exception as e:
         logger.error(f"Auto rename error: {e}")
@@ -591,42 +838,34 @@ async def handle_sequence_file(client, message, sequence_data):
         await codeflixbots.update_sequence_number(user_id, current_num + 1)
         
         # Process the file
-        await process_file_rename(client, message, message, new_name)
+        await submit_rename(client, message, message, new_name)
         
     except Exception as e:
         logger.error(f"Sequence handling error: {e}")
         await message.reply_text(f"❌ Sequence processing failed: {str(e)}")
 
-async def add_to_queue(client, message, file_message, new_name):
+async def add_to_queue(client, message, job):
     """Add file to processing queue"""
     user_id = message.from_user.id
     
     try:
-        # Initialize user queue if not exists
-        if user_id not in user_queues:
-            user_queues[user_id] = []
-        
-        if len(user_queues[user_id]) >= 10:
+        state = job_registry.user(user_id)
+        if len(state.queued) >= MAX_QUEUED_PER_USER:
             await message.reply_text(
-                "⚠️ Queue is full (10 files max).\n"
+                f"⚠️ Queue is full ({MAX_QUEUED_PER_USER} files max).\n"
                 "Please wait for current files to process."
             )
             return
         
-        # Add file to queue
-        file_info = {
-            'message_id': file_message.id,
-            'new_name': new_name,
-            'added_time': time.time(),
-            'status': 'queued'
-        }
-        
-        user_queues[user_id].append(file_info)
+        await job_journal.accept(job, "queued")
+        position = job_registry.enqueue(job)
+        start, finish = scheduler.plan()[job.job_id]
         
         await message.reply_text(
             f"✅ **File added to queue!**\n\n"
-            f"📁 **Name:** `{new_name}`\n"
-            f"📊 **Queue position:** `{len(user_queues[user_id])}`\n"
+            f"📁 **Name:** `{job.file_name}`\n"
+            f"📊 **Queue position:** `{position}`\n"
+            f"⏱️ **Starts in:** ~{format_eta(start)}, done in ~{format_eta(finish)}\n"
             f"⏳ **Status:** Waiting\n\n"
             "Use /queueinfo to check queue status."
         )
@@ -635,6 +874,37 @@ async def add_to_queue(client, message, file_message, new_name):
         logger.error(f"Queue error: {e}")
         await message.reply_text(f"❌ Queue error: {str(e)}")
 
+async def queue_is_full(user_id):
+    """Whether the user already has MAX_QUEUED_PER_USER files waiting; in cluster
+    mode they wait in the shared queue rather than in this node's registry"""
+    if cluster_node.enabled:
+        queued = await codeflixbots.count_queued_jobs(user_id=user_id)
+        return queued is not None and queued >= MAX_QUEUED_PER_USER
+    state = job_registry.get(user_id)
+    return state is not None and len(state.queued) >= MAX_QUEUED_PER_USER
+
+async def add_to_shared_queue(client, message, job):
+    """Queue a file for whichever cluster node has a free slot first"""
+    try:
+        if await queue_is_full(job.user_id):
+            await message.reply_text(
+                f"⚠️ Queue is full ({MAX_QUEUED_PER_USER} files max).\n"
+                "Please wait for current files to process."
+            )
+            return
+        await job_journal.accept(job, "queued")
+        cluster_node.wake()
+        position = await codeflixbots.count_queued_jobs(time.time())
+        await message.reply_text(
+            f"✅ **File added to queue!**\n\n"
+            f"📁 **Name:** `{job.file_name}`\n"
+            f"📊 **Queue position:** `{position or 1}`\n"
+            f"⏳ **Status:** Waiting for a free node"
+        )
+    except Exception as e:
+        logger.error(f"Queue error: {e}")
+        await message.reply_text(f"❌ Queue error: {str(e)}")
+
 async def apply_metadata(file_path, metadata_data, filename):
     """Apply metadata to file"""
     try:
@@ -0,0 +1,103 @@
+from pyrogram import Client, filters
+from helper.database import codeflixbots
+from helper.jobtrace import STAGES, aggregate_stages
+from helper.eta import eta_model, prediction_error
+from helper.utils import humanbytes
+from config import Config
+
+MAX_TRACES = 20
+# Under Telegram's 4096 per message, with room for emoji that count twice; longer replies go out in several
+MAX_MESSAGE_LENGTH = 4000
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    if seconds < 1:
+        return f"{seconds * 1000:.0f}ms"
+    return f"{seconds:.1f}s"
+
+
+def format_trace(trace):
+    """Render one job trace as a short block of text"""
+    status_icon = "✅" if trace.get("status") == "completed" else "❌"
+    lines = [
+        f"{status_icon} `{trace.get('file_name')}` ({humanbytes(trace.get('file_size')) or '0 B'})",
+        f"   🕒 {trace['started_at'].strftime('%d %b %H:%M:%S')} • total {format_seconds(trace.get('duration'))}",
+    ]
+    if trace.get("predicted_duration"):
+        lines[-1] += f" (ETA was {format_seconds(trace['predicted_duration'])})"
+    for stage in trace.get("stages", []):
+        line = f"   • {stage['name']}: {format_seconds(stage.get('duration'))}"
+        if stage.get("throughput"):
+            line += f" @ {humanbytes(stage['throughput'])}/s"
+        if stage.get("retries"):
+            line += f", {stage['retries']} retries"
+        if stage.get("wait"):
+            line += f", waited {format_seconds(stage['wait'])}"
+        lines.append(line)
+    if trace.get("error"):
+        lines.append(f"   ⚠️ {trace['error']}")
+    return "\n".join(lines)
+
+
+def split_blocks(blocks, limit=MAX_MESSAGE_LENGTH):
+    """Pack text blocks, blank-line separated, into as few messages of at most limit characters as fit"""
+    messages = []
+    for block in blocks:
+        block = block[:limit]
+        if messages and len(messages[-1]) + 2 + len(block) <= limit:
+            messages[-1] += "\n\n" + block
+        else:
+            messages.append(block)
+    return messages
+
+
+@Client.on_message(filters.private & filters.command("jobtrace"))
+async def job_trace_command(client, message):
+    """Show the user's recent job timings; admins also get per-stage percentiles"""
+    user_id = message.from_user.id
+
+    limit = 5
+    if len(message.command) > 1 and message.command[1].isdigit():
+        limit = max(1, min(int(message.command[1]), MAX_TRACES))
+
+    traces = await codeflixbots.get_user_job_traces(user_id, limit)
+    if traces:
+        blocks = [f"🧾 **Your last {len(traces)} jobs:**"] + [format_trace(t) for t in traces]
+    else:
+        blocks = ["🧾 **No job traces yet**\n\nRename a file and its timings will show up here."]
+
+    if user_id in Config.ADMIN:
+        recent = await codeflixbots.get_recent_job_traces(Config.JOB_TRACE_AGGREGATE_WINDOW)
+        summary = aggregate_stages(recent)
+        text = ""
+        if summary:
+            text += f"📊 **Stage latency over last {len(recent)} jobs (p50 / p95 / p99):**\n"
+            for name in STAGES + ("total",):
+                if name in summary:
+                    row = summary[name]
+                    text += (
+                        f"• {name}: {format_seconds(row['p50'])} / "
+                        f"{format_seconds(row['p95'])} / {format_seconds(row['p99'])} "
+                        f"({row['count']})\n"
+                    )
+
+        accuracy = prediction_error(recent)
+        if accuracy:
+            text += (
+                f"\n🎯 **ETA error over {accuracy['count']} jobs:** "
+                f"median {accuracy['p50']:.0%}, p90 {accuracy['p90']:.0%}\n"
+            )
+        model = eta_model.snapshot()
+        if model["download"]:
+            text += (
+                f"⚙️ **ETA model:** ⬇️ {humanbytes(model['download'])}/s, "
+                f"⬆️ {humanbytes(model['upload']) or '-'}/s, "
+                f"overhead {format_seconds(sum(model['overhead'].values()))}\n"
+            )
+        if text:
+            blocks.append(text.strip())
+
+    for text in split_blocks(blocks):
+        await message.reply_text(text)
@@ -1,57 +1,142 @@
 import asyncio
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from plugins.file_rename import processing_stats, user_queues, active_tasks, MAX_CONCURRENT_PER_USER
+from plugins.file_rename import MAX_CONCURRENT_PER_USER
+from helper.jobstate import job_registry
+from helper.database import codeflixbots
+from helper.cluster import cluster_node
+from helper.journal import job_journal
+from helper.usernames import user_names
+from helper.memory import memory_budget
+from helper.eta import eta_model, format_eta
+from helper.scheduler import scheduler, POLICIES, LANES
 from helper.utils import humanbytes
 from config import Config
 
+def estimated_wait(state):
+    """Scheduler ETA plan and the time until the user's queued files are done"""
+    plan = scheduler.plan()
+    return plan, max((plan[job_id][1] for job_id in state.queued), default=0)
+
+def scheduler_text():
+    """Policy, capacity and queueing delay per lane for the admin stats"""
+    snapshot = scheduler.snapshot()
+    text = (
+        f"**🚦 Scheduler:** `{snapshot['policy']}` ({scheduler.policy.description}), "
+        f"{job_registry.active_count}/{snapshot['capacity']} slots busy\n"
+    )
+    for lane in LANES:
+        row = snapshot["lanes"][lane]
+        text += (
+            f"• **{lane}**: {row['started']} started, wait mean {format_eta(row['mean_wait'])}, "
+            f"recent {format_eta(row['recent_wait'])}, max {format_eta(row['max_wait'])}\n"
+        )
+    return text
+
+async def shared_queue_text(user_id):
+    """/queue in cluster mode, from the user's journal entries on every node; None without any"""
+    documents = await codeflixbots.get_user_jobs(user_id)
+    if not documents:
+        return None
+    active = [document for document in documents if document["state"] == "active"]
+    queued = [document for document in documents if document["state"] == "queued"]
+    text = (
+        f"📋 **Your Queue Status**\n\n"
+        f"🔄 **Currently Processing**: {len(active)} files across the cluster\n"
+        f"⏳ **Files in Queue**: {len(queued)}\n"
+    )
+    if active:
+        text += "\n**🔄 Currently Processing:**\n"
+        for document in active[:3]:
+            text += f"• `{document['file_name']}`\n"
+    if queued:
+        text += "\n**📂 Files in Queue:**\n"
+        for i, document in enumerate(queued[:5], 1):
+            position = await codeflixbots.count_queued_jobs(document["accepted_at"])
+            text += (
+                f"{i}. `{document['file_name']}` ({humanbytes(document['file_size'])}) "
+                f"• #{position or i} in the shared queue\n"
+            )
+        if len(queued) > 5:
+            text += f"... and {len(queued) - 5} more files\n"
+    return text
+
+async def queued_counts(user_id):
+    """The user's (queued, active) files, from the shared journal in cluster mode"""
+    if cluster_node.enabled:
+        documents = await codeflixbots.get_user_jobs(user_id)
+        queued = sum(1 for document in documents if document["state"] == "queued")
+        return queued, len(documents) - queued
+    state = job_registry.get(user_id)
+    if state is None:
+        return 0, 0
+    return len(state.queued), len(state.active)
+
 @Client.on_message(filters.private & filters.command("queue"))
 async def show_queue_status(client, message):
     """Show detailed queue status for the user"""
     user_id = message.from_user.id
     
-    if user_id not in processing_stats:
+    keyboard = InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("🔄 Refresh", callback_data="refresh_queue"),
+            InlineKeyboardButton("🗑️ Clear Queue", callback_data="clear_queue_confirm")
+        ],
+        [
+            InlineKeyboardButton("❌ Close", callback_data="close_queue_status")
+        ]
+    ])
+    
+    # Cluster nodes queue files in the shared journal, not in this node's registry
+    status_text = await shared_queue_text(user_id) if cluster_node.enabled else None
+    if status_text is not None:
+        await message.reply_text(status_text, reply_markup=keyboard)
+        return
+    
+    state = None if cluster_node.enabled else job_registry.get(user_id)
+    if state is None:
         await message.reply_text(
             "📋 **No files in processing queue**\n\n"
             "Send some files to start processing!"
         )
         return
     
-    stats = processing_stats[user_id]
-    active = stats["active"]
-    queued = stats["queued"]
+    active = len(state.active)
+    queued = len(state.queued)
     
-    # Calculate estimated wait time
-    avg_processing_time = 120  # 2 minutes average per file
-    estimated_wait = queued * avg_processing_time
-    wait_time = str(timedelta(seconds=estimated_wait))
+    # Estimated wait from the learned throughput and the queue order
+    plan, queue_clears_in = estimated_wait(state)
+    wait_time = format_eta(queue_clears_in)
     
     # Get queue details if files are queued
     queue_details = ""
-    if user_id in user_queues and user_queues[user_id]:
+    if state.queued:
         queue_details = "\n**📂 Files in Queue:**\n"
-        for i, file_task in enumerate(list(user_queues[user_id])[:5], 1):
+        for i, file_task in enumerate(list(state.queued.values())[:5], 1):
             file_size = humanbytes(file_task.file_size)
-            queue_details += f"{i}. `{file_task.original_filename}` ({file_size})\n"
+            queue_details += (
+                f"{i}. `{file_task.original_filename}` ({file_size}) "
+                f"• starts in ~{format_eta(plan[file_task.job_id][0])}\n"
+            )
         
-        if len(user_queues[user_id]) > 5:
-            remaining = len(user_queues[user_id]) - 5
+        if queued > 5:
+            remaining = queued - 5
             queue_details += f"... and {remaining} more files\n"
     
     # Get active tasks details
     active_details = ""
-    if user_id in active_tasks and active_tasks[user_id]:
+    if state.active:
         active_details = "\n**🔄 Currently Processing:**\n"
-        for i, task_id in enumerate(list(active_tasks[user_id].keys())[:3], 1):
-            active_details += f"Slot {i}: Processing...\n"
+        for i, file_task in enumerate(list(state.active.values())[:3], 1):
+            active_details += f"Slot {i}: `{file_task.file_name}` • ~{format_eta(eta_model.remaining(file_task))} left\n"
     
     status_text = f"""📋 **Your Queue Status**
 
 🔄 **Currently Processing**: {active}/{MAX_CONCURRENT_PER_USER} slots
 ⏳ **Files in Queue**: {queued}
-⚡ **Total Capacity**: {MAX_CONCURRENT_PER_USER} files simultaneously
+⚡ **Total Capacity**: {MAX_CONCURRENT_PER_USER} files simultaneously ({scheduler.lane_for(user_id)} lane)
 ⏱️ **Estimated Wait**: {wait_time if queued > 0 else 'No wait'}
 
 {active_details}{queue_details}
@@ -59,16 +144,6 @@ async def show_queue_status(client, message):
 {'🟢 **Ready to accept more files!**' if active < MAX_CONCURRENT_PER_USER else '🔴 **All slots busy** - new files will be queued'}
     """
     
-    keyboard = InlineKeyboardMarkup([
-        [
-            InlineKeyboardButton("🔄 Refresh", callback_data="refresh_queue"),
-            InlineKeyboardButton("🗑️ Clear Queue", callback_data="clear_queue_confirm")
-        ],
-        [
-            InlineKeyboardButton("❌ Close", callback_data="close_queue_status")
-        ]
-    ])
-    
     await message.reply_text(status_text, reply_markup=keyboard)
 
 @Client.on_message(filters.private & filters.command("clearqueue"))
@@ -76,14 +151,12 @@ async def clear_queue_command(client, message):
     """Clear all pending files from queue"""
     user_id = message.from_user.id
     
-    if user_id not in user_queues or not user_queues[user_id]:
+    queued_count, active_count = await queued_counts(user_id)
+    if not queued_count:
         await message.reply_text("📋 **No files in queue to clear**")
         return
     
     # Show confirmation
-    queued_count = len(user_queues[user_id])
-    active_count = processing_stats[user_id]["active"] if user_id in processing_stats else 0
-    
     keyboard = InlineKeyboardMarkup([
         [
             InlineKeyboardButton("✅ Yes, Clear All", callback_data="confirm_clear_queue"),
@@ -108,7 +181,7 @@ async def queue_system_info(client, message):
 **🔧 How it works:**
 • Bot can process up to **{MAX_CONCURRENT_PER_USER} files simultaneously**
 • Additional files are automatically **queued**
-• Files are processed in **first-come, first-served** order
+• Files are processed in **{scheduler.policy.description}** order
 • You get **real-time status updates** for each file
 
 **📊 Queue Features:**
@@ -130,7 +203,7 @@ async def queue_system_info(client, message):
 • Processing continues even if you go offline
 
 **⚡ Performance:**
-• Average processing time: ~2-3 minutes per file
+• Current estimate: ~{format_eta(eta_model.estimate(100 * 1024 * 1024))} for a 100 MB file
 • Depends on file size and metadata complexity
 • Network speed affects upload/download times
     """
@@ -154,27 +227,20 @@ async def queue_statistics(client, message):
         await message.reply_text("❌ **Admin only command**")
         return
     
-    # Calculate global statistics
-    total_users_with_queues = len([uid for uid in processing_stats.keys()])
-    total_active_files = sum([stats["active"] for stats in processing_stats.values()])
-    total_queued_files = sum([stats["queued"] for stats in processing_stats.values()])
-    total_capacity = total_users_with_queues * MAX_CONCURRENT_PER_USER
+    # Global statistics are kept up to date by the job registry
+    total_users_with_queues = job_registry.busy_users()
+    total_active_files = job_registry.active_count
+    total_queued_files = job_registry.queued_count
+    total_capacity = scheduler.capacity
+    utilization = total_active_files / total_capacity * 100 if total_capacity > 0 else 0
     
-    # Get top users by queue size
-    top_users = sorted(
-        [(uid, stats["queued"] + stats["active"]) for uid, stats in processing_stats.items()],
-        key=lambda x: x[1], reverse=True
-    )[:5]
+    # Get top users by queue size, names resolved in one batch
+    top_users = [(state.user_id, state.load) for state in job_registry.top_users(5)]
+    names = await user_names.resolve(client, [uid for uid, _ in top_users])
     
     top_users_text = ""
     for i, (uid, total_files) in enumerate(top_users, 1):
-        if total_files > 0:
-            try:
-                user = await client.get_users(uid)
-                username = user.first_name or "Unknown"
-            except:
-                username = f"User {uid}"
-            top_users_text += f"{i}. {username}: {total_files} files\n"
+        top_users_text += f"{i}. {names[uid]}: {total_files} files\n"
     
     stats_text = f"""📊 **Global Queue Statistics**
 
@@ -183,19 +249,23 @@ async def queue_statistics(client, message):
 • **Files Processing**: {total_active_files}
 • **Files Queued**: {total_queued_files}
 • **Total Capacity**: {total_capacity} slots
-• **Utilization**: {(total_active_files/total_capacity*100):.1f}% if total_capacity > 0 else 0%
+• **Utilization**: {utilization:.1f}%
 
 **👥 Top Users by File Count:**
 {top_users_text if top_users_text else "No active users"}
 
+{scheduler_text()}
 **⚙️ System Settings:**
 • **Max Concurrent per User**: {MAX_CONCURRENT_PER_USER}
 • **Queue Timeout**: {Config.QUEUE_TIMEOUT} seconds
 • **Auto Cleanup**: Enabled
 
 **💾 Memory Usage:**
-• **Active Tasks**: {len([task for tasks in active_tasks.values() for task in tasks.values()])}
-• **Queue Objects**: {len([queue for queue in user_queues.values()])}
+• **Tracked Users**: {len(job_registry)} (evicted {job_registry.evicted})
+• **Active Tasks**: {total_active_files} ({humanbytes(job_registry.active_bytes) or '0 B'})
+• **Queued Tasks**: {total_queued_files} ({humanbytes(job_registry.queued_bytes) or '0 B'})
+• **Name Cache**: {len(user_names)} users ({user_names.hits} hits, {user_names.misses} misses)
+• **In-Memory Files**: {humanbytes(memory_budget.used) or '0 B'} of {humanbytes(memory_budget.limit)} (peak {humanbytes(memory_budget.peak) or '0 B'}, {memory_budget.refused} sent to disk)
     """
     
     keyboard = InlineKeyboardMarkup([
@@ -207,6 +277,25 @@ async def queue_statistics(client, message):
     
     await message.reply_text(stats_text, reply_markup=keyboard)
 
+@Client.on_message(filters.private & filters.command("scheduler"))
+async def scheduler_command(client, message):
+    """Show or switch the scheduling policy (admin only)"""
+    if message.from_user.id not in Config.ADMIN:
+        await message.reply_text("❌ **Admin only command**")
+        return
+    
+    if len(message.command) > 1:
+        try:
+            scheduler.set_policy(message.command[1].lower())
+        except ValueError as e:
+            await message.reply_text(f"❌ {e}")
+            return
+    
+    await message.reply_text(
+        scheduler_text() +
+        f"\nSwitch with `/scheduler <{'|'.join(POLICIES)}>`"
+    )
+
 # Callback handlers for inline buttons
 @Client.on_callback_query(filters.regex(r"^(refresh_queue|clear_queue_confirm|close_queue_status)$"))
 async def queue_callback_handler(client, callback_query: CallbackQuery):
@@ -217,16 +306,32 @@ async def queue_callback_handler(client, callback_query: CallbackQuery):
         # Refresh queue status
         await callback_query.answer("🔄 Refreshing...")
         
-        if user_id not in processing_stats:
+        if cluster_node.enabled:
+            status_text = await shared_queue_text(user_id)
+            if status_text is None:
+                await callback_query.message.edit_text("📋 **No files in processing queue**")
+                return
+            keyboard = InlineKeyboardMarkup([
+                [
+                    InlineKeyboardButton("🔄 Refresh", callback_data="refresh_queue"),
+                    InlineKeyboardButton("🗑️ Clear Queue", callback_data="clear_queue_confirm")
+                ],
+                [
+                    InlineKeyboardButton("❌ Close", callback_data="close_queue_status")
+                ]
+            ])
+            await callback_query.message.edit_text(status_text, reply_markup=keyboard)
+            return
+        
+        state = job_registry.get(user_id)
+        if state is None:
             await callback_query.message.edit_text("📋 **No files in processing queue**")
             return
         
-        stats = processing_stats[user_id]
-        active = stats["active"]
-        queued = stats["queued"]
+        active = len(state.active)
+        queued = len(state.queued)
         
-        estimated_wait = queued * 120  # 2 minutes average
-        wait_time = str(timedelta(seconds=estimated_wait))
+        wait_time = format_eta(estimated_wait(state)[1])
         
         status_text = f"""📋 **Your Queue Status** *(Updated: {datetime.now().strftime('%H:%M:%S')})*
 
@@ -253,12 +358,11 @@ async def queue_callback_handler(client, callback_query: CallbackQuery):
         # Show clear confirmation
         await callback_query.answer()
         
-        if user_id not in user_queues or not user_queues[user_id]:
+        queued_count, _ = await queued_counts(user_id)
+        if not queued_count:
             await callback_query.message.edit_text("📋 **No files in queue to clear**")
             return
         
-        queued_count = len(user_queues[user_id])
-        
         keyboard = InlineKeyboardMarkup([
             [
                 InlineKeyboardButton("✅ Yes, Clear All", callback_data="confirm_clear_queue"),
@@ -285,10 +389,15 @@ async def clear_queue_callback(client, callback_query: CallbackQuery):
     if data == "confirm_clear_queue":
         await callback_query.answer("🗑️ Clearing queue...")
         
-        if user_id in user_queues:
-            queued_count = len(user_queues[user_id])
-            user_queues[user_id].clear()
-            processing_stats[user_id]["queued"] = 0
+        if cluster_node.enabled:
+            # Whatever no node has claimed yet
+            queued_count = await codeflixbots.remove_queued_jobs(user_id)
+        else:
+            removed = job_registry.clear_queue(user_id)
+            for job in removed:
+                await job_journal.finish(job)
+            queued_count = len(removed)
+        if queued_count:
             
             await callback_query.message.edit_text(
                 f"✅ **Queue Cleared Successfully**\n\n"
@@ -310,13 +419,13 @@ async def info_callback_handler(client, callback_query: CallbackQuery):
     if data == "check_my_queue":
         await callback_query.answer("📋 Checking your queue...")
         
-        if user_id not in processing_stats:
+        state = job_registry.get(user_id)
+        if state is None:
             await callback_query.message.edit_text("📋 **No files in processing queue**")
             return
         
-        stats = processing_stats[user_id]
-        active = stats["active"]
-        queued = stats["queued"]
+        active = len(state.active)
+        queued = len(state.queued)
         
         status_text = f"""📋 **Your Current Queue Status**
 
@@ -350,11 +459,11 @@ async def admin_stats_callback(client, callback_query: CallbackQuery):
     if data == "refresh_admin_stats":
         await callback_query.answer("🔄 Refreshing admin stats...")
         
-        # Recalculate statistics
-        total_users_with_queues = len([uid for uid in processing_stats.keys()])
-        total_active_files = sum([stats["active"] for stats in processing_stats.values()])
-        total_queued_files = sum([stats["queued"] for stats in processing_stats.values()])
-        total_capacity = total_users_with_queues * MAX_CONCURRENT_PER_USER
+        total_users_with_queues = job_registry.busy_users()
+        total_active_files = job_registry.active_count
+        total_queued_files = job_registry.queued_count
+        total_capacity = scheduler.capacity
+        utilization = total_active_files / total_capacity * 100 if total_capacity > 0 else 0
         
         stats_text = f"""📊 **Global Queue Statistics** *(Updated: {datetime.now().strftime('%H:%M:%S')})*
 
@@ -363,8 +472,9 @@ async def admin_stats_callback(client, callback_query: CallbackQuery):
 • **Files Processing**: {total_active_files}
 • **Files Queued**: {total_queued_files}
 • **Total Capacity**: {total_capacity} slots
-• **Utilization**: {(total_active_files/total_capacity*100):.1f}% if total_capacity > 0 else 0%
+• **Utilization**: {utilization:.1f}%
 
+{scheduler_text()}
 **⚙️ System Settings:**
 • **Max Concurrent per User**: {MAX_CONCURRENT_PER_USER}
 • **Queue Timeout**: {Config.QUEUE_TIMEOUT} seconds
@@ -1,17 +1,21 @@
 import asyncio
+import time
 from pyrogram import Client, filters
 from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, Message
+from pyrogram.errors import FloodWait
 import re
 from collections import defaultdict
-from pymongo import MongoClient
 from datetime import datetime
-from config import Config
+from helper.database import codeflixbots
+from helper import startup, metrics
+from helper.executor import background
 
-# Database setup
-db_client = MongoClient(Config.DB_URL)
-db = db_client[Config.DB_NAME]
-users_collection = db["users_sequence"]
-sequence_collection = db["active_sequences"]
+# Database setup - collections share the bot's lazily created Motor client
+def users_collection():
+    return codeflixbots.get_collection("users_sequence")
+
+def sequence_collection():
+    return codeflixbots.get_collection("active_sequences")
 
 # Patterns for extracting episode numbers
 patterns = [
@@ -33,21 +37,21 @@ def extract_episode_number(filename):
             return int(match.groups()[-1])
     return float('inf')  
 
-def is_in_sequence_mode(user_id):
+async def is_in_sequence_mode(user_id):
     """Check if user is in sequence mode"""
-    return sequence_collection.find_one({"user_id": user_id}) is not None
+    return await sequence_collection().find_one({"user_id": user_id}) is not None
 
 @Client.on_message(filters.private & filters.command("startsequence"))
 async def start_sequence(client, message):
     user_id = message.from_user.id
     
     # Check if already in sequence mode
-    if is_in_sequence_mode(user_id):
+    if await is_in_sequence_mode(user_id):
         await message.reply_text("⚠️ Sequence mode is already active. Send your files or use /endsequence.")
         return
         
     # Create new sequence entry
-    sequence_collection.insert_one({
+    await sequence_collection().insert_one({
         "user_id": user_id,
         "files": [],
         "started_at": datetime.now()
@@ -60,7 +64,7 @@ async def end_sequence(client, message):
     user_id = message.from_user.id
     
     # Get sequence data
-    sequence_data = sequence_collection.find_one({"user_id": user_id})
+    sequence_data = await sequence_collection().find_one({"user_id": user_id})
     
     if not sequence_data or not sequence_data.get("files"):
         await message.reply_text("❌ No files in sequence!")
@@ -73,8 +77,14 @@ async def end_sequence(client, message):
     
     # Send progress message
     progress = await message.reply_text(f"⏳ Processing and sorting {total} files...")
-    
+    background.submit(send_sequence(client, message, sorted_files, progress), "sequence")
+
+async def send_sequence(client, message, sorted_files, progress):
+    """Copy the sorted files back to the user, off the handler workers"""
+    user_id = message.from_user.id
+    total = len(sorted_files)
     sent_count = 0
+    send_started = time.perf_counter()
     
     # Send files in sequence
     for i, file in enumerate(sorted_files, 1):
@@ -85,17 +95,25 @@ async def end_sequence(client, message):
                 message_id=file["msg_id"]
             )
             sent_count += 1
+            metrics.SEQUENCE_FILES.labels("sent").inc()
             
             # Update progress every 5 files
             if i % 5 == 0:
                 await progress.edit_text(f"📤 Sent {i}/{total} files...")
             
             await asyncio.sleep(0.5)  # Add delay to prevent flooding
+        except FloodWait as e:
+            metrics.record_floodwait("sequence", e.value)
+            metrics.SEQUENCE_FILES.labels("failed").inc()
+            print(f"Error sending file: {e}")
+            await asyncio.sleep(e.value)
         except Exception as e:
+            metrics.SEQUENCE_FILES.labels("failed").inc()
             print(f"Error sending file: {e}")
+    metrics.SEQUENCE_SEND_SECONDS.observe(time.perf_counter() - send_started)
     
     # Update user stats
-    users_collection.update_one(
+    await users_collection().update_one(
         {"user_id": user_id},
         {"$inc": {"files_sequenced": sent_count}, 
          "$set": {"username": message.from_user.first_name}},
@@ -103,7 +121,7 @@ async def end_sequence(client, message):
     )
     
     # Remove sequence data
-    sequence_collection.delete_one({"user_id": user_id})
+    await sequence_collection().delete_one({"user_id": user_id})
     
     await progress.edit_text(f"✅ Successfully sent {sent_count} files in sequence!")
 
@@ -112,8 +130,13 @@ async def end_sequence(client, message):
 async def sequence_file_handler(client, message):
     user_id = message.from_user.id
     
+    # Don't touch the database or start jobs until startup has finished
+    if not startup.is_ready():
+        await message.reply_text(startup.not_ready_text())
+        message.stop_propagation()
+    
     # Check if user is in sequence mode
-    if is_in_sequence_mode(user_id):
+    if await is_in_sequence_mode(user_id):
         # Get file name based on media type
         if message.document:
             file_name = message.document.file_name
@@ -133,11 +156,13 @@ async def sequence_file_handler(client, message):
         }
         
         # Add to sequence collection
-        sequence_collection.update_one(
+        await sequence_collection().update_one(
             {"user_id": user_id},
             {"$push": {"files": file_info}}
         )
         
+        metrics.SEQUENCE_FILES.labels("added").inc()
+        
         # Set flag to indicate this is for sequence
         message.stop_propagation()
         
@@ -148,7 +173,7 @@ async def cancel_sequence(client, message):
     user_id = message.from_user.id
     
     # Remove sequence data
-    result = sequence_collection.delete_one({"user_id": user_id})
+    result = await sequence_collection().delete_one({"user_id": user_id})
     
     if result.deleted_count > 0:
         await message.reply_text("❌ Sequence mode cancelled. All queued files have been cleared.")
@@ -160,7 +185,7 @@ async def show_sequence(client, message):
     user_id = message.from_user.id
     
     # Get sequence data
-    sequence_data = sequence_collection.find_one({"user_id": user_id})
+    sequence_data = await sequence_collection().find_one({"user_id": user_id})
     
     if not sequence_data or not sequence_data.get("files"):
         await message.reply_text("📋 **No files in sequence**")
@@ -191,7 +216,7 @@ async def show_sequence(client, message):
 @Client.on_message(filters.private & filters.command("leaderboard"))
 async def show_leaderboard(client, message):
     # Get top 10 users by files sequenced
-    top_users = users_collection.find().sort("files_sequenced", -1).limit(10)
+    top_users = await users_collection().find().sort("files_sequenced", -1).limit(10).to_list(length=10)
     
     leaderboard_text = "🏆 **Top Users - Files Sequenced**\n\n"
     
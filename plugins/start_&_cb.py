@@ -80,7 +80,7 @@ Choose an option to modify:"""
     'queueinfo', 'startsequence', 'endsequence', 'showsequence', 'cancelsequence', 'leaderboard', 
     'settitle', 'setauthor', 'setartist', 'setaudio', 'setsubtitle', 'setvideo', 'set_caption', 
     'del_caption', 'see_caption', 'view_caption', 'view_thumb', 'viewthumb', 'del_thumb', 'delthumb', 
-    'tutorial', 'restart', 'stats', 'status', 'broadcast']))
+    'tutorial', 'restart', 'stats', 'status', 'broadcast', 'jobtrace', 'queuestats', 'scheduler', 'bandwidth']))
 async def handle_destination_input(client, message):
     """Handle destination ID input from user"""
     user_id = message.from_user.id
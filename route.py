@@ -1,4 +1,5 @@
 from aiohttp import web
+from helper import metrics, health
 
 routes = web.RouteTableDef()
 
@@ -7,8 +8,25 @@ async def root_route_handler(request):
     return web.json_response("Codeflix bots")
 
 
-async def web_server():
+@routes.get("/metrics")
+async def metrics_route_handler(request):
+    return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+
+@routes.get("/healthz", allow_head=True)
+async def liveness_route_handler(request):
+    ok, body = health.liveness()
+    return web.json_response(body, status=200 if ok else 503)
+
+
+@routes.get("/readyz", allow_head=True)
+async def readiness_route_handler(request):
+    ok, body = await health.readiness(request.app.get("bot"))
+    return web.json_response(body, status=200 if ok else 503)
+
+
+async def web_server(bot=None):
     web_app = web.Application(client_max_size=30000000)
+    web_app["bot"] = bot
     web_app.add_routes(routes)
     return web_app
-
@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import os
+import signal
+import sys
+from pyrogram import Client
+from config import Config
+from helper import fs, startup
+from helper.bandwidth import bandwidth
+from helper.database import codeflixbots
+from helper.downloader import session_pool
+from helper.eta import eta_model
+from helper.helper_bots import HelperClient, helper_pool
+from helper.jobstate import job_registry
+from helper.journal import FAILED_TEXT, job_journal
+from helper.memory import memory_budget
+from helper.transfer_pool import CounterReport, read_message, send_message
+from helper.uploader import ParallelUploadMixin
+from plugins.file_rename import journaled_messages, new_job, process_file_rename
+import pyrogram.utils
+
+pyrogram.utils.MIN_CHANNEL_ID = -1009147483647
+
+logger = logging.getLogger("worker")
+
+# Transfer worker started by the bot's TransferPool (TRANSFER_WORKERS > 0):
+# runs the rename jobs the bot hands over, with a Telegram session of its own.
+
+
+class TransferClient(ParallelUploadMixin, Client):
+
+    def __init__(self, index):
+        super().__init__(
+            name=f"codeflixbots_worker{index}",
+            api_id=Config.API_ID,
+            api_hash=Config.API_HASH,
+            bot_token=Config.BOT_TOKEN,
+            no_updates=True,
+            sleep_threshold=15,
+        )
+
+
+class TransferWorker:
+
+    def __init__(self, index, client):
+        self.index = index
+        self.client = client
+        self.tasks = {}
+        self.jobs = {}
+        self.writer = None
+
+    async def run(self):
+        host, port = os.environ["TRANSFER_POOL_ADDRESS"].rsplit(":", 1)
+        reader, self.writer = await asyncio.open_connection(host, int(port))
+        await send_message(self.writer, {"type": "hello", "token": os.environ["TRANSFER_POOL_TOKEN"], "index": self.index})
+        reporter = asyncio.create_task(self.report_counters())
+        try:
+            while (message := await read_message(reader)) is not None:
+                if message["type"] == "run":
+                    document = message["job"]
+                    self.tasks[document["_id"]] = asyncio.create_task(self.run_job(document))
+                elif message["type"] == "cancel":
+                    job = self.jobs.get(message["job_id"])
+                    if job is not None:
+                        job.lease_lost = message.get("lease_lost", False)
+                    task = self.tasks.get(message["job_id"])
+                    if task:
+                        task.cancel()
+                elif message["type"] == "limits":
+                    self.apply_limits(message)
+        finally:
+            reporter.cancel()
+            for task in self.tasks.values():
+                task.cancel()
+            await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+    def apply_limits(self, message):
+        """Take this worker's share of the bot's RAM budget and bandwidth caps"""
+        memory_budget.limit = message["memory_budget"]
+        bandwidth.fair_share = message["fair_share"]
+        for user in bandwidth.users.values():
+            user.limit = None
+        for user_id, rate in message["user_overrides"]:
+            bandwidth.set_user_limit(rate, user_id)
+        bandwidth.set_user_limit(message["user_bandwidth"])
+        bandwidth.set_global_limit(message["global_bandwidth"])
+
+    async def run_job(self, document):
+        result = {"type": "finished", "job_id": document["_id"], "status": "failed", "trace": None}
+        started = False
+
+        def settle(status, trace):
+            job_registry.finish(job, status)
+            result.update(status=status, trace=trace)
+
+        try:
+            message, file_message = await journaled_messages(self.client, document)
+            job = new_job(message, file_message, document["file_name"], job_id=document["_id"])
+            job.recovered_file = document.get("recovered_file")
+            self.jobs[job.job_id] = job
+            job_registry.start(job)
+            started = True
+            await process_file_rename(self.client, message, file_message, job.file_name, job, settle=settle)
+        except asyncio.CancelledError:
+            if not started:
+                # Stopped by a restart before it began; its journal entry runs it again
+                result["status"] = "checkpointed"
+        except Exception as e:
+            logger.error(f"Job {document['_id']} failed in worker {self.index}: {e}")
+            if not started:
+                # process_file_rename never got to finish the journal entry or tell the user
+                await job_journal.drop(self.client, document, FAILED_TEXT)
+        finally:
+            self.tasks.pop(document["_id"], None)
+            self.jobs.pop(document["_id"], None)
+            try:
+                await send_message(self.writer, result)
+            except OSError:
+                pass
+
+    async def report_counters(self):
+        """Send counter increments to the bot process, which exports them"""
+        report = CounterReport()
+        while True:
+            await asyncio.sleep(Config.TRANSFER_WORKER_REPORT_INTERVAL)
+            counters = report.take()
+            if counters:
+                await send_message(self.writer, {"type": "counters", "counters": counters})
+
+
+async def main(index):
+    client = TransferClient(index)
+    await client.start()
+    eta_model.warm_up(await codeflixbots.get_recent_job_traces(Config.JOB_TRACE_AGGREGATE_WINDOW))
+    if helper_pool.configured:
+        # Session files of their own, next to the bot's and the other workers'
+        await helper_pool.start(lambda i, token: HelperClient(i, token, name=f"codeflixbots_worker{index}_helper{i}"))
+    worker = TransferWorker(index, client)
+    serving = asyncio.create_task(worker.run())
+    # The pool terminates workers on shutdown; cancelled jobs are checkpointed on the way out
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, serving.cancel)
+    try:
+        await serving
+    except (asyncio.CancelledError, OSError):
+        pass
+    finally:
+        await fs.drain()
+        await session_pool(client).stop()
+        await helper_pool.stop()
+        await client.stop()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    startup.install_event_loop()
+    asyncio.run(main(int(sys.argv[1])))